@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Audio-reactive effect.
+A PCM source thread keeps only the newest window of samples, from a WAV file
+in the shows directory (played in real time) or from producers writing raw
+16-bit little-endian PCM to a Unix socket. At every effect tick the window
+is split into log-spaced frequency bands with one FFT, and each LED shows
+the energy of the band at its height or angle. Old audio is overwritten,
+never queued, so latency stays bounded by one block plus one tick.
+"""
+
+import os
+import socket
+import threading
+import time
+import wave
+import numpy as np
+from typing import Any, Dict, Optional, Tuple
+from effects import Effect
+from playback import show_path
+
+# Constants for default configuration
+# AUDIO_SOCKET overrides where PCM producers connect
+AUDIO_SOCKET = os.getenv("AUDIO_SOCKET", "/tmp/piserver-audio.sock")
+BLOCK_FRAMES = 256  # Frames read per block (5.8 ms at 44.1 kHz)
+LOW_FREQUENCY = 40.0
+HIGH_FREQUENCY = 16000.0
+DYNAMIC_RANGE = 48.0  # dB shown between dark and full brightness
+PEAK_FALL = 3.0  # dB per second the automatic gain reference falls
+
+class PcmSource(threading.Thread):
+    """
+    Keeps the newest window of mono samples (-1 to 1) from a 16-bit PCM
+    stream, and the monotonic time its newest block arrived.
+    """
+
+    def __init__(self, rate: int, channels: int, window: int):
+        super().__init__(name="audio-source", daemon=True)
+        self.rate = rate
+        self.channels = channels
+        self.samples = np.zeros(window, dtype=np.float32)
+        self.received_at: Optional[float] = None
+        self.blocks = 0
+        self.running = True
+        self._lock = threading.Lock()
+
+    def push(self, data: bytes) -> None:
+        """Append whole frames of interleaved 16-bit PCM, dropping the oldest samples."""
+        block = np.frombuffer(data, dtype="<i2").reshape(-1, self.channels)
+        block = block.mean(axis=1, dtype=np.float32) / 32768.0
+        window = len(self.samples)
+        if len(block) > window:
+            block = block[-window:]
+        with self._lock:
+            n = len(block)
+            self.samples[:window - n] = self.samples[n:]
+            self.samples[window - n:] = block
+            self.received_at = time.monotonic()
+            self.blocks += 1
+
+    def latest(self) -> Tuple[np.ndarray, Optional[float]]:
+        """Copy of the sample window and when its newest block arrived."""
+        with self._lock:
+            return self.samples.copy(), self.received_at
+
+    def close(self) -> None:
+        self.running = False
+
+class WavSource(PcmSource):
+    """Plays a 16-bit WAV file in real time, optionally looping."""
+
+    def __init__(self, path: str, window: int, loop: bool = True):
+        self.wav = wave.open(path, "rb")
+        if self.wav.getsampwidth() != 2:
+            self.wav.close()
+            raise ValueError(f"WAV must be 16-bit PCM: {path}")
+        super().__init__(self.wav.getframerate(), self.wav.getnchannels(), window)
+        self.loop = loop
+
+    def run(self) -> None:
+        block_time = BLOCK_FRAMES / self.rate
+        deadline = time.monotonic()
+        try:
+            while self.running:
+                data = self.wav.readframes(BLOCK_FRAMES)
+                if not data:
+                    if not self.loop:
+                        break
+                    self.wav.rewind()
+                    continue
+                # Deliver each block when it would have been heard
+                deadline += block_time
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    deadline = time.monotonic()
+                self.push(data)
+        finally:
+            self.wav.close()
+
+class SocketSource(PcmSource):
+    """Receives raw PCM from one producer at a time on a Unix socket."""
+
+    def __init__(self, path: str, rate: int, channels: int, window: int):
+        super().__init__(rate, channels, window)
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self._inode = os.stat(path).st_ino
+        self.listener.listen(1)
+        self.listener.settimeout(0.5)
+
+    def run(self) -> None:
+        frame_size = 2 * self.channels
+        try:
+            while self.running:
+                try:
+                    conn, _ = self.listener.accept()
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break  # Closed
+                conn.settimeout(0.5)
+                pending = b""
+                with conn:
+                    while self.running:
+                        try:
+                            data = conn.recv(BLOCK_FRAMES * frame_size)
+                        except socket.timeout:
+                            continue
+                        if not data:
+                            break
+                        # Keep a partial frame for the next read
+                        data = pending + data
+                        whole = len(data) - len(data) % frame_size
+                        pending = data[whole:]
+                        if whole:
+                            self.push(data[:whole])
+        finally:
+            self.listener.close()
+
+    def close(self) -> None:
+        super().close()
+        self.listener.close()
+        # A replacement source may already have bound the same path
+        try:
+            if os.stat(self.path).st_ino == self._inode:
+                os.unlink(self.path)
+        except OSError:
+            pass
+
+class AudioReactive(Effect):
+    """
+    Band energies of live or recorded audio. source is "socket" or the name
+    of a WAV file in the shows directory; axis spreads the bands over the
+    LEDs' height (bass at the bottom) or angle; speed is how fast a band
+    falls back, in full brightness per second.
+    """
+
+    PARAMS = {**Effect.PARAMS, "speed": 3.0, "source": "socket", "loop": True, "rate": 44100,
+              "channels": 1, "bands": 8, "window": 1024, "axis": "height"}
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        bands = int(settings["bands"])
+        window = int(settings["window"])
+        if not 1 <= bands <= 64:
+            raise ValueError(f"bands must be between 1 and 64: {bands}")
+        if window < 64 or window & (window - 1):
+            raise ValueError(f"window must be a power of two of at least 64: {window}")
+        if settings["axis"] not in ("height", "angle"):
+            raise ValueError(f"axis must be height or angle: {settings['axis']}")
+        if settings["source"] == "socket":
+            rate, channels = int(settings["rate"]), int(settings["channels"])
+            if rate <= 0 or not 1 <= channels <= 8:
+                raise ValueError(f"Unsupported PCM format: {rate} Hz, {channels} channels")
+            self.source = SocketSource(AUDIO_SOCKET, rate, channels, window)
+        else:
+            try:
+                self.source = WavSource(show_path(settings["source"], ".wav"), window,
+                                        bool(settings["loop"]))
+            except (OSError, wave.Error) as e:
+                raise ValueError(f"Cannot open audio {settings['source']}: {e}") from None
+        rate = self.source.rate
+
+        # Everything that does not depend on the audio is computed once
+        self.taper = np.hanning(window).astype(np.float32)
+        frequencies = np.fft.rfftfreq(window, 1.0 / rate)
+        edges = np.geomspace(LOW_FREQUENCY, min(HIGH_FREQUENCY, rate / 2), bands + 1)
+        # Each band sums bins lo to hi; a band narrower than a bin takes the next bin
+        self.lo = np.searchsorted(frequencies, edges[:-1])
+        self.hi = np.maximum(np.searchsorted(frequencies, edges[1:]), self.lo + 1)
+        axis = self.geometry.height if settings["axis"] == "height" else self.geometry.angle
+        self.led_band = np.minimum((axis * bands).astype(np.intp), bands - 1)
+        self.bands = np.zeros(bands)
+        self.peak = -DYNAMIC_RANGE
+        self._last_t: Optional[float] = None
+        self.input_time: Optional[float] = None
+        self.source.start()
+
+    def analyze(self, samples: np.ndarray) -> np.ndarray:
+        """Band levels in dB for one window of samples."""
+        power = np.abs(np.fft.rfft(samples * self.taper)) ** 2
+        total = np.concatenate(([0.0], np.cumsum(power)))
+        energy = (total[self.hi] - total[self.lo]) / (self.hi - self.lo)
+        return 10.0 * np.log10(energy + 1e-12)
+
+    def level(self, t: float) -> np.ndarray:
+        samples, self.input_time = self.source.latest()
+        dt = 0.0 if self._last_t is None else max(t - self._last_t, 0.0)
+        self._last_t = t
+        db = self.analyze(samples)
+        # Automatic gain: the loudest recent band is full brightness
+        self.peak = max(float(db.max()), self.peak - PEAK_FALL * dt, -DYNAMIC_RANGE)
+        target = np.clip((db - self.peak) / DYNAMIC_RANGE + 1.0, 0.0, 1.0)
+        # Rise at once, fall at speed
+        self.bands = np.maximum(target, self.bands - self.speed * dt)
+        return self.bands[self.led_band]
+
+    def close(self) -> None:
+        self.source.close()
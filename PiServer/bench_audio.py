@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Audio-reactive effect benchmark.
+Starts server.py with a virtual tree, streams a synthetic tone sweep to the
+audio socket in real time and reports the latency from audio block to shown
+frame, plus the per-tick analysis cost measured in this process.
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+BENCH_PORT = 65447
+RATE = 44100
+BLOCK_FRAMES = 256
+DURATION = 10.0
+TIMEOUT = 30.0
+
+def query(port: int, command: dict) -> dict:
+    """Send one command and return the JSON reply."""
+    with socket.create_connection(("127.0.0.1", port), timeout=TIMEOUT) as s:
+        s.sendall(json.dumps(command).encode())
+        line = s.makefile("rb").readline()
+        return json.loads(line) if line.startswith(b"{") else {"reply": line.decode().strip()}
+
+def tone(start: int, frames: int) -> bytes:
+    """A tone sweeping 50 Hz - 10 kHz every 2 s, with a beat every half second."""
+    t = (start + np.arange(frames)) / RATE
+    frequency = 50.0 * 200.0 ** ((t % 2.0) / 2.0)
+    phase = 2 * np.pi * np.cumsum(frequency) / RATE
+    beat = np.where(t % 0.5 < 0.05, 1.0, 0.3)
+    return (np.sin(phase) * beat * 20000).astype("<i2").tobytes()
+
+def stream(path: str) -> int:
+    """Stream DURATION seconds of PCM to the socket, paced in real time."""
+    producer = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    producer.connect(path)
+    sent = 0
+    started = time.monotonic()
+    while sent < DURATION * RATE:
+        producer.sendall(tone(sent, BLOCK_FRAMES))
+        sent += BLOCK_FRAMES
+        delay = started + sent / RATE - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    producer.close()
+    return sent // BLOCK_FRAMES
+
+def analysis_cost(runs: int = 2000) -> float:
+    """Mean time of one effect tick (FFT, bands, mapping, encoding) in microseconds."""
+    from audio import AudioReactive
+    from geometry import load_geometry
+    effect = AudioReactive("audio", load_geometry(25), {})
+    effect.source.push(tone(0, 1024))
+    try:
+        started = time.perf_counter()
+        for i in range(runs):
+            effect.render(i * 0.02)
+        return (time.perf_counter() - started) / runs * 1e6
+    finally:
+        effect.close()
+
+def main():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "audio.sock")
+    os.environ["AUDIO_SOCKET"] = path
+    env = dict(os.environ, PORT=str(BENCH_PORT), DEVICE_TYPE="virtual", STATE_FILE="")
+    server = subprocess.Popen([sys.executable, SERVER], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + TIMEOUT
+        while True:
+            try:
+                reply = query(BENCH_PORT, {"type": "start_effect", "effect": "audio"})
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Server did not start")
+                time.sleep(0.05)
+        if reply.get("reply") != "OK":
+            raise RuntimeError(f"Could not start the audio effect: {reply}")
+        blocks = stream(path)
+        device = query(BENCH_PORT, {"type": "stats"})["devices"]["tree"]
+    finally:
+        server.terminate()
+        server.wait()
+
+    latency = device["effect_latency_ms"] or {}
+    print(f"Streamed {blocks} blocks of {BLOCK_FRAMES} frames ({BLOCK_FRAMES / RATE * 1000:.1f} ms each)")
+    print(f"Frames shown: {device['frames_shown']} in {DURATION:.0f} s")
+    print("Audio block to frame: " +
+          ", ".join(f"{key} {value:.1f} ms" for key, value in latency.items()))
+    print(f"Analysis per tick: {analysis_cost():.0f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Per-command overhead benchmark.
+Runs each kind of command, valid and invalid, through the server's command
+path (parse, dispatch, validation, framebuffer write, reply encoding) on a
+virtual device, the way the scheduler does, and reports microseconds per
+command and how many were rejected. With --baseline REV it also runs the
+same cases against the server from git revision REV, for before and after
+numbers from one machine.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from server import CommandStream, NetworkServer
+
+RUNS = 20000
+REPEATS = 5  # Best of, to filter out scheduling noise
+PIXELS = 25
+
+CASES = {
+    "set_pixel": {"type": "set_pixel", "pixel": 7, "color": [1.0, 0.5, 0.25]},
+    "set_pixels": {"type": "set_pixels", "indices": [1, 4, 9, 16], "colors": [[1.0, 0.5, 0.25]] * 4},
+    "set_all": {"type": "set_all", "color": [0.2, 0.4, 0.6]},
+    "set_frame": {"type": "set_frame", "pixels": [[0.1, 0.2, 0.3]] * PIXELS},
+    "set_frame data": {"type": "set_frame", "data": "1a2b3c" * PIXELS},
+    "off": {"type": "off"},
+    "ping": {"type": "ping", "t0": 0.0},
+    "bad pixel index": {"type": "set_pixel", "pixel": PIXELS, "color": [1.0, 0.0, 0.0]},
+    "bad color arity": {"type": "set_pixel", "pixel": 0, "color": [1.0, 0.0]},
+    "bad color value": {"type": "set_all", "color": [2.0, 0.0, 0.0]},
+    "missing field": {"type": "set_pixel", "color": [1.0, 0.0, 0.0]},
+    "unknown type": {"type": "explode"},
+}
+
+def run(server: NetworkServer, command: dict) -> Tuple[float, int]:
+    """
+    Microseconds per command, from wire bytes to reply bytes, errors
+    included, and how many of the commands were rejected.
+    """
+    data = json.dumps(command).encode() + b"\n"
+    stream = CommandStream()
+    rejected = 0
+    started = time.perf_counter()
+    for _ in range(RUNS):
+        stream.feed(data)
+        parsed = stream.next_command()
+        try:
+            reply = server.execute(parsed)
+        except Exception as e:
+            # The scheduler's error reply
+            reply = f"ERROR: {e}\n".encode()
+        if reply.startswith(b"ERROR"):
+            rejected += 1
+    return (time.perf_counter() - started) / RUNS * 1e6, rejected
+
+def measure() -> Dict[str, Tuple[float, int]]:
+    """Best-of time and rejections for each case."""
+    # Rejected commands are logged, which is part of their cost; discard the output
+    for handler in logging.getLogger().handlers:
+        handler.setStream(open(os.devnull, "w"))
+    server = NetworkServer("127.0.0.1", 0, {"tree": ("virtual", PIXELS)})
+    results = {}
+    for name, command in CASES.items():
+        runs = [run(server, command) for _ in range(REPEATS)]
+        results[name] = (min(us for us, _ in runs), runs[0][1])
+    return results
+
+def measure_revision(revision: str) -> Dict[str, Tuple[float, int]]:
+    """Run this benchmark against the server from a git revision, in a subprocess."""
+    root = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                          check=True, capture_output=True, text=True).stdout.strip()
+    directory = tempfile.mkdtemp()
+    try:
+        archive = subprocess.run(["git", "archive", revision, "PiServer"], cwd=root,
+                                 check=True, capture_output=True).stdout
+        subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+        # The same cases and timing loop, importing that revision's server
+        script = os.path.join(directory, "PiServer", os.path.basename(__file__))
+        shutil.copy(os.path.abspath(__file__), script)
+        output = subprocess.run([sys.executable, script, "--json"], check=True,
+                                capture_output=True, text=True).stdout
+        return {name: tuple(result) for name, result in json.loads(output).items()}
+    finally:
+        shutil.rmtree(directory)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-command overhead benchmark")
+    parser.add_argument("--baseline", metavar="REV", help="Also run against the server from this git revision")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+    baseline = measure_revision(args.baseline) if args.baseline else None
+    results = measure()
+    if args.json:
+        print(json.dumps(results))
+        return
+    if baseline is None:
+        print(f"{'command':<18} {'us/command':>10} {'rejected':>8}")
+        for name, (us, rejected) in results.items():
+            print(f"{name:<18} {us:10.2f} {rejected:8d}")
+        return
+    print(f"{'command':<18} {'before us':>10} {'after us':>10} {'change':>7} {'rejected':>17}")
+    for name, (us, rejected) in results.items():
+        before, rejected_before = baseline.get(name, (float("nan"), 0))
+        print(f"{name:<18} {before:10.2f} {us:10.2f} {us / before - 1:+7.0%} "
+              f"{rejected_before:8d} {rejected:8d}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Steady-state allocation report.
+Drives the command-to-device path under sustained load: parsed commands
+arrive about every millisecond while an effect renders at 50 fps. It runs
+on a virtual tree, and on the RGB tree driver over gpiozero's mock pins
+(set GPIOZERO_PIN_FACTORY to use a real tree). After a warm-up, tracemalloc
+measures how much memory stays allocated per frame shown, and the
+collector's passes are counted, once per GC_TUNING mode. Both snapshots
+are taken with the render thread parked at the same point, just before it
+shows a frame, so objects that only live during a transfer are not counted
+as kept. The pass/fail gate is tests/test_memory.py, which runs the same
+measurement for a few seconds; this prints longer runs as a table, with the
+lines that kept memory in any run over the per-frame budget.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("GPIOZERO_PIN_FACTORY", "mock")
+from gc_tuning import GC_TUNING_MODES
+from server import CommandStream, NetworkServer
+
+PIXELS = 25
+WARMUP = 5.0  # Seconds before the first snapshot; bounded queues and caches fill up
+MEASURE = 30.0  # Seconds between snapshots
+COMMAND_INTERVAL = 0.001
+BUDGET = 1.0  # Net bytes kept per frame; leaking one object per frame costs at least 16
+TIMEOUT = 10.0
+
+# Not counted: the checker itself, and gpiozero's mock pins, which record
+# every pin change as a namedtuple (its constructor is compiled from <string>)
+IGNORED = ("*/tracemalloc.py", __file__, "*/gpiozero/pins/mock.py", "<string>")
+
+def wire_commands() -> list:
+    """A rotating mix of frame writes, as bytes on the wire."""
+    commands = []
+    for i in range(64):
+        level = i / 63
+        commands.append({"type": "set_pixel", "pixel": i % PIXELS, "color": [level, 1.0 - level, 0.5]})
+        commands.append({"type": "set_all", "color": [0.0, level, 1.0 - level]})
+        commands.append({"type": "set_frame", "data": bytes((i * 7 + n) % 256 for n in range(PIXELS * 3)).hex()})
+        commands.append({"type": "set_pixels", "indices": [i % PIXELS, (i + 5) % PIXELS],
+                         "colors": [[level, level, level], [1.0, 0.0, level]]})
+    return [json.dumps(command).encode() + b"\n" for command in commands]
+
+def drive(server: NetworkServer, stream: CommandStream, commands: list, seconds: float) -> int:
+    """Feed commands through parsing and dispatch for seconds; return the count."""
+    count = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        stream.feed(commands[count % len(commands)])
+        server.execute(stream.next_command())
+        count += 1
+        time.sleep(COMMAND_INTERVAL)
+    return count
+
+class ShowGate:
+    """
+    Wraps a controller's show() so the render thread can be parked just
+    before it sends a frame, the same point in its loop for every snapshot.
+    """
+
+    def __init__(self, controller):
+        self.show = controller.show
+        self.lock = threading.Lock()
+        self.parked = threading.Event()
+        controller.show = self._show
+
+    def _show(self, frame) -> None:
+        self.parked.set()
+        with self.lock:
+            self.parked.clear()
+            self.show(frame)
+
+    def __enter__(self) -> "ShowGate":
+        self.lock.acquire()
+        # Effect frames are due every 20 ms, so the render thread arrives soon
+        if not self.parked.wait(TIMEOUT):
+            self.lock.release()
+            raise RuntimeError("render thread did not reach show()")
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.lock.release()
+
+def settle() -> None:
+    """Collect garbage, and drop the mock pins' history so it does not grow without bound."""
+    if "gpiozero" in sys.modules:
+        from gpiozero import Device
+        for pin in getattr(Device.pin_factory, "pins", {}).values():
+            if hasattr(pin, "clear_states"):
+                pin.clear_states()
+    gc.collect()
+
+def collections() -> list:
+    return [generation["collections"] for generation in gc.get_stats()]
+
+def measure(device_type: str, gc_tuning: str, warmup: float = WARMUP, seconds: float = MEASURE) -> dict:
+    """Net bytes kept and collections run while a device is under load."""
+    server = NetworkServer("127.0.0.1", 0, {"tree": (device_type, PIXELS)}, gc_tuning=gc_tuning)
+    server.devices.start()
+    renderer = server.devices.renderers["tree"]
+    started = time.monotonic()
+    while renderer.first_frame_at is None and time.monotonic() - started < TIMEOUT:
+        time.sleep(0.01)
+    if renderer.first_frame_at is None:
+        server.devices.stop()
+        raise RuntimeError(f"{device_type} showed no frame")
+    stream = CommandStream()
+    commands = wire_commands()
+    gate = ShowGate(renderer.controller)
+    try:
+        server.execute({"type": "start_effect", "effect": "spiral", "params": {"speed": 1.0}})
+        tracemalloc.start()
+        drive(server, stream, commands, warmup)
+        with gate:
+            settle()
+            before = tracemalloc.take_snapshot()
+            frames = renderer.frames_shown
+            passes = collections()
+        count = drive(server, stream, commands, seconds)
+        with gate:
+            frames = renderer.frames_shown - frames
+            passes = [after - start for after, start in zip(collections(), passes)]
+            settle()
+            after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        server.devices.stop()
+        gc.enable()
+        gc.unfreeze()
+    filters = [tracemalloc.Filter(False, pattern) for pattern in IGNORED]
+    growth = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    return {
+        "commands": count,
+        "frames": frames,
+        "net": sum(stat.size_diff for stat in growth),
+        "collections": passes,
+        "growth": [stat for stat in growth if stat.size_diff > 0][:5],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the memory steady-state rendering keeps")
+    parser.add_argument("--devices", default="virtual,rgb_tree", help="Comma-separated device types")
+    parser.add_argument("--gc-tuning", default=",".join(GC_TUNING_MODES), help="Comma-separated GC_TUNING modes")
+    args = parser.parse_args()
+    # Keep the server's log lines out of the table
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{'device':<10} {'gc':<7} {'commands':>8} {'frames':>7} {'net B':>8} {'B/frame':>8} "
+          f"{'gen0':>6} {'gen1':>5} {'gen2':>5}")
+    for device_type in args.devices.split(","):
+        for gc_tuning in args.gc_tuning.split(","):
+            try:
+                result = measure(device_type, gc_tuning)
+            except Exception as e:
+                print(f"{device_type:<10} {gc_tuning:<7} could not run: {e}")
+                continue
+            per_frame = result["net"] / max(result["frames"], 1)
+            gen0, gen1, gen2 = result["collections"]
+            print(f"{device_type:<10} {gc_tuning:<7} {result['commands']:8d} {result['frames']:7d} "
+                  f"{result['net']:8d} {per_frame:8.2f} {gen0:6d} {gen1:5d} {gen2:5d}")
+            if per_frame > BUDGET:
+                for stat in result["growth"]:
+                    print(f"    {stat}")
+
+if __name__ == "__main__":
+    main()
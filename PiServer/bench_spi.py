@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+SPI transport benchmark.
+Sends tree frames through each transport over a mock GPIO layer and reports
+frames per second:
+
+- gpiozero: gpiozero's software SPI on its mock pin factory
+- bitbang: the register transport on an in-memory register block
+- spidev: the spidev transport on a device that takes the buffer and
+  returns; the wire time at the SPI clock is added
+
+Mock pins and RAM cost less than real GPIO, so these are upper bounds for
+the Python side; run with --hardware on the Pi for the real ceiling of the
+transports the wiring allows. Before timing, the bit-bang waveform is
+decoded on the data and clock lines and checked against the frame.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from spi_transport import (DEFAULT_SPI_SPEED, BitBangTransport, GpioRegisters, SpidevTransport,
+                           choose_transport, open_transport)
+
+PIXELS = 25
+FRAME_BYTES = 4 + PIXELS * 4 + 5  # Start of frame, 4 bytes per LED, end of frame
+DURATION = 2.0  # Seconds per transport
+MOSI_PIN = 12
+CLOCK_PIN = 25
+
+class MemoryRegisters(GpioRegisters):
+    """The GPIO register block in RAM: the same word writes as /dev/gpiomem, with no hardware."""
+
+    def __init__(self):
+        self.words = memoryview(bytearray(self.SIZE)).cast("I")
+
+    def close(self) -> None:
+        self.words.release()
+
+class DecodingLines:
+    """
+    Register words that act like the GPIO set and clear registers and record
+    the data line at every rising clock edge.
+    """
+
+    def __init__(self, mosi_pin: int, clock_pin: int):
+        self.mosi = 1 << mosi_pin
+        self.clock = 1 << clock_pin
+        self.level = 0
+        self.bits = []
+        self.words = [0] * (GpioRegisters.SIZE // 4)
+
+    def __getitem__(self, index: int) -> int:
+        return self.words[index]
+
+    def __setitem__(self, index: int, word: int) -> None:
+        if index == GpioRegisters.SET:
+            if word & self.clock and not self.level & self.clock:
+                self.bits.append(1 if self.level & self.mosi else 0)
+            self.level |= word
+        elif index == GpioRegisters.CLEAR:
+            self.level &= ~word
+        else:
+            self.words[index] = word
+
+    def data(self) -> bytes:
+        return bytes(int("".join(map(str, self.bits[i:i + 8])), 2) for i in range(0, len(self.bits), 8))
+
+class DecodingRegisters(MemoryRegisters):
+    def __init__(self):
+        self.words = DecodingLines(MOSI_PIN, CLOCK_PIN)
+
+    def close(self) -> None:
+        pass
+
+class NullSpiDev:
+    """Takes a buffer the way spidev's writebytes2 does, and sends it nowhere."""
+
+    def writebytes2(self, data: Any) -> None:
+        memoryview(data).tobytes()  # The kernel copies the buffer once
+
+    def close(self) -> None:
+        pass
+
+def frames() -> list:
+    """A few random tree frames in the transmit buffer layout."""
+    result = []
+    for _ in range(16):
+        frame = bytearray(FRAME_BYTES)
+        for i in range(PIXELS):
+            frame[4 + 4 * i] = 0b11101111
+            frame[5 + 4 * i:8 + 4 * i] = bytes(random.randrange(256) for _ in range(3))
+        result.append(frame)
+    return result
+
+def rate(transfer: Callable[[Any], None], payloads: list, after: Callable[[], None] = None) -> float:
+    """Frames per second sent through transfer for DURATION seconds."""
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < DURATION:
+        transfer(payloads[count % len(payloads)])
+        count += 1
+        if after and count % 64 == 0:
+            after()
+    return count / (time.perf_counter() - started)
+
+def verify_bitbang(payloads: list) -> None:
+    """Decode the bit-bang waveform and compare it with the frames sent."""
+    transport = BitBangTransport(DecodingRegisters(), MOSI_PIN, CLOCK_PIN)
+    for frame in payloads[:4]:
+        transport.transfer(frame)
+    expected = b"".join(bytes(frame) for frame in payloads[:4])
+    if transport.registers.words.data() != expected:
+        raise SystemExit("FAILED: the bit-bang waveform does not decode to the frames sent")
+
+def mock(payloads: list, speed: int) -> None:
+    from gpiozero import Device, SPIDevice
+    from gpiozero.pins.mock import MockFactory
+    # The software SPI bus takes its pins from the default factory
+    factory = Device.pin_factory = MockFactory()
+    device = SPIDevice(mosi_pin=MOSI_PIN, clock_pin=CLOCK_PIN)
+    spi = device._spi
+
+    def forget_states() -> None:
+        # Mock pins record every change; keep the history from growing
+        for pin in factory.pins.values():
+            pin.clear_states()
+
+    report("gpiozero", rate(spi.transfer, payloads, forget_states))
+    device.close()
+
+    transport = BitBangTransport(MemoryRegisters(), MOSI_PIN, CLOCK_PIN)
+    report("bitbang", rate(transport.transfer, payloads))
+    transport.close()
+
+    transport = SpidevTransport(NullSpiDev())
+    cpu = 1.0 / rate(transport.transfer, payloads)
+    wire = FRAME_BYTES * 8 / speed
+    report(f"spidev at {speed / 1e6:g} MHz", 1.0 / (cpu + wire))
+
+def hardware(payloads: list, speed: int, pins: tuple) -> None:
+    from gpiozero import SPIDevice
+    device = SPIDevice(mosi_pin=pins[0], clock_pin=pins[1])
+    report("gpiozero", rate(device._spi.transfer, payloads))
+    device.close()
+    for kind in ("bitbang", "spidev"):
+        try:
+            choose_transport(kind, *pins)
+            transport = open_transport(kind, *pins, speed)
+        except Exception as e:
+            print(f"{kind:<22} unavailable: {e}")
+            continue
+        report(kind, rate(transport.transfer, payloads))
+        transport.close()
+
+def report(name: str, fps: float) -> None:
+    print(f"{name:<22} {fps:10.0f} {1000 / fps:10.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Frames per second of each SPI transport")
+    parser.add_argument("--hardware", action="store_true",
+                        help="Drive the real pins and SPI bus instead of the mock GPIO layer")
+    parser.add_argument("--pins", default=f"{MOSI_PIN},{CLOCK_PIN}", help="Data and clock GPIO with --hardware")
+    parser.add_argument("--speed", type=int, default=DEFAULT_SPI_SPEED, help="spidev clock in Hz")
+    args = parser.parse_args()
+
+    payloads = frames()
+    verify_bitbang(payloads)
+    print(f"{FRAME_BYTES}-byte frames, {'hardware' if args.hardware else 'mock GPIO'}\n")
+    print(f"{'transport':<22} {'frames/s':>10} {'ms/frame':>10}")
+    if args.hardware:
+        hardware(payloads, args.speed, tuple(int(pin) for pin in args.pins.split(",")))
+    else:
+        mock(payloads, args.speed)
+
+if __name__ == "__main__":
+    main()
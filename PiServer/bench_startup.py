@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the device control server.
+Starts server.py once per backend and reports time-to-listen,
+time-to-first-frame and baseline RSS.
+"""
+
+import os
+import socket
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+BACKENDS = ["virtual", "rgb_tree", "fast_tree"]
+BENCH_PORT = 65446
+RUNS = 5
+TIMEOUT = 30.0
+
+def rss_kb(pid: int) -> int:
+    """Resident set size of a process in kB (Linux)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+def query(port: int, command: dict) -> dict:
+    """Send one command and return the JSON reply."""
+    with socket.create_connection(("127.0.0.1", port), timeout=TIMEOUT) as s:
+        s.sendall(json.dumps(command).encode())
+        return json.loads(s.makefile("rb").readline())
+
+def run_once(backend: str, mock: bool) -> dict:
+    """Start the server once and measure it; returns times in ms and RSS in kB."""
+    env = dict(os.environ, PORT=str(BENCH_PORT), DEVICE_TYPE=backend, STATE_FILE="")
+    if mock:
+        env["GPIOZERO_PIN_FACTORY"] = "mock"
+    spawned = time.monotonic()
+    server = subprocess.Popen([sys.executable, SERVER], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # Time to listen: first successful connect
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"{backend} server exited with code {server.returncode}")
+            if time.monotonic() - spawned > TIMEOUT:
+                raise RuntimeError(f"{backend} server did not start")
+            try:
+                socket.create_connection(("127.0.0.1", BENCH_PORT), timeout=TIMEOUT).close()
+                break
+            except OSError:
+                time.sleep(0.005)
+        listening = time.monotonic()
+
+        # Time to first frame, from the server's own clock mapped onto ours
+        while True:
+            stats = query(BENCH_PORT, {"type": "stats"})
+            answered = time.monotonic()
+            first_frame = stats["devices"]["tree"]["first_frame"]
+            if first_frame is not None:
+                break
+            if answered - spawned > TIMEOUT:
+                raise RuntimeError(f"{backend} server showed no frame")
+            time.sleep(0.005)
+        server_started = answered - stats["uptime"]
+        return {
+            "listen": (listening - spawned) * 1000,
+            "first_frame": (server_started + first_frame - spawned) * 1000,
+            "rss": rss_kb(server.pid),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    """Main entry point."""
+    # Off the Pi, gpiozero needs its mock pin factory; pass --hardware on a Pi
+    mock = "--hardware" not in sys.argv
+    backends = [arg for arg in sys.argv[1:] if not arg.startswith("--")] or BACKENDS
+
+    print(f"{'backend':<10} {'listen ms':>10} {'first frame ms':>15} {'RSS kB':>8}")
+    for backend in backends:
+        try:
+            runs = [run_once(backend, mock) for _ in range(RUNS)]
+        except RuntimeError as e:
+            print(f"{backend:<10} error: {e}")
+            continue
+        listen = statistics.median(r["listen"] for r in runs)
+        first_frame = statistics.median(r["first_frame"] for r in runs)
+        rss = statistics.median(r["rss"] for r in runs)
+        print(f"{backend:<10} {listen:>10.1f} {first_frame:>15.1f} {rss:>8.0f}")
+
+if __name__ == "__main__":
+    main()
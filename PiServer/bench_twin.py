@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Headless twin throughput benchmark.
+Evaluates each inline effect offline and renders the frames with the
+headless twin in its view configurations, reporting frames per second for
+each stage, so a show's check time can be estimated from its length.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from effects import EFFECTS
+from geometry import load_geometry
+from twin_render import TwinRenderer, compare, effect_frames, timeline_strip
+
+SECONDS = 60.0  # Show length per case
+FPS = 50.0
+REPEATS = 3  # Best of, to filter out scheduling noise
+PIXELS = 25
+
+VIEW_CASES = (("front",), ("front", "side"), ("front", "side", "top"))
+
+def best(function) -> float:
+    """Shortest of REPEATS runs, in seconds."""
+    times = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+def main():
+    geometry = load_geometry(PIXELS)
+    count = int(SECONDS * FPS)
+    print(f"{count} frames ({SECONDS:.0f} s at {FPS:.0f} fps) of {PIXELS} pixels per case\n")
+    print(f"{'stage':<28} {'frames/s':>10}")
+    frames = None
+    for name in EFFECTS:
+        elapsed = best(lambda: effect_frames(name, geometry, {}, SECONDS, FPS))
+        print(f"{'effect ' + name:<28} {count / elapsed:10.0f}")
+        frames = effect_frames(name, geometry, {}, SECONDS, FPS)
+    for views in VIEW_CASES:
+        renderer = TwinRenderer(geometry, views)
+        elapsed = best(lambda: renderer.render(frames))
+        print(f"{'render ' + '+'.join(views):<28} {count / elapsed:10.0f}")
+    elapsed = best(lambda: timeline_strip(frames))
+    print(f"{'timeline strip':<28} {count / elapsed:10.0f}")
+    elapsed = best(lambda: compare(frames, frames))
+    print(f"{'compare':<28} {count / elapsed:10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Cluster coordinator for driving several PiServer nodes as one display.
+Speaks the same client protocol as server.py, maps a global pixel space onto
+per-node ranges and forwards batched frames to every node over persistent
+connections, stamped with a shared presentation time so all nodes flip together.
+"""
+
+import socket
+import logging
+import os
+import json
+import threading
+import time
+from typing import List, Optional
+from server import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    DEFAULT_PIXELS,
+    NetworkServer,
+    PixelDeviceController,
+)
+
+# Constants for default configuration
+CLUSTER_DEVICE_ID = "cluster"
+DEFAULT_PRESENTATION_DELAY = 0.05  # Seconds between fan-out and presentation
+DEFAULT_NODE_TIMEOUT = 2.0
+RECONNECT_INTERVAL = 1.0
+CLOCK_SYNC_INTERVAL = 30.0  # Seconds between node clock-offset estimates
+CLOCK_SYNC_SAMPLES = 5
+
+logger = logging.getLogger(__name__)
+
+class NodeLink(threading.Thread):
+    """
+    Persistent connection to one node server owning a slice of the global
+    pixel space. Each link sends from its own thread and only keeps the
+    latest frame, so a slow node never delays the others.
+    """
+
+    def __init__(self, host: str, port: int, start: int, pixels: int,
+                 device: Optional[str] = None, timeout: float = DEFAULT_NODE_TIMEOUT):
+        super().__init__(name=f"node-{host}:{port}", daemon=True)
+        self.host = host
+        self.port = port
+        self.start_pixel = start
+        self.pixels = pixels
+        self.device = device
+        self.timeout = timeout
+        self.running = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.errors = 0
+        self.clock_offset = 0.0  # Node clock minus local clock, in seconds
+        self._synced_at = None
+        self._pending = None
+        self._changed = threading.Condition()
+        self._socket = None
+        self._reader = None
+
+    def submit(self, frame: bytes, at: Optional[float]) -> None:
+        """Queue this node's slice of a frame, replacing any unsent one."""
+        with self._changed:
+            if self._pending is not None:
+                self.frames_dropped += 1
+            self._pending = (frame, at)
+            self._changed.notify()
+
+    def run(self) -> None:
+        while True:
+            with self._changed:
+                while self._pending is None and self.running:
+                    self._changed.wait()
+                if self._pending is None:
+                    break
+                frame, at = self._pending
+                self._pending = None
+            if not self._send(frame, at) and self.running:
+                # Retry the latest frame (now late) once the node is back
+                with self._changed:
+                    if self._pending is None:
+                        self._pending = (frame, None)
+                    self._changed.wait(RECONNECT_INTERVAL)
+        self._close()
+
+    def _send(self, frame: bytes, at: Optional[float]) -> bool:
+        """Send one frame and wait for the node's acknowledgment."""
+        command = {"type": "set_frame", "data": frame.hex()}
+        if self.device is not None:
+            command["device"] = self.device
+        try:
+            if self._socket is None:
+                self._connect()
+            if time.monotonic() - self._synced_at > CLOCK_SYNC_INTERVAL:
+                self._sync_clock()
+            if at is not None:
+                # Present at the same instant on every node's own clock
+                command["at"] = at + self.clock_offset
+            self._socket.sendall(json.dumps(command).encode() + b"\n")
+            reply = self._reader.readline()
+            if not reply:
+                raise ConnectionError("connection closed by node")
+            if not reply.startswith(b"OK"):
+                logger.error(f"Node {self.host}:{self.port} rejected frame: {reply.decode().strip()}")
+            self.frames_sent += 1
+            return True
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            logger.error(f"Node {self.host}:{self.port} unavailable: {e}")
+            self._close()
+            return False
+
+    def _connect(self) -> None:
+        """Open the persistent connection to the node."""
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._socket.makefile("rb")
+        self._sync_clock()
+        logger.info(f"Connected to node {self.host}:{self.port} "
+                    f"(clock offset {self.clock_offset * 1000:.1f} ms)")
+
+    def _sync_clock(self) -> None:
+        """Estimate the node clock offset with ping, keeping the lowest-delay sample."""
+        best = None
+        for _ in range(CLOCK_SYNC_SAMPLES):
+            t0 = time.time()
+            self._socket.sendall(json.dumps({"type": "ping", "t0": t0}).encode() + b"\n")
+            reply = json.loads(self._reader.readline())
+            t3 = time.time()
+            delay = (t3 - t0) - (reply["t2"] - reply["t1"])
+            if best is None or delay < best[0]:
+                best = (delay, ((reply["t1"] - t0) + (reply["t2"] - t3)) / 2)
+        self.clock_offset = best[1]
+        self._synced_at = time.monotonic()
+
+    def _close(self) -> None:
+        if self._socket:
+            self._reader.close()
+            self._socket.close()
+            self._socket = None
+            self._reader = None
+
+    def start(self) -> None:
+        self.running = True
+        super().start()
+
+    def stop(self) -> None:
+        """Stop after sending any pending frame."""
+        with self._changed:
+            self.running = False
+            self._changed.notify()
+        if self.is_alive():
+            self.join()
+
+class ClusterController(PixelDeviceController):
+    """Pixel device spanning every node; frames are split into per-node ranges."""
+
+    def __init__(self, links: List[NodeLink], presentation_delay: float = DEFAULT_PRESENTATION_DELAY):
+        super().__init__(sum(link.pixels for link in links))
+        self.links = links
+        self.presentation_delay = presentation_delay
+
+    def initialize(self) -> None:
+        """Start the node links."""
+        for link in self.links:
+            link.start()
+        logger.info(f"Cluster initialized with {len(self.links)} nodes, "
+                    f"{self.framebuffer.pixels} pixels")
+
+    def show(self, frame: bytes) -> None:
+        """Fan the frame out to the nodes with a shared presentation time."""
+        at = time.time() + self.presentation_delay
+        for link in self.links:
+            start = link.start_pixel * 3
+            link.submit(frame[start:start + link.pixels * 3], at)
+
+    def cleanup(self) -> None:
+        """Blank every node and close the links."""
+        for link in self.links:
+            link.submit(bytes(link.pixels * 3), None)
+        for link in self.links:
+            link.stop()
+        logger.info("Cluster cleaned up")
+
+def parse_nodes(spec: str) -> List[NodeLink]:
+    """
+    Parse a node list such as "pi1.local:65436:25,pi2.local:65436:25:tree"
+    (host:port:pixels[:device]) into links covering consecutive pixel ranges.
+    """
+    links = []
+    start = 0
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        parts = entry.split(":")
+        if len(parts) not in (3, 4):
+            raise ValueError(f"Invalid node entry (expected host:port:pixels[:device]): {entry}")
+        host, port, pixels = parts[0], int(parts[1]), int(parts[2])
+        device = parts[3] if len(parts) == 4 else None
+        links.append(NodeLink(host, port, start, pixels, device))
+        start += pixels
+    if not links:
+        raise ValueError("No nodes configured")
+    return links
+
+def start_local_nodes(count: int, base_port: int, pixels: int = DEFAULT_PIXELS) -> str:
+    """
+    Start count in-process node servers with virtual devices on consecutive
+    ports, for testing on one machine. Returns the matching node list.
+    """
+    entries = []
+    for i in range(count):
+        port = base_port + i
+        node = NetworkServer("127.0.0.1", port, {"tree": ("virtual", pixels)})
+        threading.Thread(target=node.start, name=f"local-node-{port}", daemon=True).start()
+        if not node.ready.wait(DEFAULT_NODE_TIMEOUT):
+            raise RuntimeError(f"Local node on port {port} failed to start")
+        entries.append(f"127.0.0.1:{port}:{pixels}")
+    return ",".join(entries)
+
+def main():
+    """Main entry point."""
+    # Get configuration from environment variables or use defaults
+    host = os.getenv("HOST", DEFAULT_HOST)
+    port = int(os.getenv("PORT", DEFAULT_PORT))
+    delay = float(os.getenv("PRESENTATION_DELAY", DEFAULT_PRESENTATION_DELAY))
+    # LOCAL_NODES=3 runs three virtual nodes in-process instead of NODES
+    local_nodes = int(os.getenv("LOCAL_NODES", "0"))
+
+    try:
+        if local_nodes:
+            node_spec = start_local_nodes(local_nodes, port + 1)
+        else:
+            node_spec = os.environ["NODES"]
+        server = NetworkServer(host, port, {})
+        server.devices.add(CLUSTER_DEVICE_ID, ClusterController(parse_nodes(node_spec), delay))
+        server.start()
+    except KeyError:
+        logger.error("Set NODES=host:port:pixels,... or LOCAL_NODES=<count>")
+    except KeyboardInterrupt:
+        logger.info("Coordinator interrupted by user")
+    except Exception as e:
+        logger.error(f"Coordinator error: {e}")
+
+if __name__ == "__main__":
+    main()
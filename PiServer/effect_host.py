@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Out-of-process host for CPU-heavy generative effects.
+Noise fields, particle systems and cellular automata run in a worker
+process, so they neither eat the render thread's frame budget nor hold the
+GIL the network threads need. The worker renders frames ahead of their
+presentation time into a shared-memory ring buffer. The render thread only
+copies the frame that is due, and counts and skips any frame the worker
+did not finish in time.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import struct
+import threading
+import time
+import numpy as np
+from abc import ABC, abstractmethod
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Sequence
+from geometry import Geometry
+
+# Constants for default configuration
+HOST_FRAME_INTERVAL = 0.02  # Seconds between hosted effect frames (50 fps)
+DEFAULT_RING_SLOTS = 8  # Frames the worker may render ahead
+WORKER_STOP_TIMEOUT = 1.0
+
+# Ring layout: start time (0 until the worker is ready) and the index of the
+# frame last taken by the reader, then one slot per frame: its index and RGB
+HEADER = struct.Struct("=dQ")
+SLOT_INDEX = struct.Struct("=Q")
+EMPTY_SLOT = 2 ** 64 - 1
+
+logger = logging.getLogger(__name__)
+
+class FrameRing:
+    """Shared-memory ring of frames indexed by presentation slot."""
+
+    def __init__(self, pixels: int, slots: int = DEFAULT_RING_SLOTS, name: Optional[str] = None):
+        """Create the ring, or attach to an existing one by name."""
+        self.pixels = pixels
+        self.slots = slots
+        self.frame_size = pixels * 3
+        self.slot_size = SLOT_INDEX.size + self.frame_size
+        size = HEADER.size + slots * self.slot_size
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name, create=self.owner, size=size)
+        self.name = self.shm.name
+        if self.owner:
+            HEADER.pack_into(self.shm.buf, 0, 0.0, 0)
+            for slot in range(slots):
+                SLOT_INDEX.pack_into(self.shm.buf, self._offset(slot), EMPTY_SLOT)
+
+    def _offset(self, slot: int) -> int:
+        return HEADER.size + slot * self.slot_size
+
+    @property
+    def start(self) -> float:
+        """Wall-clock time of frame 0, or 0 before the worker is ready."""
+        return HEADER.unpack_from(self.shm.buf, 0)[0]
+
+    @start.setter
+    def start(self, value: float) -> None:
+        struct.pack_into("=d", self.shm.buf, 0, value)
+
+    @property
+    def consumed(self) -> int:
+        return struct.unpack_from("=Q", self.shm.buf, 8)[0]
+
+    @consumed.setter
+    def consumed(self, index: int) -> None:
+        struct.pack_into("=Q", self.shm.buf, 8, index)
+
+    def write(self, index: int, frame: bytes) -> None:
+        """Store the frame for index, invalidating the slot while it is written."""
+        offset = self._offset(index % self.slots)
+        SLOT_INDEX.pack_into(self.shm.buf, offset, EMPTY_SLOT)
+        start = offset + SLOT_INDEX.size
+        self.shm.buf[start:start + self.frame_size] = frame
+        SLOT_INDEX.pack_into(self.shm.buf, offset, index)
+
+    def read(self, index: int) -> Optional[bytes]:
+        """The frame for index, or None if it is not (completely) there."""
+        offset = self._offset(index % self.slots)
+        if SLOT_INDEX.unpack_from(self.shm.buf, offset)[0] != index:
+            return None
+        start = offset + SLOT_INDEX.size
+        frame = bytes(self.shm.buf[start:start + self.frame_size])
+        if SLOT_INDEX.unpack_from(self.shm.buf, offset)[0] != index:
+            return None
+        return frame
+
+    def close(self) -> None:
+        """Detach, and remove the segment if this process created it."""
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class Generator(ABC):
+    """
+    Base class for hosted generators. PARAMS holds every accepted parameter
+    with its default. frame() is called once per slot, in order, with the
+    slot's time and the time since the previous frame, so generators may
+    keep state between frames.
+    """
+
+    PARAMS: Dict[str, Any] = {"color": [1.0, 1.0, 1.0]}
+
+    def __init__(self, geometry: Geometry, params: Dict[str, Any]):
+        unknown = set(params) - set(self.PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        self.geometry = geometry
+        settings = {**self.PARAMS, **params}
+        self.color = np.asarray(settings["color"], dtype=np.float64)
+        if self.color.shape != (3,):
+            raise ValueError(f"Color must have 3 components: {settings['color']}")
+        self.rng = np.random.default_rng()
+        self.configure(settings)
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        """Read generator-specific parameters."""
+
+    @abstractmethod
+    def frame(self, t: float, dt: float) -> np.ndarray:
+        """RGB (pixels x 3, 0-1) for wall-clock time t."""
+
+# Corners of a 4D lattice cell, for value noise over (x, y, z, time)
+CORNERS = np.array(list(itertools.product((0, 1), repeat=4)), dtype=np.int64)
+PRIMES = np.array([73856093, 19349663, 83492791, 2654435761], dtype=np.uint64)
+
+def _value_noise(points: np.ndarray) -> np.ndarray:
+    """Smooth pseudo-random values (0-1) at 4D points, one row per point."""
+    cell = np.floor(points)
+    fraction = points - cell
+    fade = fraction * fraction * (3 - 2 * fraction)
+    corners = cell.astype(np.int64)[:, None, :] + CORNERS
+    h = (corners.astype(np.uint64) * PRIMES).sum(axis=2)
+    h ^= h >> np.uint64(13)
+    h *= np.uint64(1274126177)
+    h ^= h >> np.uint64(16)
+    values = (h & np.uint64(0xFFFF)).astype(np.float64) / 0xFFFF
+    weights = np.where(CORNERS, fade[:, None, :], 1 - fade[:, None, :]).prod(axis=2)
+    return (values * weights).sum(axis=1)
+
+class NoiseField(Generator):
+    """Fractal value noise drifting through the tree, blended between two colors."""
+
+    PARAMS = {"color": [1.0, 0.5, 0.0], "background": [0.0, 0.05, 0.3],
+              "scale": 3.0, "speed": 0.3, "octaves": 4}
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        self.background = np.asarray(settings["background"], dtype=np.float64)
+        if self.background.shape != (3,):
+            raise ValueError(f"Background must have 3 components: {settings['background']}")
+        self.scale = float(settings["scale"])
+        self.speed = float(settings["speed"])
+        self.octaves = int(settings["octaves"])
+        if not 1 <= self.octaves <= 8:
+            raise ValueError(f"Octaves must be between 1 and 8: {self.octaves}")
+
+    def frame(self, t: float, dt: float) -> np.ndarray:
+        points = np.empty((self.geometry.pixels, 4))
+        points[:, :3] = self.geometry.positions * self.scale
+        # Keep the time coordinate small so float64 keeps its precision
+        points[:, 3] = (t * self.speed) % 4096
+        total = np.zeros(self.geometry.pixels)
+        amplitude = 1.0
+        for _ in range(self.octaves):
+            total += amplitude * _value_noise(points)
+            points *= 2
+            amplitude /= 2
+        level = total / (2 - 2 * amplitude)
+        return self.background + (self.color - self.background) * level[:, None]
+
+class Particles(Generator):
+    """Sparks shot up from the base of the tree, falling back under gravity."""
+
+    PARAMS = {"color": [1.0, 0.4, 0.0], "count": 200, "rate": 60.0,
+              "size": 0.08, "lifetime": 1.5}
+    GRAVITY = np.array([0.0, -0.8, 0.0])
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        self.count = int(settings["count"])
+        self.rate = float(settings["rate"])
+        self.size = float(settings["size"])
+        self.lifetime = float(settings["lifetime"])
+        if self.count <= 0 or self.size <= 0 or self.lifetime <= 0:
+            raise ValueError("count, size and lifetime must be positive")
+        self.position = np.zeros((self.count, 3))
+        self.velocity = np.zeros((self.count, 3))
+        self.age = np.full(self.count, np.inf)
+        self.base = self.geometry.positions.min(axis=0) * [0, 1, 0]
+        self._spawn_credit = 0.0
+
+    def _spawn(self, dt: float) -> None:
+        self._spawn_credit += self.rate * dt
+        spawn = int(self._spawn_credit)
+        self._spawn_credit -= spawn
+        free = np.flatnonzero(self.age >= self.lifetime)[:spawn]
+        angle = self.rng.uniform(0, 2 * np.pi, len(free))
+        outward = self.rng.uniform(0.05, 0.3, len(free))
+        self.position[free] = self.base
+        self.velocity[free, 0] = outward * np.cos(angle)
+        self.velocity[free, 1] = self.rng.uniform(0.8, 1.4, len(free))
+        self.velocity[free, 2] = outward * np.sin(angle)
+        self.age[free] = 0.0
+
+    def frame(self, t: float, dt: float) -> np.ndarray:
+        self._spawn(dt)
+        self.velocity += self.GRAVITY * dt
+        self.position += self.velocity * dt
+        self.age += dt
+        alive = self.age < self.lifetime
+        # Every LED against every live particle in one distance matrix
+        offsets = self.geometry.positions[:, None, :] - self.position[alive]
+        glow = np.exp(-(offsets ** 2).sum(axis=2) / self.size ** 2)
+        level = glow @ (1 - self.age[alive] / self.lifetime)
+        return (1 - np.exp(-level))[:, None] * self.color
+
+class Automaton(Generator):
+    """
+    An excitable medium (Greenberg-Hastings) on the LEDs' nearest-neighbour
+    graph: waves of light spread between neighbours and need to recover
+    before they can fire again.
+    """
+
+    PARAMS = {"color": [0.2, 1.0, 0.4], "neighbours": 4, "refractory": 4,
+              "spark": 0.02, "speed": 10.0}
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        self.refractory = int(settings["refractory"])
+        self.spark = float(settings["spark"])
+        self.speed = float(settings["speed"])
+        neighbours = int(settings["neighbours"])
+        if self.refractory < 1 or neighbours < 1 or self.speed <= 0:
+            raise ValueError("neighbours, refractory and speed must be positive")
+        positions = self.geometry.positions
+        distances = np.linalg.norm(positions[:, None, :] - positions[None, :, :], axis=2)
+        self.neighbours = np.argsort(distances, axis=1)[:, 1:neighbours + 1]
+        self.state = np.zeros(self.geometry.pixels, dtype=np.int64)
+        self._step_credit = 0.0
+
+    def _step(self) -> None:
+        excited = self.state == 1
+        triggered = excited[self.neighbours].any(axis=1) | (self.rng.random(len(self.state)) < self.spark)
+        resting = self.state == 0
+        self.state = np.where(resting, triggered.astype(np.int64),
+                              (self.state + 1) % (self.refractory + 2))
+
+    def frame(self, t: float, dt: float) -> np.ndarray:
+        self._step_credit += dt * self.speed
+        while self._step_credit >= 1:
+            self._step()
+            self._step_credit -= 1
+        fading = 1 - (self.state - 1) / (self.refractory + 1)
+        level = np.where(self.state > 0, fading, 0.0)
+        return level[:, None] * self.color
+
+GENERATORS = {
+    "noise": NoiseField,
+    "particles": Particles,
+    "automaton": Automaton,
+}
+
+def _run_worker(ring_name: str, pixels: int, slots: int, interval: float, name: str,
+                positions: Sequence[Sequence[float]], params: Dict[str, Any], stop) -> None:
+    """Worker process: render frames ahead of time into the ring until stopped."""
+    ring = FrameRing(pixels, slots, ring_name)
+    try:
+        generator = GENERATORS[name](Geometry(positions), params)
+        # Start half a ring ahead so the first frames are ready in time
+        start = time.time() + slots / 2 * interval
+        ring.start = start
+        index = 0
+        previous = None
+        while not stop.is_set():
+            now = time.time()
+            due = int((now - start) // interval)
+            if index <= due:
+                # Behind schedule: skip the late frames rather than render them
+                index = due + 1
+            if index - ring.consumed >= slots:
+                # Ring full: wait until the reader frees a slot
+                stop.wait(max(start + (index - slots + 1) * interval - now, interval / 4))
+                continue
+            t = start + index * interval
+            rgb = generator.frame(t, interval if previous is None else t - previous)
+            ring.write(index, (np.clip(rgb, 0.0, 1.0) * 255 + 0.5).astype(np.uint8).tobytes())
+            previous = t
+            index += 1
+    finally:
+        ring.close()
+
+class HostedEffect:
+    """
+    A generator running in its own worker process, used by the render
+    thread like an inline effect: render() returns the frame due now, or
+    None if there is nothing new to show. Spawning the worker and waiting
+    for it to stop happen on a helper thread, so starting or stopping an
+    effect never blocks the command scheduler that serves every client.
+    """
+
+    def __init__(self, name: str, geometry: Geometry, params: Dict[str, Any],
+                 interval: float = HOST_FRAME_INTERVAL, slots: int = DEFAULT_RING_SLOTS):
+        try:
+            generator_class = GENERATORS[name]
+        except KeyError:
+            raise ValueError(f"Unknown effect: {name}") from None
+        # Validate parameters here so errors reach the client
+        generator_class(geometry, params)
+        self.name = name
+        self.params = dict(params)
+        self.interval = interval
+        self.missed = 0
+        self.frames = 0
+        self._last = -1
+        self.ring = FrameRing(geometry.pixels, slots)
+        # Spawn rather than fork: the server process is multi-threaded
+        context = multiprocessing.get_context("spawn")
+        self._stop = context.Event()
+        self.process = context.Process(
+            target=_run_worker, name=f"effect-{name}", daemon=True,
+            args=(self.ring.name, geometry.pixels, slots, interval, name,
+                  geometry.positions.tolist(), self.params, self._stop))
+        self._started = threading.Event()
+        self._closed = threading.Event()
+        # Not a daemon, so the ring is released even when the server exits
+        threading.Thread(target=self._host_worker, name=f"effect-host-{name}").start()
+
+    def _host_worker(self) -> None:
+        """Start the worker; once closed, wait for it to stop and release the ring."""
+        try:
+            if not self._closed.is_set():
+                self.process.start()
+        except Exception as e:
+            logger.error(f"Could not start effect worker for {self.name}: {e}")
+        finally:
+            self._started.set()
+        self._closed.wait()
+        if self.process.pid is not None:
+            self.process.join(WORKER_STOP_TIMEOUT)
+            if self.process.is_alive():
+                logger.warning(f"Effect worker for {self.name} did not stop; terminating it")
+                self.process.terminate()
+                self.process.join()
+        self.ring.close()
+
+    def render(self, t: float) -> Optional[bytes]:
+        """The frame due at t, once per frame; None if already shown or missed."""
+        start = self.ring.start
+        if not start or t < start:
+            if self._started.is_set() and not self.process.is_alive():
+                raise RuntimeError(f"Effect worker for {self.name} exited")
+            return None
+        due = int((t - start) // self.interval)
+        if due == self._last:
+            return None
+        self._last = due
+        self.ring.consumed = due
+        frame = self.ring.read(due)
+        if frame is None:
+            # Missed its deadline: count it and keep showing the last frame
+            self.missed += 1
+            if not self.process.is_alive():
+                raise RuntimeError(f"Effect worker for {self.name} exited")
+            return None
+        self.frames += 1
+        return frame
+
+    def describe(self) -> Dict[str, Any]:
+        """Name and parameters, enough to recreate the effect."""
+        return {"effect": self.name, "params": self.params}
+
+    def close(self) -> None:
+        """Ask the worker to stop; the helper thread waits for it and releases the ring."""
+        self._stop.set()
+        self._closed.set()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Spatial effects evaluated over a device's geometry.
+Each effect computes every LED's brightness as one vectorized expression of
+the geometry's precomputed indexes and the wall-clock time, so the same
+effect stays in step across devices and cluster nodes.
+"""
+
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Any, Dict
+from geometry import Geometry
+
+# Effects too heavy for the render thread, run by effect_host in a worker process
+HOSTED_EFFECTS = ("noise", "particles", "automaton")
+
+class Effect(ABC):
+    """
+    Base class for spatial effects. PARAMS holds every accepted parameter
+    with its default; subclasses implement level().
+    """
+
+    PARAMS: Dict[str, Any] = {"color": [1.0, 1.0, 1.0], "speed": 0.5}
+    missed = 0  # Frames not ready in time; inline effects never miss
+
+    def __init__(self, name: str, geometry: Geometry, params: Dict[str, Any]):
+        unknown = set(params) - set(self.PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+        self.name = name
+        self.geometry = geometry
+        self.params = dict(params)
+        settings = {**self.PARAMS, **params}
+        self.color = np.asarray(settings["color"], dtype=np.float64)
+        if self.color.shape != (3,):
+            raise ValueError(f"Color must have 3 components: {settings['color']}")
+        self.speed = float(settings["speed"])
+        self.configure(settings)
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        """Read effect-specific parameters."""
+
+    @abstractmethod
+    def level(self, t: float) -> np.ndarray:
+        """Brightness of every LED (0-1) at wall-clock time t."""
+
+    def render(self, t: float) -> bytes:
+        """Render the frame at time t as 8-bit RGB."""
+        rgb = np.clip(self.level(t), 0.0, 1.0)[:, None] * self.color
+        return (np.clip(rgb, 0.0, 1.0) * 255 + 0.5).astype(np.uint8).tobytes()
+
+    def describe(self) -> Dict[str, Any]:
+        """Name and parameters, enough to recreate the effect."""
+        return {"effect": self.name, "params": self.params}
+
+    def close(self) -> None:
+        """Release resources when the effect is replaced or stopped."""
+
+class Sweep(Effect):
+    """A band of light moving up the tree; speed is sweeps per second."""
+
+    PARAMS = {**Effect.PARAMS, "width": 0.25}
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        self.width = _positive(settings["width"], "width")
+
+    def level(self, t: float) -> np.ndarray:
+        # The band starts below the lowest LED and ends above the highest
+        position = (t * self.speed) % 1.0 * (1 + 2 * self.width) - self.width
+        return 1.0 - np.abs(self.geometry.height - position) / self.width
+
+class Spiral(Effect):
+    """Bright stripes winding around the trunk; speed is rotations per second."""
+
+    PARAMS = {**Effect.PARAMS, "turns": 1.5, "sharpness": 4.0}
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        self.turns = float(settings["turns"])
+        self.sharpness = float(settings["sharpness"])
+
+    def level(self, t: float) -> np.ndarray:
+        geometry = self.geometry
+        phase = geometry.angle + self.turns * geometry.height - (t * self.speed) % 1.0
+        return (0.5 + 0.5 * np.cos(2 * np.pi * phase)) ** self.sharpness
+
+class Pulse(Effect):
+    """Rings expanding from a point (default: the layout's center); speed is pulses per second."""
+
+    PARAMS = {**Effect.PARAMS, "center": None, "width": 0.15}
+
+    def configure(self, settings: Dict[str, Any]) -> None:
+        center = settings["center"]
+        self.width = _positive(settings["width"], "width")
+        self.distance = self.geometry.distance_to(self.geometry.center if center is None else center)
+        self.reach = float(self.distance.max()) + self.width
+
+    def level(self, t: float) -> np.ndarray:
+        radius = (t * self.speed) % 1.0 * self.reach
+        return 1.0 - np.abs(self.distance - radius) / self.width
+
+def _positive(value: Any, name: str) -> float:
+    value = float(value)
+    if value <= 0:
+        raise ValueError(f"{name} must be positive: {value}")
+    return value
+
+EFFECTS = {
+    "sweep": Sweep,
+    "spiral": Spiral,
+    "pulse": Pulse,
+}
+
+def check_effect(name: str, geometry: Geometry, params: Dict[str, Any]) -> None:
+    """Validate an effect name and parameters without starting the effect."""
+    if type(params) is not dict:
+        raise ValueError("params must be an object")
+    if name in HOSTED_EFFECTS:
+        from effect_host import GENERATORS
+        GENERATORS[name](geometry, params)
+    elif name in ("audio", "playback"):
+        # These open a socket or a file when created; only their parameter names are checked
+        if name == "audio":
+            from audio import AudioReactive as effect_class
+        else:
+            from playback import Playback as effect_class
+        unknown = set(params) - set(effect_class.PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+    else:
+        create_effect(name, geometry, params).close()
+
+def create_effect(name: str, geometry: Geometry, params: Dict[str, Any]) -> Effect:
+    """Create an effect by name."""
+    if name in HOSTED_EFFECTS:
+        from effect_host import HostedEffect
+        return HostedEffect(name, geometry, params)
+    if name == "audio":
+        from audio import AudioReactive
+        return AudioReactive(name, geometry, params)
+    if name == "playback":
+        from playback import Playback
+        return Playback(name, geometry, params)
+    try:
+        effect_class = EFFECTS[name]
+    except KeyError:
+        raise ValueError(f"Unknown effect: {name}") from None
+    return effect_class(name, geometry, params)
@@ -1,5 +1,6 @@
 from gpiozero import SPIDevice, SourceMixin
-from numpy import array
+from numpy import array, asarray, count_nonzero, frombuffer, uint8
+from spi_transport import choose_transport, open_transport
 
 class FastRGBChristmasTree(SourceMixin, SPIDevice):
     '''
@@ -23,17 +24,29 @@ class FastRGBChristmasTree(SourceMixin, SPIDevice):
             self.commit() after calling self.__setitem__())
         brightness (int): The default brightness of the LEDs, if the brightness
             is not specified. Brightness has to be between 0 to 30 (inclusive).
+        colors (numpy.ndarray): A writable nled x 3 [R, G, B] view of the
+            transmit buffer, in LED index order.
     '''
 
-    def __init__(self, brightness=0, autocommit=False):
+    def __init__(self, brightness=0, autocommit=False, transport="gpiozero",
+                 mosi_pin=12, clock_pin=25):
         '''
         Constructor
 
         Args:
             brightness (int): Sets the brightness attribute.
             autocommit (bool): Sets the autocommit attribute.
+            transport (str): How frames reach the LEDs: "gpiozero",
+                "bitbang", "spidev" or "auto" (see spi_transport.py).
+            mosi_pin (int): GPIO of the LEDs' data line.
+            clock_pin (int): GPIO of the LEDs' clock line.
         '''
-        super(FastRGBChristmasTree, self).__init__(mosi_pin=12, clock_pin=25)
+        super(FastRGBChristmasTree, self).__init__(mosi_pin=mosi_pin, clock_pin=clock_pin)
+        # A faster transport takes the pins over from gpiozero's software SPI
+        self.transport = choose_transport(transport, mosi_pin, clock_pin)
+        if self.transport != "gpiozero":
+            self._spi.close()
+            self._spi = open_transport(self.transport, mosi_pin, clock_pin)
         # Number of LEDs
         self.nled = 25
         # LED configuration array
@@ -43,12 +56,15 @@ class FastRGBChristmasTree(SourceMixin, SPIDevice):
         # Start of array __offset
         self.__offset = 4
 
-        # frame padding
-        frame_s = [0] * (self.__offset)
-        frame_end = [0] * 5
-
-        # transmit buffer
-        self.__buf = frame_s + [0] * self.nled * 4 +frame_end
+        # transmit buffer: start frame, 4 bytes per LED, end frame padding.
+        # Single LEDs are written to the bytearray directly, several at once
+        # through NumPy views sharing its memory
+        self.__buf = bytearray(self.__offset + self.nled * 4 + 5)
+        leds = frombuffer(self.__buf, dtype=uint8)[self.__offset:self.__offset + self.nled * 4]
+        # nled x 4 view of the LED frames, each [brightness, B, G, R]
+        self.__leds = leds.reshape(self.nled, 4)
+        # nled x 3 view in [R, G, B] order, for whole-frame writes
+        self.colors = self.__leds[:, :0:-1]
 
         self.brightness = brightness
         self.reset()
@@ -93,23 +109,9 @@ class FastRGBChristmasTree(SourceMixin, SPIDevice):
                 self.__setitem__(3, val)
                 return
 
-            # Handle changing multiple LEDs
-            autocommit_disengaged = False
+            # Handle changing multiple LEDs in one vectorized write
+            self.__set_many(self.__led_config[ind].flatten(), val)
             if self.autocommit:
-                autocommit_disengaged = True
-                self.autocommit = False
-            r = self.__led_config[ind].flatten()
-            if type(val[0]) is not list:
-                for i in r:
-                    self.__setitem__(i, val)
-            elif len(val) == len(r):
-                for i in range(0, len(val)):
-                    self.__setitem__(r[i], val[i])
-            else:
-                raise IndexError("Mismatch between the LED indices and the \
-dimension of the colour list. ")
-            if autocommit_disengaged:
-                self.autocommit = True
                 self.commit()
             return
 
@@ -138,6 +140,33 @@ and 4.")
         if self.autocommit:
             self.commit()
 
+    def __set_many(self, r, val):
+        '''
+        Set the LEDs r to one setting, or to one setting per LED, validating
+        every value in a single pass.
+        '''
+        val = asarray(val)
+        if val.ndim not in (1, 2) or not 3 <= val.shape[-1] <= 4:
+            raise IndexError("The length of the val array must be between 3 \
+and 4.")
+        if val.ndim == 2 and len(val) != len(r):
+            raise IndexError("Mismatch between the LED indices and the \
+dimension of the colour list. ")
+        # uint8 arrays are in range by construction; for signed integers any
+        # bit above the low byte means out of range, checked in one operation
+        if val.dtype.kind == "i":
+            out_of_range = count_nonzero(val & -256)
+        else:
+            out_of_range = val.dtype != uint8 and (val.max() > 255 or val.min() < 0)
+        if out_of_range:
+            raise ValueError("The val must be between 0-255!")
+
+        if val.shape[-1] == 4:
+            self.__leds[r, 0] = self.__brightness_convert(val[..., 0])
+
+        # Swap RGB to BGR in a single write
+        self.__leds[r, 1:] = val[..., :-4:-1]
+
     def __getitem__(self, ind):
         '''
         Retrive the brightness and colour settings the LEDs
@@ -154,12 +183,14 @@ and 4.")
 
         Returns:
             If only one LED is specified, the LED setting in the format of
-            [Brightness, R, G, B] will be returned, where Brightness is an
-            integer between 0-30 inclusive and R, G, B is an integer between
-            0-255.
+            [Brightness, R, G, B] will be returned as an array, where
+            Brightness is an integer between 0-30 inclusive and R, G, B is an
+            integer between 0-255.
 
-            If multiple indices are supplied, then a list of with lists of LED
-            setting will be returned.
+            If multiple indices are supplied, then an array with one row of
+            LED settings per LED will be returned.
+
+            Use the colors attribute for a view of the buffer itself.
         '''
         if isinstance(ind, tuple) or isinstance(ind, slice):
             # Shortcut for the writing the star as a layer
@@ -167,32 +198,26 @@ and 4.")
                 return self.__getitem__(3)
 
             # Handle request for multiple LEDs
-            val = []
-            r = self.__led_config[ind].flatten()
-            for i in r:
-                val.append(self.__getitem__(i))
-            return val
-        else:
-            s = self.__offset + ind * 4
-            val = [None] * 4
-            # Swap BGR back to RGB
-            val[0] = self.__brightness_revert(self.__buf[s])
-            val[1] = self.__buf[s+3]
-            val[2] = self.__buf[s+2]
-            val[3] = self.__buf[s+1]
-            return val
+            ind = self.__led_config[ind].flatten()
+
+        val = self.__leds[ind].copy()
+        val[..., 0] = self.__brightness_revert(val[..., 0])
+        # Swap BGR back to RGB
+        val[..., 1:] = self.__leds[ind, :0:-1]
+        return val
 
     def __del__(self):
         ''' Destructor '''
         super(FastRGBChristmasTree, self).close()
 
     def __brightness_convert(self, val):
-        ''' Convert brightness value to buffer format  '''
-        if val > 30 or val < 0:
+        ''' Convert brightness value(s) to buffer format  '''
+        val = asarray(val)
+        if val.max() > 30 or val.min() < 0:
             raise ValueError("The brightness must be between 0 and 30")
-        val = val + 1
+        val = val.astype(uint8) + 1
         # 0b1110000 == 224
-        return 0b11100000 | int(val)
+        return 0b11100000 | val
 
     def __brightness_revert(self, val):
         ''' Convert buffer brightness t to human readable format '''
@@ -200,6 +225,7 @@ and 4.")
 
     def commit(self):
         ''' Send the current LED configuration down the SPI bus '''
+        # Every transport takes the buffer itself
         self._spi.transfer(self.__buf)
 
     def off(self):
@@ -211,8 +237,7 @@ and 4.")
     def reset(self):
         ''' Reset the LEDs by sending down zeros '''
         brightness = self.brightness
-        for i in range(0, len(self.__buf)):
-            self.__buf[i] = 0
+        self.__buf[:] = bytes(len(self.__buf))
         self.commit()
         self.brightness = brightness
 
@@ -229,18 +254,12 @@ and 4.")
     @property
     def brightness(self):
         ''' Return the mean brightness of the LEDs '''
-        val = 0
-        for i in range(0, self.nled):
-            s = self.__offset + i * 4
-            val += self.__buf[s]
-        return self.__brightness_revert(int(val / self.nled))
+        return self.__brightness_revert(int(self.__leds[:, 0].mean()))
 
     @brightness.setter
     def brightness(self, val):
         ''' Set the brightness of the LEDs '''
-        for i in range(0, self.nled):
-            s = self.__offset + i * 4
-            self.__buf[s] = self.__brightness_convert(val)
+        self.__leds[:, 0] = self.__brightness_convert(val)
 
 if __name__ == '__main__':
     tree = FastRGBChristmasTree()
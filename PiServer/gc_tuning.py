@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Garbage collector tuning for shows.
+In steady state the render path keeps no new objects, but commands still
+create short-lived containers, and the collector's automatic passes can
+land in the middle of a frame. On a Pi Zero, a full pass over everything
+the server loaded at startup is long enough to show as stutter. GC_TUNING
+selects a policy:
+
+- off: CPython's defaults
+- freeze: once running, everything alive is moved to the permanent
+  generation, which collections skip
+- show: freeze, and automatic collection is off while any device plays an
+  effect, fade or timeline. Render threads run the due young-generation
+  collections right after a frame is sent, and full collections wait until
+  the show ends.
+"""
+
+import gc
+import threading
+from typing import Any, Dict, Set
+
+DEFAULT_GC_TUNING = "off"
+GC_TUNING_MODES = ("off", "freeze", "show")
+
+class CollectorTuning:
+    """The GC_TUNING policy, shared by the server and its render threads."""
+
+    def __init__(self, mode: str = DEFAULT_GC_TUNING):
+        if mode not in GC_TUNING_MODES:
+            raise ValueError(f"GC tuning must be one of {', '.join(GC_TUNING_MODES)}: {mode}")
+        self.mode = mode
+        self.playing: Set[str] = set()  # Devices currently playing a show
+        self.frame_collections = 0  # Young collections run after a frame
+        self._lock = threading.Lock()
+
+    def freeze(self) -> None:
+        """Move every object alive now out of the collector's way; safe to repeat."""
+        if self.mode != "off":
+            gc.collect()
+            gc.freeze()
+
+    def set_playing(self, device_id: str, playing: bool) -> None:
+        """Note whether a device plays a show; automatic collection is off while any does."""
+        if self.mode != "show" or (device_id in self.playing) == playing:
+            return
+        with self._lock:
+            if playing:
+                self.playing.add(device_id)
+            else:
+                self.playing.discard(device_id)
+            if self.playing:
+                gc.disable()
+            else:
+                gc.enable()
+
+    def after_frame(self) -> None:
+        """Run the young collections that automatic collection would have run, between frames."""
+        if not self.playing:
+            return
+        young, middle, _ = gc.get_count()
+        young_threshold, middle_threshold, _ = gc.get_threshold()
+        if middle >= middle_threshold:
+            gc.collect(1)
+        elif young >= young_threshold:
+            gc.collect(0)
+        else:
+            return
+        self.frame_collections += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Collector counters for the stats command."""
+        return {
+            "tuning": self.mode,
+            "enabled": gc.isenabled(),
+            "frozen": gc.get_freeze_count(),
+            "collections": [generation["collections"] for generation in gc.get_stats()],
+            "frame_collections": self.frame_collections,
+        }
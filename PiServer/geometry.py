@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Physical LED layout of a device.
+Per-LED 3D positions are loaded from a JSON layout file shared with the
+Unity twin, and spatial indexes (height, angle around the trunk, distance
+from the axis or from a point) are precomputed as NumPy arrays, so spatial
+effects evaluate one vectorized expression per frame.
+"""
+
+import json
+import os
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+
+# Constants for default configuration
+DEFAULT_LAYOUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tree_layout.json")
+
+class Geometry:
+    """
+    LED positions (x, y, z) by pixel index, y up, with precomputed indexes:
+    height (0 at the lowest LED, 1 at the highest), angle (fraction of a turn
+    around the vertical axis, 0-1) and radius (distance from the axis).
+    """
+
+    def __init__(self, positions: Sequence[Sequence[float]], name: str = ""):
+        self.name = name
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.pixels = len(self.positions)
+        x, y, z = self.positions.T
+        span = y.max() - y.min() if self.pixels else 0.0
+        self.height = (y - y.min()) / span if span else np.zeros(self.pixels)
+        self.angle = np.mod(np.arctan2(z, x) / (2 * np.pi), 1.0)
+        self.radius = np.hypot(x, z)
+        self.center = self.positions.mean(axis=0) if self.pixels else np.zeros(3)
+        self._distances: Dict[Tuple[float, float, float], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.pixels
+
+    def distance_to(self, point: Sequence[float]) -> np.ndarray:
+        """Distance of every LED from a point; cached per point."""
+        key = tuple(float(v) for v in point)
+        if len(key) != 3:
+            raise ValueError(f"Point must have 3 coordinates: {point}")
+        distances = self._distances.get(key)
+        if distances is None:
+            distances = np.linalg.norm(self.positions - np.asarray(key), axis=1)
+            distances.flags.writeable = False
+            self._distances[key] = distances
+        return distances
+
+    @classmethod
+    def load(cls, path: str) -> "Geometry":
+        """Load a layout file: {"name": ..., "leds": [[x, y, z], ...]}."""
+        with open(path) as f:
+            layout = json.load(f)
+        return cls(layout["leds"], layout.get("name", ""))
+
+    @classmethod
+    def line(cls, pixels: int) -> "Geometry":
+        """A vertical strip, pixel 0 at the bottom, for devices without a layout."""
+        return cls([[0.0, i / max(pixels - 1, 1), 0.0] for i in range(pixels)], "line")
+
+def load_geometry(pixels: int, path: Optional[str] = DEFAULT_LAYOUT) -> Geometry:
+    """The layout from path if it matches the pixel count, else a vertical strip."""
+    if path and os.path.exists(path):
+        geometry = Geometry.load(path)
+        if len(geometry) == pixels:
+            return geometry
+    return Geometry.line(pixels)
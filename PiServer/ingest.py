@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Convert an image, animated GIF, image sequence or video into a show.
+Every frame is sampled once at the LED positions of a layout and stored as
+a frame file that the server memory-maps and plays with the playback effect:
+
+    python ingest.py fireworks.gif shows/fireworks.frames
+    {"type": "start_effect", "effect": "playback", "params": {"file": "fireworks"}}
+
+Images and GIFs need Pillow; videos need OpenCV (opencv-python-headless).
+"""
+
+import argparse
+import glob
+import os
+import sys
+import numpy as np
+from typing import Iterator, Optional, Tuple
+from geometry import DEFAULT_LAYOUT, Geometry
+from playback import FrameFileWriter
+
+# Constants for default configuration
+DEFAULT_FPS = 25.0
+DEFAULT_RADIUS = 0.02  # Sampling box half-size, as a fraction of the image height
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm", ".m4v")
+PROJECTIONS = ("front", "wrap")
+
+def led_coordinates(geometry: Geometry, projection: str) -> np.ndarray:
+    """
+    Each LED's position in the image as (u, v), both 0-1 with v down.
+    front: looking at the tree from the front, the layout's bounding box
+    fitted to the image. wrap: the image wrapped once around the trunk,
+    horizontal position by angle, vertical by height.
+    """
+    if projection == "wrap":
+        u = geometry.angle
+    else:
+        x = geometry.positions[:, 0]
+        span = x.max() - x.min()
+        u = (x - x.min()) / span if span else np.full(geometry.pixels, 0.5)
+    return np.column_stack((u, 1.0 - geometry.height))
+
+class Sampler:
+    """
+    Averages a small box around each LED's image position. The box indexes
+    are computed once per frame size, so each frame is one gather and one
+    mean.
+    """
+
+    def __init__(self, coordinates: np.ndarray, radius: float):
+        self.coordinates = coordinates
+        self.radius = radius
+        self._shape: Optional[Tuple[int, int]] = None
+        self._index = None
+
+    def _prepare(self, height: int, width: int) -> None:
+        r = max(int(self.radius * height), 0)
+        offsets = np.arange(-r, r + 1)
+        cols = np.rint(self.coordinates[:, 0] * (width - 1)).astype(np.intp)
+        rows = np.rint(self.coordinates[:, 1] * (height - 1)).astype(np.intp)
+        # (pixels, box, box) grid of image indexes, clamped at the borders
+        ys = np.clip(rows[:, None, None] + offsets[None, :, None], 0, height - 1)
+        xs = np.clip(cols[:, None, None] + offsets[None, None, :], 0, width - 1)
+        self._index = (ys * width + xs).reshape(len(rows), -1)
+        self._shape = (height, width)
+
+    def sample(self, image: np.ndarray) -> bytes:
+        """An (height, width, 3) uint8 image as one 8-bit RGB frame."""
+        if image.shape[:2] != self._shape:
+            self._prepare(*image.shape[:2])
+        samples = image.reshape(-1, 3)[self._index]
+        return (samples.mean(axis=1) + 0.5).astype(np.uint8).tobytes()
+
+def read_images(paths: list) -> Iterator[Tuple[np.ndarray, Optional[float]]]:
+    """Frames of images and animated GIFs with each frame's duration, if known."""
+    try:
+        from PIL import Image, ImageSequence
+    except ImportError:
+        raise SystemExit("Reading images needs Pillow: pip install Pillow") from None
+    for path in paths:
+        with Image.open(path) as image:
+            for frame in ImageSequence.Iterator(image):
+                duration = frame.info.get("duration")
+                yield np.asarray(frame.convert("RGB")), duration / 1000.0 if duration else None
+
+def read_video(path: str) -> Iterator[Tuple[np.ndarray, Optional[float]]]:
+    """Frames of a video file with the video's frame duration."""
+    try:
+        import cv2
+    except ImportError:
+        raise SystemExit("Reading video needs OpenCV: pip install opencv-python-headless") from None
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise SystemExit(f"Cannot open video: {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), 1.0 / fps if fps > 0 else None
+    finally:
+        capture.release()
+
+def read_frames(source: str) -> Iterator[Tuple[np.ndarray, Optional[float]]]:
+    """Frames of a video, an image or GIF, a directory of images, or a glob."""
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, name) for name in os.listdir(source))
+    elif os.path.exists(source):
+        if source.lower().endswith(VIDEO_EXTENSIONS):
+            return read_video(source)
+        paths = [source]
+    else:
+        paths = sorted(glob.glob(source))
+    if not paths:
+        raise SystemExit(f"No input frames: {source}")
+    return read_images(paths)
+
+def ingest(source: str, output: str, geometry: Geometry, fps: Optional[float] = None,
+           projection: str = "front", radius: float = DEFAULT_RADIUS) -> int:
+    """
+    Sample every frame of source into a frame file; return the frame count.
+    Without fps, the source's own frame timing is kept: each frame is
+    repeated or dropped to land on the output rate.
+    """
+    sampler = Sampler(led_coordinates(geometry, projection), radius)
+    frames = read_frames(source)
+    first, duration = next(frames, (None, None))
+    if first is None:
+        raise SystemExit(f"No input frames: {source}")
+    rate = fps or (1.0 / duration if duration else DEFAULT_FPS)
+    elapsed = 0.0  # Source time at the end of the current frame
+    with FrameFileWriter(output, geometry.pixels, rate) as writer:
+        image = first
+        while image is not None:
+            frame = sampler.sample(image)
+            elapsed += duration or 1.0 / rate
+            # Emit the frame for every output tick that falls within it
+            while writer.frames < round(elapsed * rate):
+                writer.write(frame)
+            image, duration = next(frames, (None, None))
+        if not writer.frames:
+            writer.write(frame)
+        return writer.frames
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert images or video into a PiServer show")
+    parser.add_argument("source", help="Image, GIF, video, directory of images, or glob pattern")
+    parser.add_argument("output", help="Frame file to write, e.g. shows/name.frames")
+    parser.add_argument("--fps", type=float, help="Playback rate (default: the source's own)")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT, help="LED layout file")
+    parser.add_argument("--projection", choices=PROJECTIONS, default="front",
+                        help="front: image facing the tree; wrap: image wrapped around the trunk")
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS,
+                        help="Sampling box half-size as a fraction of the image height")
+    args = parser.parse_args()
+
+    geometry = Geometry.load(args.layout)
+    count = ingest(args.source, args.output, geometry, args.fps, args.projection, args.radius)
+    size = os.path.getsize(args.output)
+    print(f"Wrote {count} frames of {geometry.pixels} pixels to {args.output} ({size} bytes)",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Named compositing layers above a device's base framebuffer.
+Each layer holds its own RGB buffer with per-pixel coverage, an opacity and a
+blend mode. Layers are composited into the output frame with NumPy once per
+render tick, however many clients are writing to them.
+"""
+
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+# Constants for default configuration
+MAX_LAYERS = 16
+
+def _normal(dst, src):
+    return src
+
+def _add(dst, src):
+    return np.minimum(dst + src, 1.0)
+
+def _multiply(dst, src):
+    return dst * src
+
+def _screen(dst, src):
+    return 1.0 - (1.0 - dst) * (1.0 - src)
+
+def _lighten(dst, src):
+    return np.maximum(dst, src)
+
+BLEND_MODES = {
+    "normal": _normal,
+    "add": _add,
+    "multiply": _multiply,
+    "screen": _screen,
+    "lighten": _lighten,
+}
+
+class Layer:
+    """Settings of one layer; its pixels live in the stack's shared arrays."""
+
+    def __init__(self, name: str, slot: int, z: float):
+        self.name = name
+        self.slot = slot
+        self.z = z
+        self.opacity = 1.0
+        self.blend = "normal"
+
+class LayerStack:
+    """
+    Overlay layers for one framebuffer. Layer pixels are stored in stacked
+    (layers, pixels, 3) arrays so that runs of normal layers composite in a
+    fixed number of array operations regardless of how many there are.
+
+    Every method must be called with the framebuffer's lock held; the
+    framebuffer calls composite() itself when it needs the output frame.
+    """
+
+    def __init__(self, pixels: int):
+        self.pixels = pixels
+        self.rgb = np.zeros((MAX_LAYERS, pixels, 3), dtype=np.float32)
+        self.alpha = np.zeros((MAX_LAYERS, pixels), dtype=np.float32)
+        self.layers: Dict[str, Layer] = {}
+        self._order: List[Layer] = []
+
+    def __len__(self) -> int:
+        return len(self.layers)
+
+    def get(self, name: str) -> Layer:
+        """Return a layer, creating it above the existing ones if needed."""
+        layer = self.layers.get(name)
+        if layer is None:
+            used = {existing.slot for existing in self.layers.values()}
+            free = [slot for slot in range(MAX_LAYERS) if slot not in used]
+            if not free:
+                raise ValueError(f"Too many layers (maximum {MAX_LAYERS})")
+            z = max((existing.z for existing in self.layers.values()), default=0) + 1
+            layer = Layer(name, free[0], z)
+            self.rgb[layer.slot] = 0
+            self.alpha[layer.slot] = 0
+            self.layers[name] = layer
+            self._sort()
+        return layer
+
+    def configure(self, name: str, opacity: Optional[float] = None,
+                  blend: Optional[str] = None, z: Optional[float] = None) -> None:
+        """Create or update a layer's opacity, blend mode and stacking order."""
+        if opacity is not None and not 0 <= opacity <= 1:
+            raise ValueError(f"Opacity must be between 0 and 1: {opacity}")
+        if blend is not None and blend not in BLEND_MODES:
+            raise ValueError(f"Unknown blend mode: {blend}")
+        layer = self.get(name)
+        if opacity is not None:
+            layer.opacity = float(opacity)
+        if blend is not None:
+            layer.blend = blend
+        if z is not None:
+            layer.z = float(z)
+            self._sort()
+
+    def remove(self, name: str) -> None:
+        """Remove a layer."""
+        if self.layers.pop(name, None) is None:
+            raise ValueError(f"Unknown layer: {name}")
+        self._sort()
+
+    def set_bytes(self, name: str, start: int, rgb: bytes) -> None:
+        """Set consecutive pixels of a layer from 8-bit RGB, making them opaque."""
+        count = len(rgb) // 3
+        layer = self.get(name)
+        values = np.frombuffer(rgb, dtype=np.uint8).reshape(count, 3)
+        self.rgb[layer.slot, start:start + count] = values / np.float32(255)
+        self.alpha[layer.slot, start:start + count] = 1.0
+
+    def set_pixels(self, name: str, indices: Sequence[int], rgb: bytes) -> None:
+        """Set scattered pixels of a layer from 8-bit RGB, one triple per index, making them opaque."""
+        layer = self.get(name)
+        values = np.frombuffer(rgb, dtype=np.uint8).reshape(len(indices), 3)
+        self.rgb[layer.slot, indices] = values / np.float32(255)
+        self.alpha[layer.slot, indices] = 1.0
+
+    def get_bytes(self, name: str) -> bytes:
+        """A layer's pixels as 8-bit RGB, premultiplied so transparent pixels read as black."""
+        slot = self.get(name).slot
+        rgb = self.rgb[slot] * self.alpha[slot][:, None]
+        return (rgb * 255 + 0.5).astype(np.uint8).tobytes()
+
+    def fill(self, name: str, rgb: Sequence[int]) -> None:
+        """Set every pixel of a layer to one 8-bit color."""
+        layer = self.get(name)
+        self.rgb[layer.slot] = np.asarray(rgb, dtype=np.float32) / 255
+        self.alpha[layer.slot] = 1.0
+
+    def clear(self, name: str) -> None:
+        """Make every pixel of a layer transparent."""
+        self.alpha[self.get(name).slot] = 0.0
+
+    def _sort(self) -> None:
+        self._order = sorted(self.layers.values(), key=lambda layer: layer.z)
+
+    def composite(self, base: bytearray) -> bytes:
+        """Composite the layers over the base frame; returns 8-bit RGB."""
+        out = np.frombuffer(base, dtype=np.uint8).reshape(self.pixels, 3) / np.float32(255)
+        run: List[Layer] = []
+        for layer in self._order:
+            if layer.opacity == 0:
+                continue
+            if layer.blend == "normal":
+                run.append(layer)
+                continue
+            if run:
+                out = self._over(out, run)
+                run = []
+            coverage = (self.alpha[layer.slot] * layer.opacity)[:, None]
+            blended = BLEND_MODES[layer.blend](out, self.rgb[layer.slot])
+            out = out + (blended - out) * coverage
+        if run:
+            out = self._over(out, run)
+        return (np.clip(out, 0.0, 1.0) * 255 + 0.5).astype(np.uint8).tobytes()
+
+    def _over(self, out, run: List[Layer]):
+        """
+        Composite a run of normal layers in one pass:
+        out = out * T[0] + sum_i(c_i * a_i * T[i + 1]), where T[k] is the
+        transparency left by layers k and above.
+        """
+        slots = [layer.slot for layer in run]
+        opacity = np.array([layer.opacity for layer in run], dtype=np.float32)
+        alpha = self.alpha[slots] * opacity[:, None]
+        transparency = np.ones((len(run) + 1, self.pixels), dtype=np.float32)
+        transparency[:-1] = np.cumprod((1.0 - alpha)[::-1], axis=0)[::-1]
+        weights = alpha * transparency[1:]
+        return out * transparency[0][:, None] + np.einsum("lp,lpc->pc", weights, self.rgb[slots])
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Layer settings and contents for persistence."""
+        return [{
+            "name": layer.name,
+            "z": layer.z,
+            "opacity": layer.opacity,
+            "blend": layer.blend,
+            "rgb": (self.rgb[layer.slot] * 255 + 0.5).astype(np.uint8).tobytes().hex(),
+            "alpha": (self.alpha[layer.slot] * 255 + 0.5).astype(np.uint8).tobytes().hex(),
+        } for layer in self._order]
+
+    def restore(self, layers: List[Dict[str, Any]]) -> None:
+        """Restore layers saved by snapshot()."""
+        for saved in layers:
+            self.configure(saved["name"], saved["opacity"], saved["blend"], saved["z"])
+            slot = self.layers[saved["name"]].slot
+            rgb = np.frombuffer(bytes.fromhex(saved["rgb"]), dtype=np.uint8)
+            alpha = np.frombuffer(bytes.fromhex(saved["alpha"]), dtype=np.uint8)
+            self.rgb[slot] = rgb.reshape(self.pixels, 3) / np.float32(255)
+            self.alpha[slot] = alpha / np.float32(255)
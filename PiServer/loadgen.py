@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Load generator and soak test for the device control server.
+Runs N concurrent clients, each sending a weighted mix of commands at a
+target rate over a persistent connection that is optionally recycled, and
+prints throughput, latency percentiles, errors and server RSS at every
+interval until the duration is over or it is interrupted:
+
+    python loadgen.py --clients 20 --rate 50 --mix set_pixel=8,set_all=1,off=1 --churn 30 --pid 1234
+    python loadgen.py --spawn --clients 50 --duration 14400 --csv soak.csv
+
+Latency is measured from when a command was due, not when it was sent, so a
+server that falls behind shows up as latency rather than a lower send rate.
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 65436
+DEFAULT_MIX = "set_pixel=8,set_all=1,off=1"
+DEFAULT_PIXELS = 25
+REPORT_INTERVAL = 10.0
+TIMEOUT = 10.0
+
+def make_command(kind: str, pixels: int) -> dict:
+    """A random command of the given type."""
+    color = [round(random.random(), 3) for _ in range(3)]
+    if kind == "set_pixel":
+        return {"type": "set_pixel", "pixel": random.randrange(pixels), "color": color}
+    if kind == "set_all":
+        return {"type": "set_all", "color": color}
+    if kind == "set_frame":
+        return {"type": "set_frame", "pixels": [color] * pixels}
+    return {"type": kind}
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse "set_pixel=8,set_all=1" into command weights."""
+    mix = {}
+    for entry in spec.split(","):
+        kind, _, weight = entry.partition("=")
+        mix[kind.strip()] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError(f"Empty command mix: {spec}")
+    return mix
+
+def rss_kb(pid: int) -> Optional[int]:
+    """Resident set size of a process in kB (Linux), or None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentile of sorted values."""
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+class Totals:
+    """Counters shared by all clients, collected and reset at every report."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.disconnects = 0
+        self.connects = 0
+
+    def collect(self) -> Dict[str, float]:
+        with self.lock:
+            latencies, self.latencies = self.latencies, []
+            counts = {"errors": self.errors, "disconnects": self.disconnects,
+                      "connects": self.connects}
+            self.errors = self.disconnects = self.connects = 0
+        latencies.sort()
+        counts["replies"] = len(latencies)
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            counts[name] = percentile(latencies, fraction) * 1000 if latencies else 0.0
+        counts["max"] = latencies[-1] * 1000 if latencies else 0.0
+        return counts
+
+class Client(threading.Thread):
+    """One simulated client: a connection sending commands at a target rate."""
+
+    def __init__(self, args: argparse.Namespace, mix: Dict[str, float], totals: Totals,
+                 stop: threading.Event):
+        super().__init__(daemon=True)
+        self.args = args
+        self.kinds = list(mix)
+        self.weights = list(mix.values())
+        self.totals = totals
+        self.stop = stop
+
+    def connect(self) -> socket.socket:
+        conn = socket.create_connection((self.args.host, self.args.port), timeout=TIMEOUT)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.totals.lock:
+            self.totals.connects += 1
+        return conn
+
+    def run(self) -> None:
+        interval = 1.0 / self.args.rate if self.args.rate > 0 else 0.0
+        # Spread clients over the first interval so they do not send in lockstep
+        due = time.monotonic() + random.random() * interval
+        while not self.stop.is_set():
+            try:
+                conn = self.connect()
+            except OSError:
+                with self.totals.lock:
+                    self.totals.errors += 1
+                self.stop.wait(1.0)
+                continue
+            lifetime = random.expovariate(1.0 / self.args.churn) if self.args.churn > 0 else None
+            reconnect_at = None if lifetime is None else time.monotonic() + lifetime
+            reader = conn.makefile("rb")
+            try:
+                while not self.stop.is_set():
+                    now = time.monotonic()
+                    if reconnect_at is not None and now >= reconnect_at:
+                        break
+                    if due > now:
+                        self.stop.wait(due - now)
+                        continue
+                    kind = random.choices(self.kinds, self.weights)[0]
+                    command = make_command(kind, self.args.pixels)
+                    conn.sendall(json.dumps(command).encode() + b"\n")
+                    reply = reader.readline()
+                    if not reply:
+                        raise ConnectionError("Server closed the connection")
+                    latency = time.monotonic() - due
+                    with self.totals.lock:
+                        self.totals.latencies.append(latency)
+                        if reply.startswith(b"ERROR"):
+                            self.totals.errors += 1
+                    due = due + interval if interval else time.monotonic()
+            except OSError:
+                with self.totals.lock:
+                    self.totals.disconnects += 1
+            finally:
+                reader.close()
+                conn.close()
+
+def spawn_server(port: int) -> subprocess.Popen:
+    """Start a local server with a virtual device and wait until it listens."""
+    env = dict(os.environ, PORT=str(port), STATE_FILE="")
+    env.setdefault("DEVICE_TYPE", "virtual")
+    server = subprocess.Popen([sys.executable, SERVER], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + TIMEOUT
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=TIMEOUT).close()
+            return server
+        except OSError:
+            if time.monotonic() > deadline:
+                server.terminate()
+                raise RuntimeError("Server did not start")
+            time.sleep(0.05)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator and soak test for PiServer")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--clients", type=int, default=10, help="Concurrent clients")
+    parser.add_argument("--rate", type=float, default=20.0,
+                        help="Commands per second per client, 0 for as fast as replies allow")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Command weights, e.g. set_pixel=8,off=1")
+    parser.add_argument("--churn", type=float, default=0.0,
+                        help="Mean connection lifetime in seconds before reconnecting, 0 to keep it")
+    parser.add_argument("--pixels", type=int, default=DEFAULT_PIXELS, help="Pixels on the device")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to run, 0 for no limit")
+    parser.add_argument("--interval", type=float, default=REPORT_INTERVAL, help="Seconds between reports")
+    parser.add_argument("--pid", type=int, help="Server process to sample RSS from")
+    parser.add_argument("--spawn", action="store_true", help="Start a local server on --port")
+    parser.add_argument("--csv", help="Also write every report row to this CSV file")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    server = spawn_server(args.port) if args.spawn else None
+    pid = server.pid if server else args.pid
+    totals = Totals()
+    stop = threading.Event()
+    clients = [Client(args, mix, totals, stop) for _ in range(args.clients)]
+    for client in clients:
+        client.start()
+
+    fields = ["elapsed", "throughput", "replies", "errors", "disconnects", "connects",
+              "p50", "p95", "p99", "max", "rss_kb"]
+    writer = None
+    csv_file = open(args.csv, "w", newline="") if args.csv else None
+    if csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fields)
+        writer.writeheader()
+    print(f"{'elapsed':>8} {'cmd/s':>8} {'errors':>7} {'drops':>6} {'conns':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'rss kB':>8}")
+    started = last = time.monotonic()
+    rows = []
+    try:
+        while not args.duration or last - started < args.duration:
+            remaining = args.interval if not args.duration else \
+                min(args.interval, started + args.duration - last)
+            time.sleep(max(remaining, 0.0))
+            now = time.monotonic()
+            row = totals.collect()
+            row["elapsed"] = now - started
+            row["throughput"] = row["replies"] / (now - last)
+            row["rss_kb"] = rss_kb(pid) if pid else None
+            last = now
+            rows.append(row)
+            print(f"{row['elapsed']:8.0f} {row['throughput']:8.0f} {row['errors']:7d} "
+                  f"{row['disconnects']:6d} {row['connects']:6d} {row['p50']:8.2f} {row['p95']:8.2f} "
+                  f"{row['p99']:8.2f} {row['max']:8.2f} {row['rss_kb'] or '-':>8}", flush=True)
+            if writer:
+                writer.writerow({field: row[field] for field in fields})
+                csv_file.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for client in clients:
+            client.join(TIMEOUT)
+        if csv_file:
+            csv_file.close()
+        if server:
+            server.terminate()
+            server.wait()
+
+    if rows:
+        replies = sum(row["replies"] for row in rows)
+        elapsed = rows[-1]["elapsed"]
+        print(f"\n{replies} replies in {elapsed:.0f} s ({replies / elapsed:.0f} cmd/s), "
+              f"{sum(row['errors'] for row in rows)} errors, "
+              f"{sum(row['disconnects'] for row in rows)} dropped connections, "
+              f"worst p99 {max(row['p99'] for row in rows):.2f} ms")
+        rss = [row["rss_kb"] for row in rows if row["rss_kb"]]
+        if len(rss) > 1:
+            print(f"Server RSS {rss[0]} kB -> {rss[-1]} kB ({rss[-1] - rss[0]:+d} kB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Crash-safe persistence of device state.
+The server snapshots every pixel device to a small JSON file so that after a
+reboot or crash the tree comes back showing what it showed before.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict
+
+# Constants for default configuration
+STATE_FORMAT_VERSION = 1
+DEFAULT_SAVE_INTERVAL = 5.0  # Minimum seconds between writes, to spare the SD card
+
+logger = logging.getLogger(__name__)
+
+class StateStore:
+    """Reads and atomically replaces a small JSON state file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Return the saved per-device state, or {} if there is none usable."""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable state file {self.path}: {e}")
+            return {}
+        if state.get("format") != STATE_FORMAT_VERSION:
+            logger.warning(f"Ignoring state file {self.path} with unknown format")
+            return {}
+        return state.get("devices", {})
+
+    def save(self, devices: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Write the state to a temporary file, fsync it and rename it over the
+        old one, so a crash mid-write never leaves a truncated file.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        # Plain os.open rather than tempfile keeps startup imports light
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"format": STATE_FORMAT_VERSION, "saved": time.time(),
+                           "devices": devices}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        # Make the rename itself durable
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class StatePersister(threading.Thread):
+    """
+    Periodically saves the state of every pixel device in a registry.
+    Writes are rate-limited to one per interval and skipped entirely when no
+    framebuffer has changed since the last save.
+    """
+
+    def __init__(self, store: StateStore, devices, interval: float = DEFAULT_SAVE_INTERVAL):
+        super().__init__(name="state-persister", daemon=True)
+        self.store = store
+        self.devices = devices
+        self.interval = interval
+        self.saves = 0
+        self._saved_versions: Dict[str, int] = {}
+        self._stopping = threading.Event()
+
+    def _pixel_devices(self):
+        return [(device_id, controller) for device_id, controller in self.devices
+                if hasattr(controller, "snapshot_state")]
+
+    def restore(self) -> int:
+        """Restore saved state into the framebuffers; returns devices restored."""
+        saved = self.store.load()
+        restored = 0
+        for device_id, controller in self._pixel_devices():
+            if device_id not in saved:
+                continue
+            try:
+                controller.restore_state(saved[device_id])
+                restored += 1
+            except (KeyError, ValueError, IndexError, TypeError) as e:
+                logger.error(f"Could not restore state of {device_id}: {e}")
+        # What was just restored is already on disk
+        self._saved_versions = self._versions()
+        if restored:
+            logger.info(f"Restored state of {restored} device(s) from {self.store.path}")
+        return restored
+
+    def _versions(self) -> Dict[str, int]:
+        return {device_id: controller.framebuffer.version
+                for device_id, controller in self._pixel_devices()}
+
+    def save_if_changed(self) -> bool:
+        """Save now if any framebuffer changed since the last save."""
+        versions = self._versions()
+        if versions == self._saved_versions:
+            return False
+        state = {device_id: controller.snapshot_state()
+                 for device_id, controller in self._pixel_devices()}
+        try:
+            self.store.save(state)
+        except OSError as e:
+            logger.error(f"Could not save state to {self.store.path}: {e}")
+            return False
+        self._saved_versions = versions
+        self.saves += 1
+        return True
+
+    def run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            self.save_if_changed()
+
+    def stop(self) -> None:
+        """Stop the thread and save any final changes."""
+        self._stopping.set()
+        if self.is_alive():
+            self.join()
+        self.save_if_changed()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Playback of pre-rendered shows.
+A show is a frame file: a small header followed by every frame as raw 8-bit
+RGB, written once by ingest.py. The server memory-maps the file and plays
+it as an effect, so even long shows cost no decoding CPU and no RAM beyond
+the page cache.
+"""
+
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, Optional
+
+# Constants for default configuration
+# SHOWS_DIR overrides where shows are looked up
+SHOWS_DIR = os.getenv("SHOWS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "shows"))
+FRAME_FILE_EXTENSION = ".frames"
+
+# Header: magic, format version, pixels per frame, frame count, frames per second
+MAGIC = b"PIFRAMES"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHIIf")
+
+class FrameFile:
+    """Read-only, memory-mapped frame file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError(f"Not a frame file: {path}")
+            magic, version, self.pixels, self.frames, self.fps = HEADER.unpack(header)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"Not a frame file (or unknown version): {path}")
+            self.frame_size = self.pixels * 3
+            expected = HEADER.size + self.frames * self.frame_size
+            if os.fstat(f.fileno()).st_size < expected or not self.frames:
+                raise ValueError(f"Truncated or empty frame file: {path}")
+            self._map = mmap.mmap(f.fileno(), expected, access=mmap.ACCESS_READ)
+
+    def frame(self, index: int) -> bytes:
+        """Frame index as 8-bit RGB; only this frame's pages are touched."""
+        start = HEADER.size + index * self.frame_size
+        return self._map[start:start + self.frame_size]
+
+    def read_all(self) -> bytes:
+        """Every frame, concatenated."""
+        return self._map[HEADER.size:]
+
+    def close(self) -> None:
+        self._map.close()
+
+class FrameFileWriter:
+    """Writes a frame file one frame at a time, filling in the count on close."""
+
+    def __init__(self, path: str, pixels: int, fps: float):
+        self.pixels = pixels
+        self.fps = fps
+        self.frames = 0
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, FORMAT_VERSION, pixels, 0, fps))
+
+    def write(self, frame: bytes) -> None:
+        if len(frame) != self.pixels * 3:
+            raise ValueError(f"Frame has {len(frame)} bytes, expected {self.pixels * 3}")
+        self._file.write(frame)
+        self.frames += 1
+
+    def close(self) -> None:
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.pixels, self.frames, self.fps))
+        self._file.close()
+
+    def __enter__(self) -> "FrameFileWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def show_path(name: str, extension: str = FRAME_FILE_EXTENSION) -> str:
+    """Resolve a show name to a file in SHOWS_DIR, refusing paths outside it."""
+    if not name.endswith(extension):
+        name += extension
+    path = os.path.realpath(os.path.join(SHOWS_DIR, name))
+    if os.path.dirname(path) != os.path.realpath(SHOWS_DIR):
+        raise ValueError(f"Show must be a file in {SHOWS_DIR}: {name}")
+    return path
+
+class Playback:
+    """
+    Effect playing a frame file from SHOWS_DIR at its own or a chosen frame
+    rate, looping by default. Used by the render thread like other effects.
+    """
+
+    PARAMS = {"file": None, "fps": None, "loop": True}
+    missed = 0
+
+    def __init__(self, name: str, geometry: Any, params: Dict[str, Any]):
+        unknown = set(params) - set(self.PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+        if not params.get("file"):
+            raise ValueError("playback needs a file")
+        try:
+            self.show = FrameFile(show_path(params["file"]))
+        except OSError as e:
+            raise ValueError(f"Cannot open show {params['file']}: {e.strerror}") from None
+        if self.show.pixels != geometry.pixels:
+            self.show.close()
+            raise ValueError(f"Show has {self.show.pixels} pixels, device has {geometry.pixels}")
+        self.name = name
+        self.params = dict(params)
+        self.fps = float(params.get("fps") or self.show.fps)
+        if self.fps <= 0:
+            self.show.close()
+            raise ValueError(f"fps must be positive: {self.fps}")
+        self.loop = bool(params.get("loop", True))
+        self.started = time.time()
+        self._last: Optional[int] = None
+
+    def render(self, t: float) -> Optional[bytes]:
+        """The frame due at t, or None if it is already showing."""
+        index = int((t - self.started) * self.fps)
+        if self.loop:
+            index %= self.show.frames
+        else:
+            # Hold the last frame once the show is over
+            index = min(index, self.show.frames - 1)
+        if index == self._last:
+            return None
+        self._last = index
+        return self.show.frame(index)
+
+    def describe(self) -> Dict[str, Any]:
+        """Name and parameters, enough to recreate the effect."""
+        return {"effect": self.name, "params": self.params}
+
+    def close(self) -> None:
+        self.show.close()
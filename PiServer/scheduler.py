@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Fair command scheduling across client connections.
+Each connection queues its commands in its own inbox; a single scheduler
+thread serves the inboxes round-robin, subject to a per-connection token
+bucket, so one chatty client cannot starve the others. Control commands
+such as "off" are served ahead of queued pixel writes from other clients,
+but are paid for from the same bucket, so priority is not a way around it.
+The scheduler also reaps connections that died, and with an idle timeout
+those that went quiet, so a client that vanished without closing its socket
+does not hold a session forever.
+"""
+
+import socket
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from tracing import begin_trace
+
+# Constants for default configuration
+DEFAULT_RATE_LIMIT = 1000.0  # Commands per second per connection, 0 for unlimited
+DEFAULT_RATE_BURST = 100  # Commands a connection may send in a burst
+MAX_QUEUED_COMMANDS = 64  # Per-connection inbox; readers block when it is full
+MAX_QUEUED_REPLIES = 256  # Per-connection outbox; oldest replies drop when full
+CONTROL_COMMANDS = frozenset({"off", "ping", "stats", "traces"})
+CLIENT_ERRORS = (ValueError, KeyError, IndexError, TypeError)  # Bad input rather than a server fault
+DEFAULT_IDLE_TIMEOUT = 0.0  # Seconds without any data before a connection is closed, 0 to disable
+DEFAULT_READ_TIMEOUT = 30.0  # Seconds allowed to finish a partly received command, 0 to disable
+DEFAULT_KEEPALIVE_IDLE = 30.0  # Seconds of silence before TCP keepalive probes, 0 to disable
+KEEPALIVE_INTERVAL = 10  # Seconds between unanswered keepalive probes
+KEEPALIVE_PROBES = 3  # Unanswered probes before the kernel drops the connection
+HEARTBEAT_INTERVAL = 30.0  # Seconds of silence before a transport heartbeat, where it has one
+REAP_INTERVAL = 1.0  # Seconds between checks for idle connections
+
+logger = logging.getLogger(__name__)
+
+# Inbox marker for data that could not be parsed, answered in order
+INVALID_JSON = object()
+
+def tune_keepalive(conn: socket.socket, idle: float) -> None:
+    """
+    Enable TCP keepalive so a peer that vanished is detected after about
+    idle + KEEPALIVE_INTERVAL * KEEPALIVE_PROBES seconds, and bound how long
+    unacknowledged writes may wait by the same amount where supported.
+    """
+    if idle <= 0:
+        return
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, max(int(idle), 1))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTERVAL)
+    if hasattr(socket, "TCP_KEEPCNT"):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_PROBES)
+    if hasattr(socket, "TCP_USER_TIMEOUT"):
+        timeout = idle + KEEPALIVE_INTERVAL * KEEPALIVE_PROBES
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(timeout * 1000))
+
+class TokenBucket:
+    """Classic token bucket: rate tokens per second, up to capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Take a token; return 0 on success, else seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class ClientSession:
+    """
+    One client connection: an inbox of parsed commands and a bounded outbox
+    of replies drained by a writer thread, so a client that never reads its
+    replies cannot block the scheduler. State broadcasts use a separate
+    single slot holding only the latest frame, so a slow client skips stale
+    frames instead of queueing them.
+    """
+
+    def __init__(self, conn: socket.socket, addr: tuple, rate: float, burst: float):
+        self.conn = conn
+        self.addr = addr
+        self.inbox: Deque[Any] = deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.closed = False
+        self.received = 0
+        self.processed = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.replies_dropped = 0
+        self.frames_dropped = 0
+        self.head_throttled = False
+        self.in_flight = False
+        self.last_activity = time.monotonic()
+        self.partial_since: Optional[float] = None  # When unfinished command data arrived
+        self.last_heartbeat = 0.0
+        self.close_reason: Optional[str] = None  # Set when the connection is reclaimed
+        self._outbox: Deque[bytes] = deque()
+        self._latest: Optional[bytes] = None
+        self._out_changed = threading.Condition()
+        self.writer = threading.Thread(target=self._write_loop, name=f"writer-{addr}", daemon=True)
+
+    def send(self, data: bytes) -> None:
+        """Queue a reply, dropping the oldest one if the client is not reading."""
+        with self._out_changed:
+            if self.closed:
+                return
+            if len(self._outbox) >= MAX_QUEUED_REPLIES:
+                self._outbox.popleft()
+                self.replies_dropped += 1
+            self._outbox.append(data)
+            self._out_changed.notify()
+
+    def touch(self, partial: bool = False) -> None:
+        """Note data received from the client; partial if a command is still incomplete."""
+        self.last_activity = time.monotonic()
+        if not partial:
+            self.partial_since = None
+        elif self.partial_since is None:
+            self.partial_since = self.last_activity
+
+    def heartbeat(self) -> None:
+        """Prompt the client to show it is alive; the plain protocol has no way to."""
+
+    def execute(self, command: Any, handler: Callable[[Any], bytes]) -> None:
+        """Run a command and send its reply; transports may answer some commands themselves."""
+        self.reply(command, handler(command))
+
+    def reply(self, command: Any, data: bytes) -> None:
+        """Send the reply to a command; transports may frame it by command."""
+        self.send(data)
+
+    def publish(self, data: bytes) -> None:
+        """Offer a broadcast frame, replacing any frame not yet sent."""
+        with self._out_changed:
+            if self.closed:
+                return
+            if self._latest is not None:
+                self.frames_dropped += 1
+            self._latest = data
+            self._out_changed.notify()
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._out_changed:
+                while not self._outbox and self._latest is None and not self.closed:
+                    self._out_changed.wait()
+                if self._outbox:
+                    data = self._outbox.popleft()
+                elif self._latest is not None and not self.closed:
+                    data, self._latest = self._latest, None
+                else:
+                    break
+            try:
+                self.conn.sendall(data)
+            except OSError:
+                break
+        # Unblocks the reader once pending replies are flushed
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        """Flush pending replies, then shut the connection down."""
+        with self._out_changed:
+            self.closed = True
+            self._out_changed.notify()
+
+    def abort(self, reason: str) -> None:
+        """
+        Drop the connection without flushing. Shutting the socket down wakes
+        the reader and any write blocked on a peer that stopped reading.
+        """
+        with self._out_changed:
+            if self.close_reason is None:
+                self.close_reason = reason
+            self.closed = True
+            self._outbox.clear()
+            self._latest = None
+            self._out_changed.notify()
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-client counters for the stats command."""
+        return {
+            "address": f"{self.addr[0]}:{self.addr[1]}",
+            "received": self.received,
+            "processed": self.processed,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "queued": len(self.inbox),
+            "replies_dropped": self.replies_dropped,
+            "frames_dropped": self.frames_dropped,
+            "idle": round(time.monotonic() - self.last_activity, 1),
+        }
+
+class CommandScheduler(threading.Thread):
+    """Serves client inboxes fairly from a single thread in front of process_command."""
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], bytes],
+                 rate: float = DEFAULT_RATE_LIMIT, burst: float = DEFAULT_RATE_BURST,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 keepalive_idle: float = DEFAULT_KEEPALIVE_IDLE):
+        super().__init__(name="scheduler", daemon=True)
+        self.handler = handler
+        self.rate = rate
+        self.burst = burst
+        self.idle_timeout = idle_timeout
+        self.read_timeout = read_timeout
+        self.keepalive_idle = keepalive_idle  # Applied by the transports to TCP connections
+        self.running = False
+        self.sessions: Deque[ClientSession] = deque()
+        self.opened = 0
+        self.closed = 0
+        self.reclaimed: Dict[str, int] = {"idle": 0, "read_timeout": 0, "dead": 0}
+        self._next_reap = 0.0
+        self._changed = threading.Condition()
+
+    def open_session(self, conn: socket.socket, addr: tuple,
+                     session_class: type = ClientSession) -> ClientSession:
+        """Create and register a session for a new connection."""
+        session = session_class(conn, addr, self.rate, self.burst)
+        session.writer.start()
+        with self._changed:
+            self.sessions.append(session)
+            self.opened += 1
+        return session
+
+    def close_session(self, session: ClientSession) -> None:
+        """Let the session's queued commands finish, then unregister it."""
+        with self._changed:
+            while (session.inbox or session.in_flight) and not session.closed and self.running:
+                self._changed.wait()
+            session.inbox.clear()
+            if session in self.sessions:
+                self.sessions.remove(session)
+                if session.close_reason:
+                    self.reclaimed[session.close_reason] += 1
+                else:
+                    self.closed += 1
+        session.close()
+        session.writer.join()
+
+    def submit(self, session: ClientSession, command: Any) -> None:
+        """Queue a command from a session's reader, blocking while its inbox is full."""
+        # Receive time is taken before any wait for inbox space, which counts as queueing
+        begin_trace(command)
+        with self._changed:
+            while len(session.inbox) >= MAX_QUEUED_COMMANDS and not session.closed and self.running:
+                self._changed.wait()
+            if session.closed:
+                return
+            session.inbox.append(command)
+            session.received += 1
+            self._changed.notify_all()
+
+    def _next(self) -> Tuple[Optional[ClientSession], Any, Optional[float]]:
+        """
+        Pick the next command: control commands first, then round-robin over
+        sessions with tokens. Control commands take tokens too, so a flood of
+        them is throttled like any other. Returns (session, command, None), or
+        (None, None, wait) with the time until a throttled session may run.
+        """
+        now = time.monotonic()
+        wait = None
+        for session in self.sessions:
+            if session.inbox and _is_control(session.inbox[0]):
+                delay = self._take(session, now)
+                if delay == 0:
+                    return session, self._pop(session), None
+                wait = delay if wait is None else min(wait, delay)
+        for _ in range(len(self.sessions)):
+            session = self.sessions[0]
+            self.sessions.rotate(-1)
+            if not session.inbox:
+                continue
+            delay = self._take(session, now)
+            if delay == 0:
+                return session, self._pop(session), None
+            wait = delay if wait is None else min(wait, delay)
+        return None, None, wait
+
+    def _take(self, session: ClientSession, now: float) -> float:
+        """Take a token for the session's next command, counting it once if it must wait."""
+        delay = session.bucket.take(now)
+        if delay and not session.head_throttled:
+            session.head_throttled = True
+            session.throttled += 1
+        return delay
+
+    def _pop(self, session: ClientSession) -> Any:
+        session.head_throttled = False
+        session.in_flight = True
+        command = session.inbox.popleft()
+        # Wake a reader blocked on a full inbox
+        self._changed.notify_all()
+        return command
+
+    def _reap(self, now: float) -> None:
+        """Abort idle connections and those stuck mid-command; heartbeat quiet ones."""
+        aborted = False
+        for session in self.sessions:
+            if session.closed:
+                continue
+            idle = now - session.last_activity
+            if self.idle_timeout > 0 and idle > self.idle_timeout:
+                logger.info(f"Closing idle connection {session.addr} after {idle:.0f}s")
+                session.abort("idle")
+                aborted = True
+            elif (self.read_timeout > 0 and session.partial_since is not None
+                    and now - session.partial_since > self.read_timeout):
+                logger.info(f"Closing connection {session.addr}: incomplete command")
+                session.abort("read_timeout")
+                aborted = True
+            elif idle > HEARTBEAT_INTERVAL and now - session.last_heartbeat > HEARTBEAT_INTERVAL:
+                session.last_heartbeat = now
+                session.heartbeat()
+        if aborted:
+            # Wake readers blocked on a full inbox of an aborted session
+            self._changed.notify_all()
+
+    def run(self) -> None:
+        while self.running:
+            with self._changed:
+                now = time.monotonic()
+                if now >= self._next_reap:
+                    self._reap(now)
+                    self._next_reap = now + REAP_INTERVAL
+                session, command, wait = self._next()
+                if session is None:
+                    self._changed.wait(min(wait or REAP_INTERVAL, REAP_INTERVAL))
+                    continue
+            self._process(session, command)
+            with self._changed:
+                session.in_flight = False
+                self._changed.notify_all()
+
+    def _process(self, session: ClientSession, command: Any) -> None:
+        """Run one command; a rejected command is answered with an error and the connection stays open."""
+        if command is INVALID_JSON:
+            session.rejected += 1
+            session.send(b"ERROR: Invalid JSON format\n")
+            return
+        try:
+            session.execute(command, self.handler)
+            session.processed += 1
+        except CLIENT_ERRORS as e:
+            # Expected for bad input; counted per client rather than logged at error level
+            session.rejected += 1
+            logger.debug(f"Rejected command from {session.addr}: {e}")
+            session.send(f"ERROR: {str(e)}\n".encode())
+        except Exception as e:
+            session.rejected += 1
+            logger.error(f"Error handling client {session.addr}: {e}")
+            session.send(f"ERROR: {str(e)}\n".encode())
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-client counters."""
+        with self._changed:
+            return [session.stats() for session in self.sessions]
+
+    def gauges(self) -> Dict[str, Any]:
+        """Live connections and how many were closed by clients or reclaimed."""
+        with self._changed:
+            return {"live": len(self.sessions), "opened": self.opened, "closed": self.closed,
+                    "reclaimed": dict(self.reclaimed)}
+
+    def start(self) -> None:
+        self.running = True
+        super().start()
+
+    def stop(self) -> None:
+        with self._changed:
+            self.running = False
+            self._changed.notify_all()
+        if self.is_alive():
+            self.join()
+
+def _is_control(command: Any) -> bool:
+    return isinstance(command, dict) and command.get("type") in CONTROL_COMMANDS
@@ -7,16 +7,44 @@ Supports multiple device types through a common interface.
 import socket
 import logging
 import os
+import sys
 import json
+import codecs
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
 from abc import ABC, abstractmethod
-from typing import Any, Dict
-from tree import RGBXmasTree
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from gc_tuning import DEFAULT_GC_TUNING, CollectorTuning
+from persistence import DEFAULT_SAVE_INTERVAL, StatePersister, StateStore
+from spi_transport import (DEFAULT_SPI_PINS, DEFAULT_SPI_TRANSPORT, SPI_TRANSPORTS, choose_transport,
+                           parse_pins)
+from tracing import TRACE_FIELD, TRACE_TIMEOUT, Tracer
+from scheduler import (DEFAULT_IDLE_TIMEOUT, DEFAULT_KEEPALIVE_IDLE, DEFAULT_RATE_BURST,
+                       DEFAULT_RATE_LIMIT, DEFAULT_READ_TIMEOUT, INVALID_JSON, CommandScheduler,
+                       tune_keepalive)
+
+# Reference point for startup metrics such as time to first frame
+STARTED_AT = time.monotonic()
 
 # Constants for default configuration
 DEFAULT_HOST = "0.0.0.0"  # Listen on all interfaces
 DEFAULT_PORT = 65436
-DEFAULT_DEVICE_TYPE = "rgb"  # Default to RGB tree
+DEFAULT_DEVICE_TYPE = "rgb_tree"  # Default to RGB tree
+DEFAULT_DEVICE_ID = "tree"
+DEFAULT_PIXELS = 25
 DEFAULT_BUFFER_SIZE = 1024
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tree_state.json")
+MAX_COMMAND_SIZE = 65536  # Largest single JSON command accepted from a client
+RENDER_POLL_INTERVAL = 0.5  # Seconds between render thread stop checks
+JITTER_BUFFER_SIZE = 256  # Scheduled commands held per device
+MAX_SCHEDULE_AHEAD = 10.0  # Furthest presentation time accepted, in seconds
+SHARED_FRAME_POLL_INTERVAL = 0.005  # Seconds between shared-memory frame checks
+EFFECT_FRAME_INTERVAL = 0.02  # Seconds between effect frames (50 fps)
+MAX_TRANSITION_DURATION = 86400.0  # Longest keyframe or timeline hold, in seconds
+LATENCY_WINDOW = 500  # Effect frames kept for input-to-output latency percentiles
 
 # Configure logging
 logging.basicConfig(
@@ -25,6 +53,216 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Protocol color for each 8-bit level; int(255 * LEVELS[v]) == v for every
+# byte, so levels round-trip exactly
+LEVELS = tuple(v / 255 for v in range(256))
+
+# Layer name for the framebuffer itself, below any overlay layers
+BASE_LAYER = "base"
+
+class CommandError(ValueError):
+    """A malformed or out-of-range command; it is answered with an error and the connection stays open."""
+
+class Framebuffer:
+    """
+    Thread-safe 8-bit RGB framebuffer shared by commands and a render thread.
+    Writes go to the base frame or to a named overlay layer; the output frame
+    is the base with the layers composited on top.
+    """
+    
+    def __init__(self, pixels: int):
+        self.pixels = pixels
+        self.data = bytearray(pixels * 3)
+        self.version = 0
+        self.changed = threading.Condition()
+        self.layers = None  # LayerStack, created on first use so NumPy stays optional
+        self._output: Optional[bytes] = None
+        self._encoded: Dict[str, bytes] = {}
+    
+    def __len__(self) -> int:
+        return self.pixels
+    
+    @staticmethod
+    def to_rgb8(color: Sequence[float]) -> Tuple[int, int, int]:
+        """
+        Convert a protocol color (three numbers in 0-1) to 8-bit RGB. Arity,
+        type and range are checked by one unpack and one comparison chain.
+        """
+        try:
+            r, g, b = color
+            rgb = int(255 * r), int(255 * g), int(255 * b)
+        except (TypeError, ValueError, OverflowError):
+            # OverflowError: an infinite component, such as 1e400 in the JSON
+            raise CommandError(f"Color must be three numbers between 0 and 1: {color!r}") from None
+        if not (0 <= rgb[0] <= 255 and 0 <= rgb[1] <= 255 and 0 <= rgb[2] <= 255):
+            raise CommandError(f"Color components must be between 0 and 1: {color!r}")
+        return rgb
+    
+    def set_pixel(self, index: int, color: Sequence[float], layer: Optional[str] = None) -> None:
+        """Set a single pixel."""
+        if type(index) is not int or not 0 <= index < self.pixels:
+            raise CommandError(f"Pixel index out of range: {index!r}")
+        self.set_bytes(index, bytes(self.to_rgb8(color)), layer)
+    
+    @classmethod
+    def colors_to_bytes(cls, colors: Sequence[Sequence[float]]) -> bytes:
+        """Convert a list of protocol colors to 8-bit RGB."""
+        to_rgb8 = cls.to_rgb8
+        try:
+            return bytes([v for color in colors for v in to_rgb8(color)])
+        except TypeError:
+            raise CommandError("Pixels must be a list of colors") from None
+    
+    def set_range(self, start: int, colors: Sequence[Sequence[float]], layer: Optional[str] = None) -> None:
+        """Set consecutive pixels starting at start."""
+        self.set_bytes(start, self.colors_to_bytes(colors), layer)
+    
+    def set_bytes(self, start: int, rgb: bytes, layer: Optional[str] = None) -> None:
+        """Set consecutive pixels from raw 8-bit RGB data."""
+        if len(rgb) % 3:
+            raise CommandError(f"RGB data length must be a multiple of 3, got {len(rgb)}")
+        if type(start) is not int or start < 0 or start + len(rgb) // 3 > self.pixels:
+            raise CommandError(f"Pixel range out of range: {start!r}+{len(rgb) // 3}")
+        with self.changed:
+            if layer is None or layer == BASE_LAYER:
+                self.data[start * 3:start * 3 + len(rgb)] = rgb
+            else:
+                self._layer_stack().set_bytes(layer, start, rgb)
+            self._touch()
+    
+    def set_pixels(self, indices: List[int], colors: Sequence[Sequence[float]],
+                   layer: Optional[str] = None) -> None:
+        """Set scattered pixels together, so they are shown in the same frame."""
+        if type(indices) is not list or type(colors) is not list or len(indices) != len(colors):
+            raise CommandError("indices and colors must be lists of the same length")
+        pixels = self.pixels
+        for index in indices:
+            if type(index) is not int or not 0 <= index < pixels:
+                raise CommandError(f"Pixel index out of range: {index!r}")
+        rgb = self.colors_to_bytes(colors)
+        with self.changed:
+            if layer is None or layer == BASE_LAYER:
+                data = self.data
+                for n, index in enumerate(indices):
+                    data[index * 3:index * 3 + 3] = rgb[n * 3:n * 3 + 3]
+            else:
+                self._layer_stack().set_pixels(layer, indices, rgb)
+            self._touch()
+    
+    def fill(self, color: Sequence[float], layer: Optional[str] = None) -> None:
+        """Set every pixel to the same color."""
+        rgb = self.to_rgb8(color)
+        with self.changed:
+            if layer is None or layer == BASE_LAYER:
+                self.data[:] = bytes(rgb) * self.pixels
+            else:
+                self._layer_stack().fill(layer, rgb)
+            self._touch()
+    
+    def read(self, layer: Optional[str] = None) -> bytes:
+        """The base frame, or a layer with transparent pixels as black, as 8-bit RGB."""
+        with self.changed:
+            if layer is None or layer == BASE_LAYER:
+                return bytes(self.data)
+            return self._layer_stack().get_bytes(layer)
+    
+    def clear(self, layer: Optional[str] = None) -> None:
+        """Set every pixel to black, or make every pixel of a layer transparent."""
+        with self.changed:
+            if layer is None or layer == BASE_LAYER:
+                self.data[:] = bytes(len(self.data))
+            else:
+                self._layer_stack().clear(layer)
+            self._touch()
+    
+    def configure_layer(self, name: str, opacity: Optional[float] = None,
+                        blend: Optional[str] = None, z: Optional[float] = None) -> None:
+        """Create or update an overlay layer."""
+        if name == BASE_LAYER:
+            raise ValueError(f"The {BASE_LAYER} layer cannot be configured")
+        with self.changed:
+            self._layer_stack().configure(name, opacity, blend, z)
+            self._touch()
+    
+    def remove_layer(self, name: str) -> None:
+        """Remove an overlay layer."""
+        with self.changed:
+            if self.layers is None:
+                raise ValueError(f"Unknown layer: {name}")
+            self.layers.remove(name)
+            self._touch()
+    
+    def _layer_stack(self):
+        if self.layers is None:
+            from layers import LayerStack
+            self.layers = LayerStack(self.pixels)
+        return self.layers
+    
+    def _output_frame(self) -> bytes:
+        """The composited output frame; call with the lock held."""
+        if self._output is None:
+            if self.layers:
+                self._output = self.layers.composite(self.data)
+            else:
+                self._output = bytes(self.data)
+        return self._output
+    
+    def snapshot(self) -> Tuple[bytes, int]:
+        """Return the output frame and its version."""
+        with self.changed:
+            return self._output_frame(), self.version
+    
+    def encode_state(self, fmt: str = "json") -> bytes:
+        """
+        Return the frame encoded as a get_state reply. Encodings are cached
+        until the next change, so repeated polling costs a dictionary lookup.
+        """
+        with self.changed:
+            encoded = self._encoded.get(fmt)
+            if encoded is None:
+                if fmt == "binary":
+                    # Raw 8-bit RGB, 3 bytes per pixel
+                    encoded = self._output_frame()
+                elif fmt == "json":
+                    data = self._output_frame()
+                    pixels = [[LEVELS[data[i]], LEVELS[data[i + 1]], LEVELS[data[i + 2]]]
+                              for i in range(0, len(data), 3)]
+                    state = {"type": "state", "version": self.version, "pixels": pixels}
+                    encoded = json.dumps(state).encode() + b"\n"
+                else:
+                    raise CommandError(f"Unknown state format: {fmt}")
+                self._encoded[fmt] = encoded
+            return encoded
+    
+    def wait_for_change(self, version: int, timeout: float,
+                        out: Optional[bytearray] = None) -> Tuple[Union[bytes, bytearray, None], int]:
+        """
+        Block until the frame is newer than version; return (frame, version).
+        With out, the frame is copied into that preallocated buffer, which is
+        returned, so a frame without layers allocates nothing.
+        """
+        with self.changed:
+            if self.version == version:
+                self.changed.wait(timeout)
+            if self.version == version:
+                return None, version
+            if out is None:
+                # Layers are composited here, once per render tick
+                return self._output_frame(), self.version
+            out[:] = self._output_frame() if self.layers else self.data
+            return out, self.version
+    
+    def wake(self) -> None:
+        """Wake any thread blocked in wait_for_change."""
+        with self.changed:
+            self.changed.notify_all()
+    
+    def _touch(self) -> None:
+        self.version += 1
+        self._output = None
+        self._encoded.clear()
+        self.changed.notify_all()
+
 class DeviceController(ABC):
     """Abstract base class for device controllers."""
     
@@ -43,34 +281,276 @@ class DeviceController(ABC):
         """Clean up device resources."""
         pass
 
-class RGBTreeController(DeviceController):
+class PixelDeviceController(DeviceController):
+    """
+    Base controller for addressable pixel devices.
+    Commands only update the framebuffer; a DeviceRenderer thread pushes
+    changed frames to the hardware through show().
+    """
+    
+    def __init__(self, pixels: int = DEFAULT_PIXELS):
+        self.framebuffer = Framebuffer(pixels)
+        self.geometry = None  # Loaded with the first effect so NumPy stays optional
+        self.effect = None
+        self.effect_layer: Optional[str] = None
+        self.transitions: Dict[Optional[str], Any] = {}  # Fades and keyframes by layer, None for the base
+        self.traced: deque = deque()  # Applied traces waiting for their frame to be shown
+        self._effect_lock = threading.Lock()
+        # Command type -> handler(command, layer), looked up once per command
+        self.handlers: Dict[str, Callable[[Dict[str, Any], Optional[str]], None]] = {
+            "set_pixel": self._set_pixel,
+            "set_pixels": self._set_pixels,
+            "set_all": self._set_all,
+            "set_frame": self._set_frame,
+            "off": self._off,
+            "start_effect": self._start_effect,
+            "stop_effect": self._stop_effect,
+            "set_layer": self._set_layer,
+            "remove_layer": self._remove_layer,
+            "fade_to": self._fade_to,
+            "keyframes": self._keyframes,
+        }
+    
+    def process_command(self, command: Dict[str, Any]) -> None:
+        """Process a pixel command by updating the framebuffer."""
+        try:
+            handler = self.handlers[command["type"]]
+        except KeyError:
+            raise CommandError(f"Unknown command type: {command.get('type')}") from None
+        try:
+            # Writes target the base frame unless they name an overlay layer
+            handler(command, command.get("layer"))
+        except KeyError as e:
+            raise CommandError(f"Missing field: {e.args[0]}") from None
+        if TRACE_FIELD in command:
+            trace = command[TRACE_FIELD]
+            trace.applied = time.time()
+            trace.version = self.framebuffer.version
+            self.traced.append(trace)
+    
+    def _set_pixel(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        if self.transitions:
+            self.stop_transition(layer)
+        self.framebuffer.set_pixel(command["pixel"], command["color"], layer)
+    
+    def _set_pixels(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        if self.transitions:
+            self.stop_transition(layer)
+        self.framebuffer.set_pixels(command["indices"], command["colors"], layer)
+    
+    def _set_all(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        if self.transitions:
+            self.stop_transition(layer)
+        self.framebuffer.fill(command["color"], layer)
+    
+    def _set_frame(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        if self.transitions:
+            self.stop_transition(layer)
+        start = command.get("start", 0)
+        if "data" in command:
+            # Compact form: hex-encoded 8-bit RGB
+            self.framebuffer.set_bytes(start, _from_hex(command["data"]), layer)
+        else:
+            self.framebuffer.set_range(start, command["pixels"], layer)
+    
+    def _off(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        if self.effect is not None and layer == self.effect_layer:
+            self.stop_effect()
+        if self.transitions:
+            self.stop_transition(layer)
+        self.framebuffer.clear(layer)
+    
+    def _start_effect(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        self.start_effect(command["effect"], command.get("params", {}), layer)
+        if self.transitions:
+            self.stop_transition(layer)
+    
+    def _stop_effect(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        self.stop_effect()
+    
+    def _set_layer(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        self.framebuffer.configure_layer(command["layer"], command.get("opacity"),
+                                         command.get("blend"), command.get("z"))
+    
+    def _remove_layer(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        self.stop_transition(command["layer"])
+        self.framebuffer.remove_layer(command["layer"])
+    
+    def _fade_to(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        keyframe = (self.parse_frame(command), _duration(command.get("duration", 1.0)),
+                    command.get("easing", "linear"))
+        self.start_transition([keyframe], False, layer)
+    
+    def _keyframes(self, command: Dict[str, Any], layer: Optional[str]) -> None:
+        keyframes = command["keyframes"]
+        if type(keyframes) is not list or not all(type(k) is dict for k in keyframes):
+            raise CommandError("keyframes must be a list of objects")
+        self.start_transition([(self.parse_frame(keyframe), _duration(keyframe.get("duration", 1.0)),
+                                keyframe.get("easing", "linear")) for keyframe in keyframes],
+                              bool(command.get("loop", False)), layer)
+    
+    def parse_frame(self, spec: Dict[str, Any]) -> bytes:
+        """A whole frame given as one color, a list of pixel colors, or hex 8-bit RGB data."""
+        pixels = self.framebuffer.pixels
+        if "color" in spec:
+            return bytes(self.framebuffer.to_rgb8(spec["color"])) * pixels
+        if "data" in spec:
+            rgb = _from_hex(spec["data"])
+        elif "pixels" in spec:
+            rgb = self.framebuffer.colors_to_bytes(spec["pixels"])
+        else:
+            raise CommandError("A frame needs a color, pixels or data")
+        if len(rgb) != pixels * 3:
+            raise CommandError(f"A frame needs exactly {pixels} pixels, got {len(rgb) // 3}")
+        return rgb
+    
+    def start_transition(self, keyframes: List[Tuple[bytes, float, str]], loop: bool = False,
+                         layer: Optional[str] = None) -> None:
+        """Animate the base frame or a layer from its current contents through keyframes."""
+        from transitions import Transition
+        key = None if layer == BASE_LAYER else layer
+        transition = Transition(self.framebuffer.read(layer), keyframes, time.monotonic(), loop)
+        # The newest animation of a layer wins, whether effect or transition
+        if self.effect is not None and layer == self.effect_layer:
+            self.stop_effect()
+        with self._effect_lock:
+            self.transitions[key] = transition
+        self.framebuffer.wake()
+    
+    def stop_transition(self, layer: Optional[str] = None) -> None:
+        """Stop the transition on the base frame or a layer, leaving its current frame."""
+        with self._effect_lock:
+            self.transitions.pop(None if layer == BASE_LAYER else layer, None)
+    
+    def delay_transitions(self, seconds: float, since: Optional[float] = None) -> None:
+        """Move transitions started at or after since (default all) later by seconds."""
+        with self._effect_lock:
+            for transition in self.transitions.values():
+                if since is None or transition.started >= since:
+                    transition.started += seconds
+    
+    def render_transitions(self) -> None:
+        """Write the current frame of every transition; called by the render thread."""
+        now = time.monotonic()
+        with self._effect_lock:
+            for layer, transition in list(self.transitions.items()):
+                try:
+                    frame = transition.render(now)
+                    if frame is not None:
+                        self.framebuffer.set_bytes(0, frame, layer)
+                except Exception as e:
+                    transition.finished = True
+                    logger.error(f"Error rendering transition on layer {layer}: {e}")
+                if transition.finished:
+                    del self.transitions[layer]
+    
+    def start_effect(self, name: str, params: Dict[str, Any], layer: Optional[str] = None) -> None:
+        """Run a spatial effect on the base frame or a layer, replacing any running effect."""
+        from effects import create_effect
+        from geometry import load_geometry
+        if self.geometry is None:
+            self.geometry = load_geometry(self.framebuffer.pixels)
+        effect = create_effect(name, self.geometry, params)
+        with self._effect_lock:
+            previous, self.effect = self.effect, effect
+            self.effect_layer = layer
+        if previous is not None:
+            previous.close()
+        # Wake the render thread so the first effect frame is not delayed
+        self.framebuffer.wake()
+    
+    def stop_effect(self) -> None:
+        """Stop the running effect, if any."""
+        with self._effect_lock:
+            effect, self.effect = self.effect, None
+        if effect is not None:
+            effect.close()
+    
+    def render_effect(self) -> None:
+        """
+        Write the running effect's current frame; called by the render
+        thread. An effect that fails is stopped.
+        """
+        with self._effect_lock:
+            effect = self.effect
+            if effect is None:
+                return
+            try:
+                frame = effect.render(time.time())
+            except Exception:
+                self.effect = None
+                effect.close()
+                raise
+            # Hosted effects return None when no new frame is due
+            if frame is not None:
+                self.framebuffer.set_bytes(0, frame, self.effect_layer)
+    
+    def snapshot_state(self) -> Dict[str, Any]:
+        """Return the device state to persist across restarts."""
+        framebuffer = self.framebuffer
+        with framebuffer.changed:
+            state = {"frame": framebuffer.data.hex()}
+            if framebuffer.layers:
+                state["layers"] = framebuffer.layers.snapshot()
+        effect = self.effect
+        if effect is not None:
+            state["effect"] = dict(effect.describe(), layer=self.effect_layer)
+        return state
+    
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        """Restore state saved by snapshot_state()."""
+        frame = bytes.fromhex(state["frame"])
+        if len(frame) != len(self.framebuffer.data):
+            raise ValueError(f"Saved frame has {len(frame) // 3} pixels, device has {self.framebuffer.pixels}")
+        self.framebuffer.set_bytes(0, frame)
+        if state.get("layers"):
+            with self.framebuffer.changed:
+                self.framebuffer._layer_stack().restore(state["layers"])
+                self.framebuffer._touch()
+        if state.get("effect"):
+            effect = state["effect"]
+            self.start_effect(effect["effect"], effect["params"], effect.get("layer"))
+    
+    @abstractmethod
+    def show(self, frame: bytearray) -> None:
+        """
+        Push a full 8-bit RGB frame to the device. The renderer reuses the
+        buffer for the next frame, so copy it rather than keep it.
+        """
+        pass
+
+class RGBTreeController(PixelDeviceController):
     """Controller for the RGB Christmas Tree."""
     
-    def __init__(self):
+    USES_SPI = True
+    
+    def __init__(self, pixels: int = DEFAULT_PIXELS, transport: str = DEFAULT_SPI_TRANSPORT,
+                 pins: Tuple[int, int] = DEFAULT_SPI_PINS):
+        super().__init__(pixels)
+        self.transport = transport
+        self.pins = pins
         self.tree = None
     
     def initialize(self) -> None:
-        """Initialize the RGB tree."""
-        self.tree = RGBXmasTree()
-        logger.info("RGB Tree initialized")
+        """Initialize the RGB tree, starting from the current (possibly restored) frame."""
+        # Imported here so gpiozero loads on the render thread, after the server is listening
+        from tree import RGBXmasTree
+        frame, _ = self.framebuffer.snapshot()
+        self.tree = RGBXmasTree(pixels=self.framebuffer.pixels, value=self._tree_value(frame),
+                                mosi_pin=self.pins[0], clock_pin=self.pins[1], transport=self.transport)
+        logger.info(f"RGB Tree initialized ({self.tree.transport} transport)")
     
-    def process_command(self, command: Dict[str, Any]) -> None:
-        """Process a command for the RGB tree."""
-        try:
-            if command["type"] == "set_pixel":
-                pixel = command["pixel"]
-                color = command["color"]
-                self.tree[pixel].color = color
-            elif command["type"] == "set_all":
-                color = command["color"]
-                self.tree.color = color
-            elif command["type"] == "off":
-                self.tree.off()
-            else:
-                raise ValueError(f"Unknown command type: {command['type']}")
-        except (KeyError, ValueError, IndexError) as e:
-            logger.error(f"Error processing command: {e}")
-            raise
+    @staticmethod
+    def _tree_value(frame: bytes) -> tuple:
+        levels = LEVELS
+        return tuple(
+            (levels[frame[i]], levels[frame[i + 1]], levels[frame[i + 2]])
+            for i in range(0, len(frame), 3)
+        )
+    
+    def show(self, frame: bytearray) -> None:
+        """Send the frame to the tree in a single SPI transfer from the driver's reused buffer."""
+        self.tree.show_frame(frame)
     
     def cleanup(self) -> None:
         """Clean up the RGB tree."""
@@ -79,53 +559,787 @@ class RGBTreeController(DeviceController):
             self.tree.close()
             logger.info("RGB Tree cleaned up")
 
+class FastTreeController(PixelDeviceController):
+    """Controller for the RGB Christmas Tree using the FastRGBChristmasTree driver."""
+    
+    BRIGHTNESS = 15  # Driver brightness (0-30), matching RGBXmasTree's default of 0.5
+    USES_SPI = True
+    
+    def __init__(self, pixels: int = DEFAULT_PIXELS, transport: str = DEFAULT_SPI_TRANSPORT,
+                 pins: Tuple[int, int] = DEFAULT_SPI_PINS):
+        if pixels != DEFAULT_PIXELS:
+            raise ValueError(f"fast_tree has exactly {DEFAULT_PIXELS} pixels")
+        super().__init__(pixels)
+        self.transport = transport
+        self.pins = pins
+        self.tree = None
+        self._frame = bytearray(pixels * 3)
+        self._colors = None  # pixels x 3 NumPy view of _frame
+    
+    def initialize(self) -> None:
+        """Initialize the tree driver (imports NumPy lazily)."""
+        from fasttree import FastRGBChristmasTree
+        from numpy import frombuffer, uint8
+        self.tree = FastRGBChristmasTree(brightness=self.BRIGHTNESS, transport=self.transport,
+                                         mosi_pin=self.pins[0], clock_pin=self.pins[1])
+        self._colors = frombuffer(self._frame, dtype=uint8).reshape(-1, 3)
+        logger.info(f"Fast RGB Tree initialized ({self.tree.transport} transport)")
+    
+    def show(self, frame: bytearray) -> None:
+        """
+        Update the driver buffer in one vectorized write and send it in a
+        single SPI transfer. The frame goes through a staging buffer with a
+        NumPy view built once, so no array objects are created per frame.
+        """
+        self._frame[:] = frame
+        self.tree.colors[:] = self._colors
+        self.tree.commit()
+    
+    def cleanup(self) -> None:
+        """Clean up the tree."""
+        if self.tree:
+            self.tree.off()
+            self.tree.close()
+            logger.info("Fast RGB Tree cleaned up")
+
+class VirtualController(PixelDeviceController):
+    """Framebuffer-only device with no hardware, for development and testing."""
+    
+    def __init__(self, pixels: int = DEFAULT_PIXELS):
+        super().__init__(pixels)
+        self.frame = bytearray(pixels * 3)
+    
+    def initialize(self) -> None:
+        """Initialize the virtual device."""
+        logger.info(f"Virtual device initialized with {self.framebuffer.pixels} pixels")
+    
+    def show(self, frame: bytearray) -> None:
+        """Keep the last frame that would have been sent to hardware."""
+        self.frame[:] = frame
+    
+    def cleanup(self) -> None:
+        """Clean up the virtual device."""
+        self.frame[:] = bytes(len(self.frame))
+
+class DryRunController(VirtualController):
+    """Virtual device that checks effects without starting them, for validating timelines."""
+    
+    def start_effect(self, name: str, params: Dict[str, Any], layer: Optional[str] = None) -> None:
+        from effects import check_effect
+        from geometry import load_geometry
+        if self.geometry is None:
+            self.geometry = load_geometry(self.framebuffer.pixels)
+        check_effect(name, self.geometry, params)
+        self.effect_layer = layer
+
+CONTROLLER_TYPES = {
+    "rgb_tree": RGBTreeController,
+    "fast_tree": FastTreeController,
+    "virtual": VirtualController,
+}
+
+class DeviceRenderer(threading.Thread):
+    """
+    Per-device thread that flushes framebuffer changes to the device and
+    applies commands scheduled for a presentation time. Scheduled commands
+    wait in a small jitter buffer ordered by timestamp, and all commands due
+    at the same tick are applied before a single frame is shown.
+    """
+    
+    def __init__(self, device_id: str, controller: PixelDeviceController, tracer: Optional[Tracer] = None,
+                 collector: Optional[CollectorTuning] = None):
+        super().__init__(name=f"render-{device_id}", daemon=True)
+        self.device_id = device_id
+        self.controller = controller
+        self.tracer = tracer
+        self.collector = collector or CollectorTuning()
+        self.running = False
+        self.frames_shown = 0
+        self.late_commands = 0
+        self.first_frame_at: Optional[float] = None
+        self.error: Optional[str] = None  # Why the device failed to initialize
+        self.shared_frame = None  # SharedFrame written by a local producer
+        self.shared_frames = 0
+        self._shared_sequence = 0
+        self._next_effect_at = 0.0
+        # Input-to-output latency of effects fed by live input, such as audio
+        self.effect_latency: deque = deque(maxlen=LATENCY_WINDOW)
+        self._input_time: Optional[float] = None
+        self.pending: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._sequence = itertools.count()
+        self.timeline = None  # Timeline uploaded by a client, played on the monotonic clock
+        self.frame = bytearray(controller.framebuffer.pixels * 3)  # Output frame, reused every tick
+        self._lock = threading.Lock()
+    
+    def schedule(self, at: float, command: Dict[str, Any]) -> bool:
+        """
+        Buffer a command until the wall clock reaches at (time.time() seconds).
+        Returns False if the time has already passed, in which case the
+        caller should apply the command immediately.
+        """
+        delay = at - time.time()
+        if delay <= 0:
+            self.late_commands += 1
+            return False
+        if delay > MAX_SCHEDULE_AHEAD:
+            raise CommandError(f"Presentation time is more than {MAX_SCHEDULE_AHEAD}s ahead")
+        with self._lock:
+            if len(self.pending) >= JITTER_BUFFER_SIZE:
+                raise CommandError("Jitter buffer full")
+            heapq.heappush(self.pending, (at, next(self._sequence), command))
+        if TRACE_FIELD in command:
+            command[TRACE_FIELD].scheduled = True
+        self.controller.framebuffer.wake()
+        return True
+    
+    def _apply_due(self) -> float:
+        """Apply due scheduled commands; return seconds until the next one."""
+        while True:
+            with self._lock:
+                if not self.pending:
+                    return RENDER_POLL_INTERVAL
+                delay = self.pending[0][0] - time.time()
+                if delay > 0:
+                    return min(delay, RENDER_POLL_INTERVAL)
+                _, _, command = heapq.heappop(self.pending)
+            try:
+                self.controller.process_command(command)
+            except Exception as e:
+                logger.error(f"Error applying scheduled command on {self.device_id}: {e}")
+                if TRACE_FIELD in command and self.tracer is not None:
+                    self.tracer.finish(command[TRACE_FIELD])
+    
+    def play_timeline(self, timeline) -> None:
+        """Replace any timeline with a started one."""
+        with self._lock:
+            self.timeline = timeline
+        self.controller.framebuffer.wake()
+    
+    def control_timeline(self, action: str, position: Optional[float] = None) -> Dict[str, Any]:
+        """Pause, resume, seek, stop or query the timeline; return its status."""
+        now = time.monotonic()
+        with self._lock:
+            timeline = self.timeline
+            if timeline is None:
+                raise CommandError(f"No timeline on {self.device_id}")
+            if action == "pause":
+                timeline.pause(now)
+            elif action == "resume":
+                # Running fades continue where they were frozen
+                self.controller.delay_transitions(timeline.resume(now))
+            elif action == "seek":
+                if type(position) not in (int, float):
+                    raise CommandError(f"position must be a number: {position!r}")
+                timeline.seek(now, position)
+            elif action == "stop":
+                self.timeline = None
+            elif action != "status":
+                raise CommandError(f"Unknown timeline action: {action}")
+            status = timeline.status(now)
+        if action == "stop":
+            status["state"] = "stopped"
+        self.controller.framebuffer.wake()
+        return status
+    
+    @property
+    def paused(self) -> bool:
+        timeline = self.timeline
+        return timeline is not None and timeline.paused_at is not None
+    
+    def _advance_timeline(self) -> float:
+        """Apply timeline steps that are due; return seconds until the next one."""
+        now = time.monotonic()
+        with self._lock:
+            timeline = self.timeline
+            if timeline is None:
+                return RENDER_POLL_INTERVAL
+            due = timeline.advance(now)
+            delay = timeline.next_delay(now)
+        for commands, elapsed in due:
+            applied_at = time.monotonic()
+            for command in commands:
+                try:
+                    self.controller.process_command(command)
+                except Exception as e:
+                    logger.error(f"Error applying timeline command on {self.device_id}: {e}")
+            # A step entered part-way, after a seek or a stall, starts its fades part-way too
+            if elapsed > 0 and self.controller.transitions:
+                self.controller.delay_transitions(-elapsed, applied_at)
+        return RENDER_POLL_INTERVAL if delay is None else min(max(delay, 0.0), RENDER_POLL_INTERVAL)
+    
+    def _finish_traces(self, version: int, rendered: float, shown: float) -> None:
+        """Complete traces whose command is in the shown frame, or that waited too long for one."""
+        traced = self.controller.traced
+        while traced:
+            trace = traced[0]
+            if trace.version <= version:
+                trace.rendered = rendered
+                trace.shown = shown
+            elif shown - trace.applied < TRACE_TIMEOUT:
+                break
+            traced.popleft()
+            if self.tracer is not None:
+                self.tracer.finish(trace)
+    
+    def _poll_shared_frame(self) -> None:
+        """Copy a new frame from the shared-memory producer into the framebuffer."""
+        frame, self._shared_sequence = self.shared_frame.read(self._shared_sequence)
+        if frame is not None:
+            self.controller.framebuffer.set_bytes(0, frame)
+            self.shared_frames += 1
+    
+    def _tick_effect(self) -> float:
+        """Render effect and transition frames if due; return seconds until the next."""
+        now = time.monotonic()
+        if now >= self._next_effect_at:
+            if self.controller.transitions:
+                self.controller.render_transitions()
+            try:
+                self.controller.render_effect()
+                # Monotonic arrival time of the input the frame was rendered from
+                self._input_time = getattr(self.controller.effect, "input_time", None)
+            except Exception as e:
+                logger.error(f"Error rendering effect on {self.device_id}: {e}")
+            self._next_effect_at = now + EFFECT_FRAME_INTERVAL
+        return self._next_effect_at - now
+    
+    def run(self) -> None:
+        # Drivers initialize here so a slow import or bus setup never delays
+        # the server or other devices
+        try:
+            self.controller.initialize()
+        except Exception as e:
+            logger.error(f"Could not initialize device {self.device_id}: {e}")
+            # Commands to the device are rejected from now on, and stats report why
+            self.error = str(e) or type(e).__name__
+            return
+        framebuffer = self.controller.framebuffer
+        version = -1
+        while self.running:
+            timeout = self._apply_due()
+            if self.timeline is not None:
+                timeout = min(timeout, self._advance_timeline())
+            if self.shared_frame:
+                self._poll_shared_frame()
+                timeout = min(timeout, SHARED_FRAME_POLL_INTERVAL)
+            # A paused timeline freezes its effects and fades on the current frame
+            controller = self.controller
+            animating = (controller.effect is not None or bool(controller.transitions)) and not self.paused
+            if animating:
+                timeout = min(timeout, self._tick_effect())
+            timeline = self.timeline
+            self.collector.set_playing(self.device_id,
+                                       animating or (timeline is not None and not timeline.finished))
+            # Frames written while show() is busy coalesce into the next one
+            frame, version = framebuffer.wait_for_change(version, timeout, self.frame)
+            if frame is None:
+                if self.controller.traced:
+                    # A traced command that changed nothing is completed without a frame
+                    now = time.time()
+                    self._finish_traces(version, now, now)
+                continue
+            try:
+                rendered = time.time() if self.controller.traced else 0.0
+                self.controller.show(frame)
+                self.frames_shown += 1
+                if self.controller.traced:
+                    self._finish_traces(version, rendered, time.time())
+                if self._input_time is not None:
+                    self.effect_latency.append(time.monotonic() - self._input_time)
+                    self._input_time = None
+                # Any collection due runs now, with the whole frame interval ahead
+                self.collector.after_frame()
+                if self.first_frame_at is None:
+                    self.first_frame_at = time.monotonic()
+                    logger.info(f"First frame on {self.device_id} "
+                                f"{(self.first_frame_at - STARTED_AT) * 1000:.0f} ms after start")
+                    # The driver is loaded now; its objects are long-lived too
+                    self.collector.freeze()
+            except Exception as e:
+                logger.error(f"Error rendering device {self.device_id}: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return render counters for the stats command."""
+        first_frame = None if self.first_frame_at is None else self.first_frame_at - STARTED_AT
+        latency = sorted(self.effect_latency)
+        if latency:
+            effect_latency = {
+                "p50": latency[len(latency) // 2] * 1000,
+                "p99": latency[int(len(latency) * 0.99)] * 1000,
+                "max": latency[-1] * 1000,
+            }
+        else:
+            effect_latency = None
+        return {
+            "error": self.error,
+            "frames_shown": self.frames_shown,
+            "late_commands": self.late_commands,
+            "scheduled": len(self.pending),
+            "first_frame": first_frame,
+            "shared_frames": self.shared_frames,
+            "effect": self.controller.effect.name if self.controller.effect else None,
+            "effect_missed": self.controller.effect.missed if self.controller.effect else 0,
+            "effect_latency_ms": effect_latency,
+            "transitions": len(self.controller.transitions),
+            "timeline": self.timeline.status(time.monotonic())["state"] if self.timeline else None,
+        }
+    
+    def start(self) -> None:
+        self.running = True
+        super().start()
+    
+    def stop(self) -> None:
+        self.running = False
+        self.controller.framebuffer.wake()
+        if self.is_alive():
+            self.join()
+
+class DeviceRegistry:
+    """Named device controllers hosted by one server, each with its own renderer."""
+    
+    def __init__(self, tracer: Optional[Tracer] = None, collector: Optional[CollectorTuning] = None):
+        self.controllers: Dict[str, DeviceController] = {}
+        self.renderers: Dict[str, DeviceRenderer] = {}
+        self.default_id: Optional[str] = None
+        self.tracer = tracer
+        self.collector = collector
+    
+    def add(self, device_id: str, controller: DeviceController) -> None:
+        """Register a controller under a device ID."""
+        if device_id in self.controllers:
+            raise ValueError(f"Duplicate device ID: {device_id}")
+        self.controllers[device_id] = controller
+        if self.default_id is None:
+            self.default_id = device_id
+    
+    def get(self, device_id: Optional[str] = None) -> DeviceController:
+        """
+        Look up a controller; None selects the default (first) device. A
+        device whose driver failed to initialize is an error.
+        """
+        if device_id is None:
+            device_id = self.default_id
+        elif type(device_id) is not str:
+            raise CommandError(f"device must be a string: {device_id!r}")
+        try:
+            controller = self.controllers[device_id]
+        except KeyError:
+            raise CommandError(f"Unknown device: {device_id}") from None
+        renderer = self.renderers.get(device_id)
+        if renderer is not None and renderer.error is not None:
+            raise CommandError(f"Device {device_id} failed to initialize: {renderer.error}")
+        return controller
+    
+    def __iter__(self) -> Iterator[Tuple[str, DeviceController]]:
+        return iter(self.controllers.items())
+    
+    def __len__(self) -> int:
+        return len(self.controllers)
+    
+    def start(self) -> None:
+        """
+        Start devices. Pixel devices initialize in the background on their
+        own render thread; other devices initialize immediately.
+        """
+        for device_id, controller in self:
+            if isinstance(controller, PixelDeviceController):
+                renderer = DeviceRenderer(device_id, controller, self.tracer, self.collector)
+                renderer.start()
+                self.renderers[device_id] = renderer
+            else:
+                controller.initialize()
+    
+    def stop(self) -> None:
+        """Stop render threads and clean up every device."""
+        for renderer in self.renderers.values():
+            renderer.stop()
+        self.renderers.clear()
+        for device_id, controller in self:
+            if isinstance(controller, PixelDeviceController):
+                controller.stop_effect()
+            try:
+                controller.cleanup()
+            except Exception as e:
+                logger.error(f"Error cleaning up device {device_id}: {e}")
+
+class CommandStream:
+    """
+    Splits a client byte stream into JSON commands. Commands may be
+    newline-delimited or sent back to back, and may span several reads.
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")("replace")
+    
+    def feed(self, data: bytes) -> None:
+        """Append newly received bytes."""
+        self.buffer += self._utf8.decode(data)
+    
+    def next_command(self) -> Optional[Any]:
+        """
+        Return the next complete command, or None if more data is needed.
+        Raises json.JSONDecodeError for malformed input, which is discarded.
+        """
+        buffer = self.buffer.lstrip()
+        if not buffer:
+            self.buffer = ""
+            return None
+        try:
+            command, end = self._decoder.raw_decode(buffer)
+        except json.JSONDecodeError as e:
+            # A read can also end inside a number or literal, such as "0." or "tr"
+            tail = buffer[e.pos:]
+            incomplete = (e.pos >= len(buffer) or e.msg.startswith("Unterminated string")
+                          or not any(c in tail for c in " \t\r\n,:]}"))
+            if incomplete and len(buffer) <= MAX_COMMAND_SIZE:
+                self.buffer = buffer
+                return None
+            # Discard the malformed message up to the next line break
+            _, _, self.buffer = buffer.partition("\n")
+            raise
+        self.buffer = buffer[end:]
+        return command
+
+def _from_hex(data: Any) -> bytes:
+    try:
+        return bytes.fromhex(data)
+    except (TypeError, ValueError):
+        raise CommandError("data must be a hex string") from None
+
+def _duration(value: Any) -> float:
+    if type(value) not in (int, float) or not 0 <= value <= MAX_TRANSITION_DURATION:
+        raise CommandError(f"duration must be a number of seconds up to {MAX_TRANSITION_DURATION}: {value!r}")
+    return float(value)
+
+def parse_devices(spec: str) -> Dict[str, Tuple[str, int]]:
+    """
+    Parse a device list such as "tree=rgb_tree,strip=virtual:60" into
+    {device_id: (device_type, pixels)}.
+    """
+    devices = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        device_id, sep, device_type = entry.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid device entry (expected id=type): {entry}")
+        device_id = device_id.strip()
+        if device_id in devices:
+            raise ValueError(f"Device {device_id} is configured twice: {spec}")
+        device_type, _, pixels = device_type.partition(":")
+        devices[device_id] = (device_type.strip(), int(pixels) if pixels else DEFAULT_PIXELS)
+    if not devices:
+        raise ValueError("No devices configured")
+    return devices
+
 class NetworkServer:
     """Generic network server for device control."""
     
-    def __init__(self, host: str, port: int, device_type: str):
+    def __init__(self, host: str, port: int, devices: Dict[str, Tuple[str, int]],
+                 state_file: Optional[str] = None, save_interval: float = DEFAULT_SAVE_INTERVAL,
+                 rate_limit: float = DEFAULT_RATE_LIMIT, rate_burst: float = DEFAULT_RATE_BURST,
+                 ws_port: Optional[int] = None, unix_socket: Optional[str] = None,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 keepalive_idle: float = DEFAULT_KEEPALIVE_IDLE, gc_tuning: str = DEFAULT_GC_TUNING,
+                 spi_transport: str = DEFAULT_SPI_TRANSPORT, spi_pins: Tuple[int, int] = DEFAULT_SPI_PINS):
         self.host = host
         self.port = port
-        self.device_type = device_type
-        self.controller = self._create_controller()
+        self.ws_port = ws_port
+        self.gateway = None
+        self.unix_socket = unix_socket
+        self._unix_listener = None
+        self._shared_frames = []
+        if spi_transport not in SPI_TRANSPORTS:
+            raise ValueError(f"SPI transport must be one of {', '.join(SPI_TRANSPORTS)}: {spi_transport}")
+        self.spi_transport = spi_transport
+        self.spi_pins = spi_pins
+        self.tracer = Tracer()
+        self.collector = CollectorTuning(gc_tuning)
+        self.devices = DeviceRegistry(self.tracer, self.collector)
+        for device_id, (device_type, pixels) in devices.items():
+            self.devices.add(device_id, self._create_controller(device_type, pixels))
+        self.persister = None
+        if state_file:
+            self.persister = StatePersister(StateStore(state_file), self.devices, save_interval)
+        self.scheduler = CommandScheduler(self.execute, rate_limit, rate_burst,
+                                          idle_timeout, read_timeout, keepalive_idle)
         self.running = False
+        self.ready = threading.Event()
+        # Commands answered by the server itself rather than a device
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Union[Dict[str, Any], bytes]]] = {
+            "ping": self._ping,
+            "stats": lambda command: self._stats(),
+            "shared_frame": self._shared_frame,
+            "get_state": self._get_state,
+            "timeline": self._timeline,
+            "traces": self._traces,
+        }
 
-    def _create_controller(self) -> DeviceController:
+    def _create_controller(self, device_type: str, pixels: int = DEFAULT_PIXELS) -> DeviceController:
         """Create the appropriate device controller."""
-        if self.device_type == "rgb_tree":
-            return RGBTreeController()
+        try:
+            controller_class = CONTROLLER_TYPES[device_type]
+        except KeyError:
+            raise ValueError(f"Unknown device type: {device_type}") from None
+        if getattr(controller_class, "USES_SPI", False):
+            return controller_class(pixels, self.spi_transport, self.spi_pins)
+        return controller_class(pixels)
+    
+    def check_transport(self) -> None:
+        """
+        Raise ValueError if the SPI transport cannot run on the configured
+        pins, so a bad setting stops the server before it accepts commands.
+        """
+        if any(getattr(controller, "USES_SPI", False) for _, controller in self.devices):
+            transport = choose_transport(self.spi_transport, *self.spi_pins)
+            logger.info(f"SPI transport {transport} on GPIO{self.spi_pins[0]}/GPIO{self.spi_pins[1]}")
+    
+    def process_command(self, command: Dict[str, Any]) -> Union[Dict[str, Any], bytes, None]:
+        """
+        Route a command to the device named by its optional "device" field.
+        Returns a reply (a message, or pre-encoded bytes) for commands that
+        produce one, otherwise None.
+        """
+        if type(command) is not dict or type(command.get("type")) is not str:
+            raise CommandError("Command must be a JSON object with a string type")
+        handler = self.handlers.get(command["type"])
+        if handler is not None:
+            return handler(command)
+        device_id = command.get("device")
+        controller = self.devices.get(device_id)
+        # Commands may carry a presentation time so that clients, twins and
+        # nodes all change together despite network jitter
+        at = command.get("at")
+        if at is not None:
+            renderer = self.devices.renderers.get(device_id or self.devices.default_id)
+            if command["type"] not in getattr(controller, "handlers", ()):
+                raise CommandError(f"Unknown command type: {command['type']}")
+            if type(at) not in (int, float):
+                raise CommandError(f"at must be a number: {at!r}")
+            if isinstance(controller, PixelDeviceController) and at > time.time():
+                # Rejected now, while the sender can still be told
+                self._check_scheduled(controller, command)
+            if renderer is not None and renderer.schedule(at, command):
+                return None
+        controller.process_command(command)
+        return None
+    
+    def _shared_frame(self, command: Dict[str, Any]) -> Dict[str, Any]:
+        device_id = command.get("device")
+        renderer = self.devices.renderers.get(device_id or self.devices.default_id)
+        if renderer is None or renderer.shared_frame is None:
+            raise CommandError(f"No shared frame for device: {device_id}")
+        return {"type": "shared_frame", "name": renderer.shared_frame.name,
+                "pixels": renderer.shared_frame.pixels}
+    
+    def _get_state(self, command: Dict[str, Any]) -> bytes:
+        device_id = command.get("device")
+        controller = self.devices.get(device_id)
+        if not isinstance(controller, PixelDeviceController):
+            raise CommandError(f"Device has no framebuffer: {device_id}")
+        return controller.framebuffer.encode_state(command.get("format", "json"))
+    
+    def _timeline(self, command: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Upload and play a timeline ("steps", optional "loop", "position" and
+        wall-clock "at"), or pause, resume, seek, stop or query the current one.
+        """
+        device_id = command.get("device")
+        self.devices.get(device_id)
+        renderer = self.devices.renderers.get(device_id or self.devices.default_id)
+        if renderer is None:
+            raise CommandError(f"Unknown device: {device_id}")
+        action = command.get("action", "play")
+        if action != "play":
+            return dict(renderer.control_timeline(action, command.get("position")), type="timeline")
+        from timeline import Timeline, parse_steps
+        timeline = Timeline(parse_steps(command.get("steps"), MAX_TRANSITION_DURATION),
+                            bool(command.get("loop", False)))
+        self._check_timeline(renderer.controller, timeline)
+        now = time.monotonic()
+        at = command.get("at")
+        if at is not None:
+            if type(at) not in (int, float) or at - time.time() > MAX_SCHEDULE_AHEAD:
+                raise CommandError(f"at must be a wall-clock time at most {MAX_SCHEDULE_AHEAD}s ahead: {at!r}")
+            # Nodes given the same at start their timelines together
+            start = now + (at - time.time())
         else:
-            raise ValueError(f"Unknown device type: {self.device_type}")
+            start = now
+        position = command.get("position", 0)
+        if type(position) not in (int, float):
+            raise CommandError(f"position must be a number: {position!r}")
+        timeline.start(start, position)
+        renderer.play_timeline(timeline)
+        logger.info(f"Timeline of {len(timeline.holds)} steps ({timeline.length:.1f} s) "
+                    f"playing on {renderer.device_id}")
+        return dict(timeline.status(now), type="timeline")
+    
+    @staticmethod
+    def _scratch(controller: PixelDeviceController) -> "DryRunController":
+        """A dry-run copy of a device's layers, to apply commands to without effect."""
+        scratch = DryRunController(controller.framebuffer.pixels)
+        scratch.geometry = controller.geometry
+        if controller.framebuffer.layers:
+            scratch.framebuffer._layer_stack().restore(controller.framebuffer.layers.snapshot())
+        return scratch
+    
+    def _check_scheduled(self, controller: PixelDeviceController, command: Dict[str, Any]) -> None:
+        """Apply a command to a scratch device, so bad arguments are rejected before it is buffered."""
+        scratch = self._scratch(controller)
+        try:
+            scratch.process_command({k: v for k, v in command.items() if k != TRACE_FIELD})
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise CommandError(str(e)) from None
+    
+    def _check_timeline(self, controller: DeviceController, timeline) -> None:
+        """Apply every step to a scratch device, so a bad command is rejected at upload."""
+        if not isinstance(controller, PixelDeviceController):
+            raise CommandError("Device cannot play timelines")
+        scratch = self._scratch(controller)
+        for number, commands in enumerate(timeline.commands):
+            for command in commands:
+                try:
+                    scratch.process_command(command)
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    raise CommandError(f"Step {number}: {e}") from None
+    
+    def _traces(self, command: Dict[str, Any]) -> Dict[str, Any]:
+        """Drain completed latency traces, oldest first."""
+        traces = self.tracer.drain()
+        return {"type": "traces", "traces": traces, "remaining": len(self.tracer.completed),
+                "total": self.tracer.total, "now": time.time()}
+    
+    def execute(self, command: Dict[str, Any]) -> bytes:
+        """Process a command and encode its reply for the wire."""
+        trace = command.get(TRACE_FIELD) if type(command) is dict else None
+        if trace is None:
+            reply = self.process_command(command)
+        else:
+            trace.dequeued = time.time()
+            try:
+                reply = self.process_command(command)
+            finally:
+                # Rejected commands, and those that are not frame writes, end here
+                if trace.applied is None and not trace.scheduled:
+                    self.tracer.finish(trace)
+        if reply is None:
+            return b"OK\n"
+        if isinstance(reply, bytes):
+            return reply
+        return json.dumps(reply).encode() + b"\n"
+    
+    def _ping(self, command: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Clock-offset handshake. The client sends its clock as t0 and notes its
+        receive time t3; with the server's receive (t1) and send (t2) times,
+        offset = ((t1 - t0) + (t2 - t3)) / 2.
+        """
+        t1 = time.time()
+        return {"type": "pong", "t0": command.get("t0"), "t1": t1, "t2": time.time()}
+    
+    def _stats(self) -> Dict[str, Any]:
+        """Server and per-device counters."""
+        return {
+            "type": "stats",
+            "uptime": time.monotonic() - STARTED_AT,
+            "state_saves": self.persister.saves if self.persister else 0,
+            "connections": self.scheduler.gauges(),
+            "clients": self.scheduler.stats(),
+            "devices": {device_id: renderer.stats()
+                        for device_id, renderer in self.devices.renderers.items()},
+            "gc": self.collector.stats(),
+        }
     
     def handle_client(self, conn: socket.socket, addr: tuple) -> None:
-        """Handle communication with a single client."""
+        """
+        Read commands from a single client into its scheduler inbox. The
+        scheduler processes them and the session's writer sends the replies.
+        """
         with conn:
             logger.info(f"Connected by {addr}")
-            while self.running:
-                try:
-                    data = conn.recv(DEFAULT_BUFFER_SIZE).decode("utf-8")
+            session = self.scheduler.open_session(conn, addr)
+            stream = CommandStream()
+            # Raw data is logged only at debug level, so reads format nothing otherwise
+            debug = logger.isEnabledFor(logging.DEBUG)
+            try:
+                while self.running and not session.closed:
+                    data = conn.recv(DEFAULT_BUFFER_SIZE)
                     if not data:
                         break
                     
-                    # Print every instruction received (raw data)
-                    print(f"[DEBUG] Received from {addr}: {repr(data)}")
-                    # Parse the command
-                    command = json.loads(data)
-                    self.controller.process_command(command)
-                    
-                    # Send acknowledgment
-                    conn.sendall(b"OK\n")
-                except json.JSONDecodeError:
-                    logger.error(f"Invalid JSON from {addr}")
-                    conn.sendall(b"ERROR: Invalid JSON format\n")
-                except Exception as e:
-                    logger.error(f"Error handling client {addr}: {e}")
-                    conn.sendall(f"ERROR: {str(e)}\n".encode())
-                    break
+                    if debug:
+                        logger.debug(f"Received from {addr}: {data!r}")
+                    stream.feed(data)
+                    while True:
+                        # Parse the next command
+                        try:
+                            command = stream.next_command()
+                        except json.JSONDecodeError:
+                            logger.debug(f"Invalid JSON from {addr}")
+                            command = INVALID_JSON
+                        if command is None:
+                            break
+                        self.scheduler.submit(session, command)
+                    session.touch(partial=bool(stream.buffer))
+            except OSError as e:
+                logger.error(f"Error reading from client {addr}: {e}")
+                session.abort("dead")
+            finally:
+                self.scheduler.close_session(session)
+                logger.info(f"Disconnected {addr}")
+    
+    def _start_local_transport(self) -> None:
+        """
+        Serve the protocol on a Unix socket and give every pixel device a
+        shared-memory frame for producers running on the same machine.
+        """
+        from shared_frame import SharedFrame
+        for device_id, renderer in self.devices.renderers.items():
+            name = f"piserver-{os.getpid()}-{device_id}"
+            renderer.shared_frame = SharedFrame(name, renderer.controller.framebuffer.pixels)
+            self._shared_frames.append(renderer.shared_frame)
+            # Shorten the render thread's current wait to the poll interval
+            renderer.controller.framebuffer.wake()
+        if os.path.exists(self.unix_socket):
+            os.unlink(self.unix_socket)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.unix_socket)
+        listener.listen()
+        self._unix_listener = listener
+        threading.Thread(target=self._accept_unix, name="unix-listener", daemon=True).start()
+        logger.info(f"Local transport on {self.unix_socket}")
+    
+    def _accept_unix(self) -> None:
+        for connection_number in itertools.count(1):
+            try:
+                conn, _ = self._unix_listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.handle_client, args=(conn, ("unix", connection_number)),
+                             name=f"unix-client-{connection_number}", daemon=True).start()
+    
+    def _stop_local_transport(self) -> None:
+        if self._unix_listener:
+            self._unix_listener.close()
+            self._unix_listener = None
+            try:
+                os.unlink(self.unix_socket)
+            except OSError:
+                pass
+        for shared_frame in self._shared_frames:
+            shared_frame.close()
+        self._shared_frames.clear()
     
     def start(self) -> None:
         """Start the server."""
+        self.check_transport()
         self.running = True
-        self.controller.initialize()
+        # Restore saved state first so the very first frame is the right one
+        if self.persister:
+            self.persister.restore()
         
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             try:
@@ -133,11 +1347,27 @@ class NetworkServer:
                 s.bind((self.host, self.port))
                 s.listen()
                 logger.info(f"Server started on {self.host}:{self.port}")
+                # Bind before loading drivers; commands only need the framebuffers
+                self.devices.start()
+                if self.unix_socket:
+                    self._start_local_transport()
+                if self.persister:
+                    self.persister.start()
+                self.scheduler.start()
+                if self.ws_port:
+                    from websocket_gateway import WebSocketGateway
+                    self.gateway = WebSocketGateway(self.host, self.ws_port, self.scheduler, self.devices)
+                    self.gateway.start()
+                self.collector.freeze()
+                self.ready.set()
                 
                 while self.running:
                     try:
                         conn, addr = s.accept()
-                        self.handle_client(conn, addr)
+                        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                        tune_keepalive(conn, self.scheduler.keepalive_idle)
+                        threading.Thread(target=self.handle_client, args=(conn, addr),
+                                         name=f"client-{addr}", daemon=True).start()
                     except KeyboardInterrupt:
                         break
                     except Exception as e:
@@ -148,7 +1378,14 @@ class NetworkServer:
     def cleanup(self) -> None:
         """Clean up server resources."""
         self.running = False
-        self.controller.cleanup()
+        if self.gateway:
+            self.gateway.stop()
+        self.scheduler.stop()
+        if self.persister:
+            self.persister.stop()
+        self.devices.stop()
+        # Shared frames go last, once no render thread reads them
+        self._stop_local_transport()
         logger.info("Server stopped")
 
 def main():
@@ -157,14 +1394,40 @@ def main():
     host = os.getenv("HOST", DEFAULT_HOST)
     port = int(os.getenv("PORT", DEFAULT_PORT))
     device_type = os.getenv("DEVICE_TYPE", DEFAULT_DEVICE_TYPE)
+    # DEVICES hosts several named devices, e.g. "left=rgb_tree,right=virtual:60"
+    device_spec = os.getenv("DEVICES", f"{DEFAULT_DEVICE_ID}={device_type}")
+    # An empty STATE_FILE disables persistence
+    state_file = os.getenv("STATE_FILE", DEFAULT_STATE_FILE)
+    save_interval = float(os.getenv("STATE_SAVE_INTERVAL", DEFAULT_SAVE_INTERVAL))
+    # Per-connection rate limit in commands per second (0 disables it)
+    rate_limit = float(os.getenv("RATE_LIMIT", DEFAULT_RATE_LIMIT))
+    rate_burst = float(os.getenv("RATE_BURST", DEFAULT_RATE_BURST))
+    # WS_PORT enables the WebSocket gateway for browser twins
+    ws_port = int(os.getenv("WS_PORT", "0")) or None
+    # UNIX_SOCKET enables the local transport, e.g. /tmp/piserver.sock
+    unix_socket = os.getenv("UNIX_SOCKET") or None
+    # Dead-connection reclamation, in seconds (0 disables each)
+    idle_timeout = float(os.getenv("IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT))
+    read_timeout = float(os.getenv("READ_TIMEOUT", DEFAULT_READ_TIMEOUT))
+    keepalive_idle = float(os.getenv("KEEPALIVE_IDLE", DEFAULT_KEEPALIVE_IDLE))
+    # GC_TUNING keeps garbage collection pauses out of shows: off, freeze or show
+    gc_tuning = os.getenv("GC_TUNING", DEFAULT_GC_TUNING)
+    # SPI_TRANSPORT picks how frames reach the tree: auto, spidev, bitbang or gpiozero
+    spi_transport = os.getenv("SPI_TRANSPORT", DEFAULT_SPI_TRANSPORT)
+    # SPI_PINS is the tree's data and clock GPIO, e.g. "10,11" for hardware SPI
+    spi_pins = os.getenv("SPI_PINS")
     
     try:
-        server = NetworkServer(host, port, device_type)
+        server = NetworkServer(host, port, parse_devices(device_spec), state_file, save_interval,
+                               rate_limit, rate_burst, ws_port, unix_socket,
+                               idle_timeout, read_timeout, keepalive_idle, gc_tuning, spi_transport,
+                               parse_pins(spi_pins) if spi_pins else DEFAULT_SPI_PINS)
         server.start()
     except KeyboardInterrupt:
         logger.info("Server interrupted by user")
     except Exception as e:
         logger.error(f"Server error: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Shared-memory frames for producers running on the Pi itself.
+The server creates one shared-memory framebuffer per pixel device and
+announces it over its Unix socket. A local producer writes 8-bit RGB straight
+into it, and the device's render thread copies each new frame into the
+framebuffer, with no JSON or socket traffic per frame.
+
+Frames are guarded by a sequence counter (a seqlock): the producer makes it
+odd while writing and even when done, and the reader only takes a frame
+whose counter was even and unchanged across the copy. There must be at
+most one producer per device at a time.
+"""
+
+import json
+import socket
+import struct
+import sys
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterator, Optional, Tuple
+
+# Constants for default configuration
+DEFAULT_UNIX_SOCKET = "/tmp/piserver.sock"
+
+# Segment layout: sequence counter, pixel count, then 3 bytes per pixel
+HEADER = struct.Struct("=QI4x")
+SEQUENCE = struct.Struct("=Q")
+
+class SharedFrame:
+    """A shared-memory RGB frame with a sequence counter."""
+
+    def __init__(self, name: str, pixels: Optional[int] = None):
+        """Create the segment when pixels is given, otherwise attach to it."""
+        if pixels is not None:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=HEADER.size + pixels * 3)
+            HEADER.pack_into(self.shm.buf, 0, 0, pixels)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+            if sys.version_info < (3, 13):
+                # Otherwise the resource tracker unlinks the server's segment
+                # when this process exits
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            _, pixels = HEADER.unpack_from(self.shm.buf, 0)
+            self.owner = False
+        self.name = name
+        self.pixels = pixels
+        self.data = self.shm.buf[HEADER.size:HEADER.size + pixels * 3]
+        self.sequence = SEQUENCE.unpack_from(self.shm.buf, 0)[0]
+
+    def read(self, last: int) -> Tuple[Optional[bytes], int]:
+        """Return (frame, sequence) if a complete frame newer than last exists, else (None, last)."""
+        buf = self.shm.buf
+        before = SEQUENCE.unpack_from(buf, 0)[0]
+        if before == last or before & 1:
+            return None, last
+        frame = bytes(self.data)
+        if SEQUENCE.unpack_from(buf, 0)[0] != before:
+            # Overwritten mid-copy; the next poll picks up the newer frame
+            return None, last
+        return frame, before
+
+    @contextmanager
+    def write(self) -> Iterator[memoryview]:
+        """Yield the frame for in-place writing and publish it on exit."""
+        SEQUENCE.pack_into(self.shm.buf, 0, self.sequence + 1)
+        try:
+            yield self.data
+        finally:
+            self.sequence += 2
+            SEQUENCE.pack_into(self.shm.buf, 0, self.sequence)
+
+    def close(self) -> None:
+        """Detach, and remove the segment if this process created it."""
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class FrameProducer:
+    """
+    Client for local effect generators. Asks the server over its Unix socket
+    for a device's shared frame, then writes frames into it directly:
+
+        producer = FrameProducer()
+        with producer.frame() as rgb:
+            rgb[0:3] = bytes([255, 0, 0])
+
+    The frame is a writable memoryview, so numpy.frombuffer(rgb, numpy.uint8)
+    gives a zero-copy array over it.
+    """
+
+    def __init__(self, device: Optional[str] = None, path: str = DEFAULT_UNIX_SOCKET):
+        self.control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.control.connect(path)
+        self._reader = self.control.makefile("rb")
+        command = {"type": "shared_frame"}
+        if device is not None:
+            command["device"] = device
+        reply = self.send_command(command)
+        if reply.startswith("ERROR"):
+            raise ValueError(reply)
+        self.shared = SharedFrame(json.loads(reply)["name"])
+        self.pixels = self.shared.pixels
+
+    def send_command(self, command: dict) -> str:
+        """Send a regular JSON command over the Unix socket and return the reply line."""
+        self.control.sendall(json.dumps(command).encode() + b"\n")
+        return self._reader.readline().decode().strip()
+
+    def frame(self):
+        """Context manager yielding the shared frame; published on exit."""
+        return self.shared.write()
+
+    def write(self, rgb: bytes) -> None:
+        """Publish a complete frame of 8-bit RGB data."""
+        with self.shared.write() as frame:
+            frame[:] = rgb
+
+    def close(self) -> None:
+        """Detach from the shared frame and close the control connection."""
+        self.shared.close()
+        self._reader.close()
+        self.control.close()
+
+def main():
+    """Cycle the tree through red, green and blue, like loop.py, without owning the SPI bus."""
+    producer = FrameProducer()
+    try:
+        for color in ([255, 0, 0], [0, 255, 0], [0, 0, 255]):
+            producer.write(bytes(color) * producer.pixels)
+            time.sleep(1)
+    finally:
+        producer.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+SPI transports for the tree's APA102-style LEDs.
+The tree's HAT wires the LEDs' data and clock lines to GPIO12 and GPIO25.
+Those are not hardware SPI pins, so gpiozero falls back to software SPI,
+which makes several Python-level pin calls for every bit of a frame and
+caps the frame rate. A transport sends a whole frame in one call:
+
+- spidev: the kernel SPI driver, when the LEDs are wired to hardware SPI
+  pins (GPIO10/GPIO11 for SPI0, GPIO20/GPIO21 for SPI1)
+- bitbang: precomputed words written straight to the GPIO set and clear
+  registers through /dev/gpiomem (Pi Zero to Pi 4)
+- gpiozero: gpiozero's own software SPI, which works everywhere
+- auto: spidev on hardware SPI pins, else bitbang where the machine
+  allows it, else gpiozero
+"""
+
+import importlib.util
+import itertools
+import mmap
+import os
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_SPI_TRANSPORT = "auto"
+SPI_TRANSPORTS = ("auto", "spidev", "bitbang", "gpiozero")
+DEFAULT_SPI_SPEED = 8000000  # spidev clock in Hz; APA102 LEDs take up to about 20 MHz
+DEFAULT_SPI_PINS = (12, 25)  # Data (MOSI) and clock GPIO as wired on the tree's HAT
+GPIOMEM = "/dev/gpiomem"
+DEVICE_TREE_COMPATIBLE = "/proc/device-tree/compatible"
+
+# Hardware SPI bus for each (MOSI, SCLK) GPIO pair
+HARDWARE_SPI: Dict[Tuple[int, int], int] = {(10, 11): 0, (20, 21): 1}
+
+# SoCs whose GPIO block has the BCM2835 register layout; the Pi 5 (bcm2712) does not
+GPIOMEM_SOCS = (b"brcm,bcm2835", b"brcm,bcm2836", b"brcm,bcm2837", b"brcm,bcm2711")
+
+def parse_pins(spec: str) -> Tuple[int, int]:
+    """Parse a "data,clock" GPIO pair such as "10,11"."""
+    try:
+        mosi_pin, clock_pin = (int(pin) for pin in spec.split(","))
+    except ValueError:
+        raise ValueError(f"SPI pins must be two GPIO numbers, data then clock: {spec!r}") from None
+    return mosi_pin, clock_pin
+
+def spidev_available() -> bool:
+    """Whether the spidev module is installed, without importing it."""
+    return importlib.util.find_spec("spidev") is not None
+
+def gpiomem_supported() -> bool:
+    """Whether this process can map a BCM2835-family GPIO block from /dev/gpiomem."""
+    try:
+        with open(DEVICE_TREE_COMPATIBLE, "rb") as f:
+            compatible = f.read().split(b"\0")
+    except OSError:
+        return False
+    return any(soc in compatible for soc in GPIOMEM_SOCS) and os.access(GPIOMEM, os.R_OK | os.W_OK)
+
+class GpioRegisters:
+    """
+    The BCM2835-family GPIO block (Pi Zero to Pi 4) mapped from /dev/gpiomem,
+    as 32-bit words.
+    """
+
+    SIZE = 4096
+    FSEL = 0  # Function select words, 10 pins each, 3 bits per pin
+    SET = 7  # GPSET0: writing 1 bits drives those pins high
+    CLEAR = 10  # GPCLR0: writing 1 bits drives those pins low
+
+    def __init__(self, path: str = GPIOMEM):
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self._map = mmap.mmap(fd, self.SIZE)
+        finally:
+            os.close(fd)
+        self.words = memoryview(self._map).cast("I")
+
+    def set_function(self, pin: int, function: int) -> None:
+        """Set a pin's function: 0 input, 1 output."""
+        index, shift = self.FSEL + pin // 10, pin % 10 * 3
+        self.words[index] = self.words[index] & ~(7 << shift) | function << shift
+
+    def close(self) -> None:
+        self.words.release()
+        self._map.close()
+
+class BitBangTransport:
+    """
+    Software SPI (mode 0, most significant bit first) as direct register
+    writes. For each bit, the clock goes low together with a 0 data bit, a 1
+    data bit is raised, then the clock goes high. The writes for every byte
+    value are built once, so sending a frame is a single loop over (register,
+    word) pairs with no per-bit decisions or pin objects.
+    """
+
+    name = "bitbang"
+
+    def __init__(self, registers: GpioRegisters, mosi_pin: int, clock_pin: int):
+        self.registers = registers
+        self.pins = (mosi_pin, clock_pin)
+        mosi, clock = 1 << mosi_pin, 1 << clock_pin
+        self._idle = clock | mosi
+        self._writes = []
+        for value in range(256):
+            writes = []
+            for bit in range(7, -1, -1):
+                if value >> bit & 1:
+                    writes += [(registers.CLEAR, clock), (registers.SET, mosi)]
+                else:
+                    writes.append((registers.CLEAR, clock | mosi))
+                writes.append((registers.SET, clock))
+            self._writes.append(tuple(writes))
+        registers.words[registers.CLEAR] = self._idle
+        for pin in self.pins:
+            registers.set_function(pin, 1)
+
+    def transfer(self, data: Any) -> None:
+        """Clock out a buffer of bytes."""
+        words = self.registers.words
+        for index, word in itertools.chain.from_iterable(map(self._writes.__getitem__, data)):
+            words[index] = word
+        # Clock and data idle low between frames
+        words[self.registers.CLEAR] = self._idle
+
+    def close(self) -> None:
+        registers = self.registers
+        registers.words[registers.CLEAR] = self._idle
+        for pin in self.pins:
+            registers.set_function(pin, 0)
+        registers.close()
+
+class SpidevTransport:
+    """Hardware SPI through the kernel driver; a frame is one write system call."""
+
+    name = "spidev"
+
+    def __init__(self, device: Any):
+        self.device = device  # An open spidev.SpiDev
+
+    def transfer(self, data: Any) -> None:
+        # writebytes2 takes any buffer without converting it to a list, and splits long ones
+        self.device.writebytes2(data)
+
+    def close(self) -> None:
+        self.device.close()
+
+def choose_transport(kind: str, mosi_pin: int, clock_pin: int) -> str:
+    """
+    The transport to use for kind on these pins: spidev, bitbang or gpiozero.
+    An explicit choice the wiring or machine does not allow is an error.
+    """
+    if kind not in SPI_TRANSPORTS:
+        raise ValueError(f"SPI transport must be one of {', '.join(SPI_TRANSPORTS)}: {kind}")
+    bus = HARDWARE_SPI.get((mosi_pin, clock_pin))
+    if kind == "spidev":
+        if bus is None:
+            raise ValueError(f"GPIO{mosi_pin}/GPIO{clock_pin} are not hardware SPI pins; "
+                             f"spidev needs data on GPIO10 and clock on GPIO11 (or GPIO20/GPIO21)")
+        if not os.path.exists(f"/dev/spidev{bus}.0"):
+            raise ValueError(f"spidev needs /dev/spidev{bus}.0; enable SPI with raspi-config")
+        if not spidev_available():
+            raise ValueError("spidev is not installed (pip install spidev)")
+    if kind == "bitbang" and not gpiomem_supported():
+        raise ValueError(f"bitbang needs {GPIOMEM} on a Pi Zero to Pi 4")
+    if kind == "auto":
+        if bus is not None and os.path.exists(f"/dev/spidev{bus}.0") and spidev_available():
+            return "spidev"
+        return "bitbang" if gpiomem_supported() else "gpiozero"
+    return kind
+
+def open_transport(kind: str, mosi_pin: int, clock_pin: int,
+                   speed: int = DEFAULT_SPI_SPEED) -> Optional[Any]:
+    """
+    Open the spidev or bitbang transport on these pins, or return None for
+    gpiozero, whose software SPI the driver already has.
+    """
+    if kind == "spidev":
+        import spidev
+        device = spidev.SpiDev()
+        device.open(HARDWARE_SPI[(mosi_pin, clock_pin)], 0)
+        device.mode = 0
+        device.max_speed_hz = speed
+        return SpidevTransport(device)
+    if kind == "bitbang":
+        return BitBangTransport(GpioRegisters(), mosi_pin, clock_pin)
+    return None
@@ -0,0 +1,82 @@
+"""
+Shared test fixtures: the PiServer modules on the import path, and a live
+server on virtual devices, so no tree or GPIO is needed.
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+from typing import Any, Dict, Iterator
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import NetworkServer
+
+TIMEOUT = 5.0
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class Client:
+    """Sends commands over TCP and reads their replies, one at a time."""
+
+    def __init__(self, port: int):
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=TIMEOUT)
+        self.rfile = self.sock.makefile("rb")
+
+    def send(self, command: Dict[str, Any]) -> None:
+        self.sock.sendall(json.dumps(command).encode())
+
+    def request(self, command: Dict[str, Any]) -> bytes:
+        """Send a command and return its text reply, newline stripped."""
+        self.send(command)
+        return self.rfile.readline().rstrip(b"\n")
+
+    def query(self, command: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a command that answers with JSON and decode the reply."""
+        return json.loads(self.request(command))
+
+    def read(self, size: int) -> bytes:
+        return self.rfile.read(size)
+
+    def close(self) -> None:
+        self.rfile.close()
+        self.sock.close()
+
+def start_server(**options: Any) -> NetworkServer:
+    """Start a server on a free port with a 25-pixel virtual tree and a 10-pixel strip."""
+    devices = {"tree": ("virtual", 25), "strip": ("virtual", 10)}
+    server = NetworkServer("127.0.0.1", free_port(), devices, **options)
+    thread = threading.Thread(target=server.start, name="test-server", daemon=True)
+    thread.start()
+    if not server.ready.wait(TIMEOUT):
+        raise RuntimeError("Server did not start")
+    server.thread = thread
+    return server
+
+def stop_server(server: NetworkServer) -> None:
+    server.running = False
+    # Wake the accept loop so it sees running is False
+    try:
+        socket.create_connection(("127.0.0.1", server.port), timeout=TIMEOUT).close()
+    except OSError:
+        pass
+    server.thread.join(TIMEOUT)
+
+@pytest.fixture
+def server() -> Iterator[NetworkServer]:
+    server = start_server()
+    yield server
+    stop_server(server)
+
+@pytest.fixture
+def client(server: NetworkServer) -> Iterator[Client]:
+    client = Client(server.port)
+    yield client
+    client.close()
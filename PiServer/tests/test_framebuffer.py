@@ -0,0 +1,103 @@
+"""Framebuffer validation and change notification, the device list, and device routing on a live server."""
+
+import time
+
+import pytest
+
+from server import CommandError, Framebuffer, parse_devices
+
+def test_to_rgb8_scales_to_8_bits():
+    assert Framebuffer.to_rgb8([1.0, 0.5, 0.0]) == (255, 127, 0)
+
+@pytest.mark.parametrize("color", [[1, 0], [1, 0, 0, 0], "red", None, [1, "x", 0], [1.5, 0, 0], [0, -0.1, 0],
+                                   [float("inf"), 0, 0], [0, float("-inf"), 0], [0, 0, float("nan")]])
+def test_to_rgb8_rejects_bad_colors(color):
+    with pytest.raises(CommandError):
+        Framebuffer.to_rgb8(color)
+
+@pytest.mark.parametrize("index", [-1, 3, 1.0, "0", None, True])
+def test_set_pixel_rejects_bad_indices(index):
+    with pytest.raises(CommandError):
+        Framebuffer(3).set_pixel(index, [1, 1, 1])
+
+def test_set_bytes_checks_length_and_range():
+    fb = Framebuffer(3)
+    with pytest.raises(CommandError):
+        fb.set_bytes(0, b"\x01\x02")
+    with pytest.raises(CommandError):
+        fb.set_bytes(2, b"\x00" * 6)
+    fb.set_bytes(1, b"\x01\x02\x03\x04\x05\x06")
+    assert fb.read() == b"\x00\x00\x00\x01\x02\x03\x04\x05\x06"
+
+def test_set_pixels_needs_matching_lists():
+    fb = Framebuffer(3)
+    with pytest.raises(CommandError):
+        fb.set_pixels([0, 1], [[1, 1, 1]])
+    with pytest.raises(CommandError):
+        fb.set_pixels([0, 3], [[1, 1, 1], [1, 1, 1]])
+    # A rejected write changes nothing
+    assert fb.read() == bytes(9) and fb.version == 0
+    fb.set_pixels([2, 0], [[1, 0, 0], [0, 0, 1]])
+    assert fb.read() == b"\x00\x00\xff\x00\x00\x00\xff\x00\x00"
+
+def test_every_write_bumps_the_version():
+    fb = Framebuffer(2)
+    fb.fill([1, 1, 1])
+    fb.set_pixel(0, [0, 0, 0])
+    fb.clear()
+    assert fb.version == 3
+
+def test_wait_for_change_copies_into_out():
+    fb = Framebuffer(2)
+    out = bytearray(6)
+    assert fb.wait_for_change(0, 0.0, out) == (None, 0)
+    fb.fill([0, 1, 0])
+    frame, version = fb.wait_for_change(0, 0.0, out)
+    assert frame is out and version == 1
+    assert out == b"\x00\xff\x00" * 2
+
+def test_parse_devices():
+    assert parse_devices(" tree=rgb_tree, strip=virtual:60,") == {"tree": ("rgb_tree", 25), "strip": ("virtual", 60)}
+
+@pytest.mark.parametrize("spec", ["", "tree", "tree=virtual,tree=rgb_tree", "tree=virtual, tree =virtual:10"])
+def test_parse_devices_rejects_bad_lists(spec):
+    with pytest.raises(ValueError):
+        parse_devices(spec)
+
+def test_commands_route_to_the_named_device(client):
+    assert client.request({"type": "set_all", "color": [1, 0, 0], "device": "strip"}) == b"OK"
+    client.send({"type": "get_state", "format": "binary", "device": "strip"})
+    assert client.read(30) == b"\xff\x00\x00" * 10
+    client.send({"type": "get_state", "format": "binary", "device": "tree"})
+    assert client.read(75) == bytes(75)
+
+def test_rejected_command_keeps_the_connection_open(client):
+    # 1e400 decodes to infinity
+    client.sock.sendall(b'{"type": "set_all", "color": [1e400, 0, 0]}')
+    assert client.rfile.readline().startswith(b"ERROR: Color must be three numbers")
+    assert client.request({"type": "set_pixel", "pixel": 99, "color": [1, 1, 1]}).startswith(b"ERROR:")
+    assert client.request({"type": "set_pixel", "pixel": 0, "color": [1, 1, 1], "device": 7}).startswith(b"ERROR:")
+    assert client.request({"type": "set_pixel", "pixel": 0, "color": [1, 1, 1]}) == b"OK"
+
+@pytest.mark.parametrize("command", [
+    {"type": "set_pixel", "pixel": 99, "color": [1, 1, 1]},
+    {"type": "set_all", "color": [2, 0, 0]},
+    {"type": "set_pixels", "indices": [0, 1], "colors": [[1, 1, 1]]},
+    {"type": "set_all"},
+    {"type": "start_effect", "name": "nope"},
+])
+def test_bad_scheduled_commands_are_rejected_when_sent(client, command):
+    command = dict(command, at=time.time() + 0.2, device="strip")
+    assert client.request(command).startswith(b"ERROR:")
+    assert client.request(dict(command, type="nonsense")).startswith(b"ERROR:")
+    time.sleep(0.3)
+    client.send({"type": "get_state", "format": "binary", "device": "strip"})
+    assert client.read(30) == bytes(30)
+
+def test_good_scheduled_commands_are_applied_at_their_time(client):
+    assert client.request({"type": "set_all", "color": [0, 0, 1], "at": time.time() + 0.1}) == b"OK"
+    client.send({"type": "get_state", "format": "binary"})
+    assert client.read(75) == bytes(75)
+    time.sleep(0.3)
+    client.send({"type": "get_state", "format": "binary"})
+    assert client.read(75) == b"\x00\x00\xff" * 25
@@ -0,0 +1,24 @@
+"""Steady-state rendering keeps no memory per frame, on a virtual tree and the RGB tree over mock pins."""
+
+import pytest
+
+import server
+from bench_memory import BUDGET, measure
+
+# Shorter than the script's runs; one object kept per frame is still far over budget
+WARMUP = 2.0
+SECONDS = 3.0
+
+@pytest.mark.parametrize("gc_tuning", ["off", "show"])
+@pytest.mark.parametrize("device_type", ["virtual", "rgb_tree"])
+def test_rendering_under_load_keeps_nothing_per_frame(device_type, gc_tuning):
+    result = measure(device_type, gc_tuning, warmup=WARMUP, seconds=SECONDS)
+    assert result["frames"] > 50
+    assert result["net"] / result["frames"] <= BUDGET, result["growth"]
+
+def test_a_per_frame_leak_is_caught(monkeypatch):
+    kept = []
+    show = server.VirtualController.show
+    monkeypatch.setattr(server.VirtualController, "show", lambda self, frame: (kept.append(bytes(frame)), show(self, frame)))
+    result = measure("virtual", "off", warmup=WARMUP, seconds=SECONDS)
+    assert result["net"] / result["frames"] > BUDGET
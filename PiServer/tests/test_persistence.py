@@ -0,0 +1,67 @@
+"""Atomic state files and state restored across a server restart."""
+
+import json
+import os
+
+import pytest
+
+from conftest import Client, start_server, stop_server
+from persistence import STATE_FORMAT_VERSION, StateStore
+
+def test_save_and_load_round_trip(tmp_path):
+    store = StateStore(str(tmp_path / "state.json"))
+    assert store.load() == {}
+    store.save({"tree": {"pixels": "00ff00"}})
+    assert store.load() == {"tree": {"pixels": "00ff00"}}
+    assert os.listdir(tmp_path) == ["state.json"]
+
+def test_failed_write_keeps_the_old_file(tmp_path, monkeypatch):
+    path = tmp_path / "state.json"
+    store = StateStore(str(path))
+    store.save({"tree": {"pixels": "old"}})
+    before = path.read_bytes()
+
+    def crash(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "fsync", crash)
+    with pytest.raises(OSError):
+        store.save({"tree": {"pixels": "new"}})
+    # The half-written temporary file is removed and the old state survives
+    assert path.read_bytes() == before
+    assert os.listdir(tmp_path) == ["state.json"]
+
+def test_unserializable_state_keeps_the_old_file(tmp_path):
+    path = tmp_path / "state.json"
+    store = StateStore(str(path))
+    store.save({"tree": {"pixels": "old"}})
+    with pytest.raises(TypeError):
+        store.save({"tree": {"pixels": {1, 2}}})
+    assert store.load() == {"tree": {"pixels": "old"}}
+    assert os.listdir(tmp_path) == ["state.json"]
+
+@pytest.mark.parametrize("content", ["{trunc", json.dumps({"format": STATE_FORMAT_VERSION + 1, "devices": {"a": {}}})])
+def test_unusable_files_load_as_empty(tmp_path, content):
+    path = tmp_path / "state.json"
+    path.write_text(content)
+    assert StateStore(str(path)).load() == {}
+
+def test_state_survives_a_restart(tmp_path):
+    state_file = str(tmp_path / "state.json")
+    server = start_server(state_file=state_file, save_interval=60.0)
+    client = Client(server.port)
+    assert client.request({"type": "set_pixel", "pixel": 3, "color": [0, 0, 1]}) == b"OK"
+    client.close()
+    # Stopping saves the last change even before the save interval
+    stop_server(server)
+
+    server = start_server(state_file=state_file)
+    client = Client(server.port)
+    try:
+        client.send({"type": "get_state", "format": "binary", "device": "tree"})
+        frame = client.read(75)
+    finally:
+        client.close()
+        stop_server(server)
+    assert frame[9:12] == b"\x00\x00\xff"
+    assert frame[:9] == bytes(9)
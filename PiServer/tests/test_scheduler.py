@@ -0,0 +1,155 @@
+"""Token buckets and the fair, rate-limited command scheduler."""
+
+import socket
+import threading
+import time
+from typing import Any, List
+
+import pytest
+
+from scheduler import ClientSession, CommandScheduler, TokenBucket
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=10.0, capacity=3)
+    now = bucket.updated
+    assert [bucket.take(now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(now) == pytest.approx(0.1)
+    assert bucket.take(now + 0.1) == 0.0
+    # Refills stop at the capacity
+    assert [bucket.take(now + 100) for _ in range(4)][-1] > 0
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(rate=0.0, capacity=1)
+    assert all(bucket.take(bucket.updated) == 0.0 for _ in range(1000))
+
+class Recorder:
+    """A command handler that records the order commands were served in."""
+
+    def __init__(self):
+        self.served: List[Any] = []
+        self.lock = threading.Lock()
+
+    def __call__(self, command: Any) -> bytes:
+        with self.lock:
+            self.served.append(command["id"])
+        return b"OK\n"
+
+    def wait_for(self, count: int, timeout: float = 5.0) -> List[Any]:
+        deadline = time.monotonic() + timeout
+        while len(self.served) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return list(self.served)
+
+@pytest.fixture
+def sessions():
+    """Opens sessions on socket pairs whose peer ends are never read."""
+    opened = []
+
+    def open_session(scheduler: CommandScheduler) -> ClientSession:
+        conn, peer = socket.socketpair()
+        session = scheduler.open_session(conn, ("test", len(opened)))
+        opened.append((session, conn, peer))
+        return session
+
+    yield open_session
+    for session, conn, peer in opened:
+        session.abort("dead")
+        conn.close()
+        peer.close()
+
+def test_round_robin_serves_a_quiet_client_promptly(sessions):
+    recorder = Recorder()
+    scheduler = CommandScheduler(recorder, rate=0.0)
+    chatty, quiet = sessions(scheduler), sessions(scheduler)
+    for n in range(50):
+        scheduler.submit(chatty, {"type": "set_all", "id": f"chatty-{n}"})
+    scheduler.submit(quiet, {"type": "set_all", "id": "quiet"})
+    scheduler.start()
+    try:
+        served = recorder.wait_for(51)
+    finally:
+        scheduler.stop()
+    # One queue does not make another wait behind all of it
+    assert served.index("quiet") <= 1
+    assert [s for s in served if s != "quiet"] == [f"chatty-{n}" for n in range(50)]
+
+def test_rate_limit_throttles_a_flood(sessions):
+    recorder = Recorder()
+    scheduler = CommandScheduler(recorder, rate=20.0, burst=5)
+    session = sessions(scheduler)
+    for n in range(10):
+        scheduler.submit(session, {"type": "set_all", "id": n})
+    started = time.monotonic()
+    scheduler.start()
+    try:
+        recorder.wait_for(10)
+        elapsed = time.monotonic() - started
+    finally:
+        scheduler.stop()
+    # A burst of 5, then 5 more at 20 per second
+    assert elapsed >= 0.2
+    assert session.throttled > 0
+    assert session.stats()["processed"] == 10
+
+def test_control_commands_jump_the_queue(sessions):
+    recorder = Recorder()
+    scheduler = CommandScheduler(recorder, rate=0.0)
+    writer, controller = sessions(scheduler), sessions(scheduler)
+    for n in range(20):
+        scheduler.submit(writer, {"type": "set_all", "id": n})
+    scheduler.submit(controller, {"type": "off", "id": "off"})
+    scheduler.start()
+    try:
+        served = recorder.wait_for(21)
+    finally:
+        scheduler.stop()
+    assert served[0] == "off"
+
+def test_control_commands_are_rate_limited(sessions):
+    recorder = Recorder()
+    scheduler = CommandScheduler(recorder, rate=1.0, burst=2)
+    session = sessions(scheduler)
+    for n in range(5):
+        scheduler.submit(session, {"type": "ping", "id": n})
+    scheduler.start()
+    try:
+        time.sleep(0.3)
+        served = list(recorder.served)
+    finally:
+        scheduler.stop()
+    # Priority is not a way around the bucket
+    assert served == [0, 1]
+    assert session.throttled == 1
+
+def test_rejected_commands_are_answered_and_counted():
+    def handler(command: Any) -> bytes:
+        raise ValueError("bad pixel")
+
+    scheduler = CommandScheduler(handler, rate=0.0)
+    conn, peer = socket.socketpair()
+    session = scheduler.open_session(conn, ("test", 0))
+    scheduler.submit(session, {"type": "set_pixel"})
+    scheduler.start()
+    try:
+        peer.settimeout(5.0)
+        assert peer.recv(1024) == b"ERROR: bad pixel\n"
+    finally:
+        scheduler.stop()
+        session.abort("dead")
+        conn.close()
+        peer.close()
+    assert session.rejected == 1 and session.processed == 0
+
+@pytest.mark.parametrize("idle_timeout, reaped", [(0.0, False), (60.0, True)])
+def test_idle_sessions_are_reaped_only_with_a_timeout(sessions, idle_timeout, reaped):
+    scheduler = CommandScheduler(Recorder(), idle_timeout=idle_timeout)
+    session = sessions(scheduler)
+    with scheduler._changed:
+        scheduler._reap(time.monotonic() + 30.0)
+        assert not session.closed
+        scheduler._reap(time.monotonic() + 3600.0)
+    assert session.closed == reaped
+    assert session.close_reason == ("idle" if reaped else None)
+
+def test_idle_reaping_is_off_by_default():
+    assert CommandScheduler(Recorder()).idle_timeout == 0
@@ -0,0 +1,94 @@
+"""The shared-memory frame seqlock, and frames from a local producer on a live server."""
+
+import os
+import threading
+import time
+
+import pytest
+
+from conftest import Client, start_server, stop_server
+from shared_frame import SEQUENCE, FrameProducer, SharedFrame
+
+@pytest.fixture
+def shared():
+    frame = SharedFrame(f"test_frame_{os.getpid()}", pixels=4)
+    yield frame
+    frame.close()
+
+def test_nothing_to_read_before_the_first_frame(shared):
+    assert shared.read(0) == (None, 0)
+
+def test_a_published_frame_is_read_once(shared):
+    with shared.write() as rgb:
+        rgb[:] = bytes(range(12))
+    frame, sequence = shared.read(0)
+    assert frame == bytes(range(12)) and sequence == 2
+    assert shared.read(sequence) == (None, sequence)
+
+def test_a_frame_being_written_is_not_read(shared):
+    with shared.write() as rgb:
+        rgb[:3] = b"\xff\x00\x00"
+        # The counter is odd while the producer writes
+        assert SEQUENCE.unpack_from(shared.shm.buf, 0)[0] & 1
+        assert shared.read(0) == (None, 0)
+    assert shared.read(0)[0][:3] == b"\xff\x00\x00"
+
+def test_an_attached_reader_sees_the_owner_frames(shared):
+    reader = SharedFrame(shared.name)
+    try:
+        assert reader.pixels == 4 and not reader.owner
+        with shared.write() as rgb:
+            rgb[:] = b"\x07" * 12
+        assert reader.read(0) == (b"\x07" * 12, 2)
+    finally:
+        reader.close()
+
+def test_reads_are_never_torn(shared):
+    reader = SharedFrame(shared.name)
+    stop = threading.Event()
+
+    def produce():
+        value = 0
+        while not stop.is_set():
+            value = (value + 1) % 256
+            with shared.write() as rgb:
+                # Written a byte at a time, so a torn copy would mix values
+                for i in range(len(rgb)):
+                    rgb[i] = value
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    frames = 0
+    last = 0
+    try:
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            frame, last = reader.read(last)
+            if frame is not None:
+                frames += 1
+                assert len(set(frame)) == 1
+    finally:
+        stop.set()
+        producer.join()
+        reader.close()
+    assert frames > 0
+
+def test_producer_frames_reach_the_device(tmp_path):
+    server = start_server(unix_socket=str(tmp_path / "piserver.sock"))
+    client = Client(server.port)
+    producer = FrameProducer("strip", str(tmp_path / "piserver.sock"))
+    try:
+        assert producer.pixels == 10
+        producer.write(b"\x01\x02\x03" * 10)
+        deadline = time.monotonic() + 5.0
+        while True:
+            client.send({"type": "get_state", "format": "binary", "device": "strip"})
+            frame = client.read(30)
+            if frame == b"\x01\x02\x03" * 10 or time.monotonic() > deadline:
+                break
+            time.sleep(0.02)
+    finally:
+        producer.close()
+        client.close()
+        stop_server(server)
+    assert frame == b"\x01\x02\x03" * 10
@@ -0,0 +1,93 @@
+"""Choosing an SPI transport, the bit-bang waveform, and refusing to start on a bad setting."""
+
+import os
+import socket
+
+import pytest
+
+import spi_transport
+from bench_spi import DecodingRegisters
+from conftest import free_port
+from server import NetworkServer
+from spi_transport import BitBangTransport, choose_transport, parse_pins
+
+@pytest.fixture
+def machine(monkeypatch):
+    """Pretend to be a machine with or without SPI device nodes, spidev and /dev/gpiomem."""
+
+    def configure(spidev_nodes=(), spidev=False, gpiomem=False):
+        exists = os.path.exists
+        monkeypatch.setattr(os.path, "exists",
+                            lambda path: path in spidev_nodes or (not path.startswith("/dev/spidev") and exists(path)))
+        monkeypatch.setattr(spi_transport, "spidev_available", lambda: spidev)
+        monkeypatch.setattr(spi_transport, "gpiomem_supported", lambda: gpiomem)
+
+    return configure
+
+def test_parse_pins():
+    assert parse_pins("10,11") == (10, 11)
+    assert parse_pins(" 20, 21 ") == (20, 21)
+
+@pytest.mark.parametrize("spec", ["10", "10,11,12", "ten,eleven", ""])
+def test_parse_pins_rejects_anything_but_a_pair(spec):
+    with pytest.raises(ValueError, match="data then clock"):
+        parse_pins(spec)
+
+def test_unknown_transport_is_rejected():
+    with pytest.raises(ValueError):
+        choose_transport("fast", 12, 25)
+
+def test_spidev_needs_hardware_spi_pins(machine):
+    machine(spidev_nodes=("/dev/spidev0.0",), spidev=True)
+    with pytest.raises(ValueError, match="not hardware SPI pins"):
+        choose_transport("spidev", 12, 25)
+    assert choose_transport("spidev", 10, 11) == "spidev"
+
+def test_spidev_needs_the_device_node_and_module(machine):
+    machine(spidev=True)
+    with pytest.raises(ValueError, match="raspi-config"):
+        choose_transport("spidev", 10, 11)
+    machine(spidev_nodes=("/dev/spidev1.0",))
+    with pytest.raises(ValueError, match="not installed"):
+        choose_transport("spidev", 20, 21)
+
+def test_bitbang_needs_gpiomem(machine):
+    machine()
+    with pytest.raises(ValueError, match="gpiomem"):
+        choose_transport("bitbang", 12, 25)
+    machine(gpiomem=True)
+    assert choose_transport("bitbang", 12, 25) == "bitbang"
+
+@pytest.mark.parametrize("pins, setup, expected", [
+    ((10, 11), dict(spidev_nodes=("/dev/spidev0.0",), spidev=True, gpiomem=True), "spidev"),
+    ((10, 11), dict(spidev_nodes=("/dev/spidev0.0",), gpiomem=True), "bitbang"),
+    ((12, 25), dict(spidev_nodes=("/dev/spidev0.0",), spidev=True, gpiomem=True), "bitbang"),
+    ((12, 25), dict(), "gpiozero"),
+])
+def test_auto_picks_the_fastest_available(machine, pins, setup, expected):
+    machine(**setup)
+    assert choose_transport("auto", *pins) == expected
+
+def test_bitbang_waveform_decodes_to_the_frame():
+    transport = BitBangTransport(DecodingRegisters(), 12, 25)
+    frame = bytes([0x00, 0xFF, 0xA5, 0x3C]) + bytes(range(0, 256, 7))
+    transport.transfer(frame)
+    transport.transfer(b"\x81")
+    assert transport.registers.words.data() == frame + b"\x81"
+
+def test_server_refuses_to_start_with_an_unusable_transport(machine):
+    machine()
+    port = free_port()
+    server = NetworkServer("127.0.0.1", port, {"tree": ("rgb_tree", 25)}, spi_transport="spidev")
+    with pytest.raises(ValueError, match="not hardware SPI pins"):
+        server.start()
+    # It stopped before binding its port
+    with pytest.raises(ConnectionRefusedError):
+        socket.create_connection(("127.0.0.1", port), timeout=1.0)
+    with pytest.raises(ValueError):
+        NetworkServer("127.0.0.1", port, {"tree": ("rgb_tree", 25)}, spi_transport="fast")
+
+def test_virtual_devices_ignore_the_transport(machine):
+    machine()
+    server = NetworkServer("127.0.0.1", free_port(), {"tree": ("virtual", 25)}, spi_transport="spidev")
+    server.check_transport()
@@ -0,0 +1,109 @@
+"""Timeline validation and playback maths, and timeline commands on a live server."""
+
+import os
+import sys
+
+import pytest
+
+from timeline import Timeline, parse_steps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "PythonDemo"))
+from tree_client import CommandError, TreeClient
+
+def off(n: int) -> dict:
+    return {"type": "off", "n": n}
+
+def ids(due) -> list:
+    return [commands[0]["n"] for commands, _ in due]
+
+def test_parse_steps_accepts_both_forms():
+    steps = parse_steps([{"hold": 1, "command": off(0)}, {"hold": 0.5, "commands": [off(1), off(2)]}], 60.0)
+    assert steps == [(1.0, [off(0)]), (0.5, [off(1), off(2)])]
+
+@pytest.mark.parametrize("steps", [
+    [],
+    "steps",
+    [{"hold": -1, "command": off(0)}],
+    [{"hold": 61, "command": off(0)}],
+    [{"hold": True, "command": off(0)}],
+    [{"hold": 1, "commands": off(0)}],
+    [{"hold": 1, "command": {"color": [1, 1, 1]}}],
+    [{"hold": 1, "command": dict(off(0), at=5.0)}],
+    [{"hold": 1, "command": dict(off(0), device="tree")}],
+])
+def test_parse_steps_rejects_bad_steps(steps):
+    with pytest.raises(ValueError):
+        parse_steps(steps, 60.0)
+
+def timeline(loop: bool = False) -> Timeline:
+    # Steps start at 0, 1, 1 (zero hold) and 3; the show is 4 seconds long
+    return Timeline([(1.0, [off(0)]), (0.0, [off(1)]), (2.0, [off(2)]), (1.0, [off(3)])], loop)
+
+def test_steps_become_due_in_order_with_their_lateness():
+    show = timeline()
+    show.start(100.0)
+    assert ids(show.advance(100.0)) == [0]
+    assert show.advance(100.5) == []
+    due = show.advance(101.25)
+    assert ids(due) == [1, 2]
+    assert [late for _, late in due] == pytest.approx([0.25, 0.25])
+    assert show.next_delay(101.25) == pytest.approx(1.75)
+    assert ids(show.advance(110.0)) == [3]
+    assert show.finished and show.next_delay(110.0) is None
+    assert show.status(110.0)["state"] == "finished"
+
+def test_seek_backs_up_over_zero_hold_steps():
+    show = timeline()
+    show.start(0.0)
+    show.advance(0.0)
+    show.seek(0.0, 2.0)
+    # Step 2 contains position 2; step 1 shares its start and is applied again
+    assert ids(show.advance(0.0)) == [1, 2]
+    with pytest.raises(ValueError):
+        show.seek(0.0, 4.5)
+
+def test_pause_holds_the_position():
+    show = timeline()
+    show.start(0.0)
+    show.advance(0.0)
+    show.pause(0.5)
+    assert show.advance(10.0) == []
+    assert show.status(10.0)["state"] == "paused"
+    assert show.position(10.0) == pytest.approx(0.5)
+    assert show.resume(10.0) == pytest.approx(9.5)
+    assert ids(show.advance(10.5)) == [1, 2]
+
+def test_a_scheduled_start_reports_its_start_position():
+    show = timeline()
+    show.start(50.0, position=1.0)
+    status = show.status(40.0)
+    assert status["state"] == "scheduled" and status["position"] == pytest.approx(1.0)
+
+def test_a_loop_skips_whole_passes_after_a_stall():
+    show = timeline(loop=True)
+    show.start(0.0)
+    assert ids(show.advance(3.0)) == [0, 1, 2, 3]
+    # Stalled for several passes: only the current pass is replayed
+    assert ids(show.advance(13.5)) == [0, 1, 2]
+    assert show.passes == 3
+    assert not show.finished
+
+def test_a_looping_timeline_needs_length():
+    with pytest.raises(ValueError):
+        Timeline([(0.0, [off(0)])], loop=True)
+
+def test_tree_client_plays_and_controls_a_show(server):
+    client = TreeClient("127.0.0.1", server.port)
+    client.connect()
+    try:
+        status = client.play_timeline([{"hold": 30, "command": {"type": "set_all", "color": [0, 0, 1]}}])
+        assert status["state"] == "playing" and status["length"] == 30
+        assert client.timeline("pause")["state"] == "paused"
+        assert client.timeline("seek", 10.0)["position"] == pytest.approx(10.0)
+        with pytest.raises(CommandError, match="hold"):
+            client.play_timeline([{"hold": "long", "command": {"type": "off"}}])
+        with pytest.raises(CommandError):
+            client.timeline("seek", 99.0)
+        assert client.timeline("stop")["state"] == "stopped"
+    finally:
+        client.disconnect()
@@ -0,0 +1,78 @@
+"""Fade and keyframe interpolation."""
+
+import time
+
+import pytest
+
+from transitions import EASINGS, Transition
+
+BLACK = b"\x00\x00\x00"
+WHITE = b"\xff\xff\xff"
+RED = b"\xff\x00\x00"
+
+@pytest.mark.parametrize("name", sorted(EASINGS))
+def test_easings_run_from_0_to_1(name):
+    assert EASINGS[name](0.0) == pytest.approx(0.0)
+    assert EASINGS[name](1.0) == pytest.approx(1.0)
+
+def test_linear_fade_blends_and_rounds():
+    fade = Transition(BLACK, [(WHITE, 2.0, "linear")], started=10.0)
+    assert fade.render(10.0) == BLACK
+    assert fade.render(11.0) == bytes([128] * 3)
+    assert fade.render(11.5) == bytes([191] * 3)
+    assert not fade.finished
+    assert fade.render(12.0) == WHITE
+    assert fade.finished
+
+def test_eased_fade_follows_the_curve():
+    fade = Transition(BLACK, [(WHITE, 1.0, "ease_in")], started=0.0)
+    assert fade.render(0.5) == bytes([64] * 3)
+
+def test_unchanged_frames_are_not_rendered_again():
+    fade = Transition(BLACK, [(WHITE, 1.0, "step")], started=0.0)
+    assert fade.render(0.2) == BLACK
+    assert fade.render(0.6) is None
+    assert fade.render(1.0) == WHITE
+    assert fade.render(5.0) is None
+
+def test_keyframes_run_in_sequence():
+    animation = Transition(BLACK, [(RED, 1.0, "linear"), (WHITE, 1.0, "linear"), (BLACK, 0.0, "linear")],
+                           started=0.0)
+    assert animation.render(1.0) == RED
+    assert animation.render(1.5) == b"\xff\x80\x80"
+    # A zero-length keyframe is a jump
+    assert animation.render(2.0) == BLACK
+    assert animation.finished
+
+def test_a_loop_returns_to_the_first_keyframe_from_the_last():
+    loop = Transition(BLACK, [(RED, 1.0, "linear"), (WHITE, 1.0, "linear")], started=0.0, loop=True)
+    assert loop.render(0.5) == b"\x80\x00\x00"
+    # The second pass starts from white, not from the start frame
+    assert loop.render(2.5) == b"\xff\x80\x80"
+    assert loop.render(3.0) == RED
+    assert not loop.finished
+
+@pytest.mark.parametrize("keyframes, loop", [
+    ([], False),
+    ([(WHITE, -1.0, "linear")], False),
+    ([(WHITE, float("nan"), "linear")], False),
+    ([(WHITE, 1.0, "bounce")], False),
+    ([(WHITE, 0.0, "linear")], True),
+])
+def test_bad_animations_are_rejected(keyframes, loop):
+    with pytest.raises(ValueError):
+        Transition(BLACK, keyframes, started=0.0, loop=loop)
+
+def test_fade_command_on_a_live_device(client):
+    assert client.request({"type": "set_all", "color": [1, 1, 1], "device": "strip"}) == b"OK"
+    assert client.request({"type": "fade_to", "color": [1, 0, 0], "duration": 0.2, "device": "strip"}) == b"OK"
+    # The render thread ends the fade on the target color
+    deadline = time.monotonic() + 5.0
+    while True:
+        client.send({"type": "get_state", "format": "binary", "device": "strip"})
+        frame = client.read(30)
+        if frame == RED * 10 or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert frame == RED * 10
+    assert client.request({"type": "fade_to", "color": [0, 0, 0], "easing": "bounce"}).startswith(b"ERROR:")
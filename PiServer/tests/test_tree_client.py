@@ -0,0 +1,67 @@
+"""The Python TreeClient: whole replies however TCP splits them, and reconnecting after an idle close."""
+
+import os
+import socket
+import sys
+import threading
+import time
+
+from conftest import Client, start_server, stop_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "PythonDemo"))
+from tree_client import TreeClient
+
+def test_large_replies_are_read_whole(server):
+    others = [Client(server.port) for _ in range(8)]
+    client = TreeClient("127.0.0.1", server.port)
+    client.connect()
+    try:
+        stats = client._json_reply({"type": "stats"})
+        assert len(stats["clients"]) == 9
+        # Nothing of the long reply is left over to be taken for the next one
+        assert client._json_reply({"type": "ping", "t0": 1.0})["t0"] == 1.0
+        assert len(client.get_state()) == 25
+        assert client.send_command({"type": "off"}).strip() == "OK"
+    finally:
+        client.disconnect()
+        for other in others:
+            other.close()
+
+def test_split_replies_are_reassembled():
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+
+    def serve():
+        conn, _ = listener.accept()
+        with conn:
+            for reply in (b'{"type": "pong", "t0": 1, "t1": 2, "t2": 3}\n', b"OK\n"):
+                conn.recv(1024)
+                for i in range(0, len(reply), 5):
+                    conn.sendall(reply[i:i + 5])
+                    time.sleep(0.005)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    client = TreeClient("127.0.0.1", port)
+    client.connect()
+    try:
+        assert client._json_reply({"type": "ping", "t0": 1})["t2"] == 3
+        assert client.send_command({"type": "off"}) == "OK\n"
+    finally:
+        client.disconnect()
+        thread.join()
+        listener.close()
+
+def test_a_connection_closed_while_idle_is_reopened():
+    server = start_server(idle_timeout=0.5)
+    client = TreeClient("127.0.0.1", server.port)
+    client.connect()
+    try:
+        client.set_all([0, 1, 0])
+        # Reaped after the idle timeout, on the next reaper pass
+        time.sleep(2.0)
+        assert client.send_command({"type": "off"}) == "OK\n"
+        assert client.get_state()[0] == [0.0, 0.0, 0.0]
+    finally:
+        client.disconnect()
+        stop_server(server)
@@ -0,0 +1,86 @@
+"""Headless twin rendering, frame comparison, and capture from a live server."""
+
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from geometry import Geometry
+from twin_render import TwinRenderer, capture, compare, effect_frames, load_frames, save_frames, write_png
+
+def frames(count: int, pixels: int = 5, value: int = 0) -> np.ndarray:
+    return np.full((count, pixels, 3), value, dtype=np.uint8)
+
+def test_identical_runs_do_not_differ():
+    result = compare(frames(4, value=9), frames(4, value=9))
+    assert result == {"frames": 4, "differing": 0, "first": None, "max_error": 0, "mean_error": 0.0}
+
+def test_differences_within_tolerance_are_ignored():
+    actual = frames(4)
+    actual[2, 1, 0] = 3
+    assert compare(frames(4), actual, tolerance=3)["differing"] == 0
+    result = compare(frames(4), actual, tolerance=2)
+    assert result["differing"] == 1 and result["first"] == 2 and result["max_error"] == 3
+
+def test_missing_frames_differ():
+    result = compare(frames(3), frames(5))
+    assert result["frames"] == 5 and result["differing"] == 2 and result["first"] == 3
+    assert compare(frames(0), frames(2))["first"] == 0
+
+def test_runs_of_different_layouts_cannot_be_compared():
+    with pytest.raises(ValueError):
+        compare(frames(2, pixels=5), frames(2, pixels=6))
+
+def test_render_draws_each_lit_led():
+    renderer = TwinRenderer(Geometry.line(5), views=("front", "side"), size=16)
+    images = renderer.render(np.concatenate([frames(1), frames(1, value=255)]))
+    assert images.shape == (2, 16, 32, 3)
+    assert not images[0].any()
+    # Both views light up
+    assert images[1, :, :16].any() and images[1, :, 16:].any()
+    one = frames(1)
+    one[0, 2] = (255, 0, 0)
+    lit = renderer.render(one)[0]
+    assert lit[:, :, 0].any() and not lit[:, :, 1:].any()
+
+def test_render_needs_whole_frames():
+    renderer = TwinRenderer(Geometry.line(5), size=8)
+    assert renderer.frames(bytes(30)).shape == (2, 5, 3)
+    with pytest.raises(ValueError):
+        renderer.frames(bytes(31))
+    with pytest.raises(ValueError):
+        TwinRenderer(Geometry.line(5), views=("back",))
+
+def test_write_png_is_a_valid_png(tmp_path):
+    image = np.zeros((3, 2, 3), dtype=np.uint8)
+    image[1, 1] = (1, 2, 3)
+    path = tmp_path / "image.png"
+    write_png(str(path), image)
+    data = path.read_bytes()
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    assert struct.unpack(">II", data[16:24]) == (2, 3)
+    length = struct.unpack(">I", data[33:37])[0]
+    raw = zlib.decompress(data[41:41 + length])
+    # Each row is a filter byte then the pixels
+    assert raw[7 + 4:7 + 7] == b"\x01\x02\x03"
+
+def test_frame_files_round_trip(tmp_path):
+    run = np.random.default_rng(1).integers(0, 256, (6, 5, 3), dtype=np.uint8)
+    save_frames(str(tmp_path / "run.frames"), run, 25.0)
+    loaded, fps = load_frames(str(tmp_path / "run.frames"))
+    assert fps == 25.0 and np.array_equal(loaded, run)
+
+@pytest.mark.parametrize("name", ["spiral", "noise"])
+def test_offline_effects_repeat(name):
+    geometry = Geometry.line(10)
+    first = effect_frames(name, geometry, {}, seconds=0.2, fps=25.0)
+    assert first.shape == (5, 10, 3)
+    assert compare(first, effect_frames(name, geometry, {}, seconds=0.2, fps=25.0))["differing"] == 0
+
+def test_captured_frames_match_the_device(client, server):
+    assert client.request({"type": "set_all", "color": [1, 0, 0], "device": "strip"}) == b"OK"
+    captured = capture("127.0.0.1", server.port, seconds=0.2, fps=20.0, device="strip")
+    expected = np.tile(np.array([255, 0, 0], dtype=np.uint8), (len(captured), 10, 1))
+    assert len(captured) == 4
+    assert compare(expected, captured)["differing"] == 0
@@ -0,0 +1,151 @@
+"""WebSocket framing, message parsing and subscriptions on a live gateway."""
+
+import base64
+import io
+import json
+import os
+import socket
+import struct
+from typing import Tuple
+
+import pytest
+
+from conftest import TIMEOUT, free_port, start_server, stop_server
+from scheduler import INVALID_JSON
+from websocket_gateway import (CLOSE_TOO_BIG, MAX_MESSAGE_SIZE, OP_BINARY, OP_CLOSE, OP_TEXT,
+                               ProtocolError, encode_frame, parse_commands, read_frame)
+
+def client_frame(payload: bytes, opcode: int = OP_TEXT, fin: bool = True, mask: bytes = b"\x12\x34\x56\x78") -> bytes:
+    """Frame a message the way a browser does: masked, with the shortest length encoding."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", (0x80 if fin else 0) | opcode, 0x80 | length)
+    elif length < 65536:
+        header = struct.pack("!BBH", (0x80 if fin else 0) | opcode, 0x80 | 126, length)
+    else:
+        header = struct.pack("!BBQ", (0x80 if fin else 0) | opcode, 0x80 | 127, length)
+    masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return header + mask + masked
+
+def server_frame(rfile) -> Tuple[int, bytes]:
+    """Read one unmasked server frame; returns (opcode, payload)."""
+    first, second = rfile.read(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", rfile.read(8))[0]
+    return first & 0x0F, rfile.read(length)
+
+@pytest.mark.parametrize("size, header", [(0, 2), (125, 2), (126, 4), (65535, 4), (65536, 10)])
+def test_encode_frame_uses_the_shortest_length(size, header):
+    frame = encode_frame(b"x" * size, OP_BINARY)
+    assert len(frame) == header + size
+    assert frame[0] == 0x80 | OP_BINARY
+    assert server_frame(io.BytesIO(frame)) == (OP_BINARY, b"x" * size)
+
+@pytest.mark.parametrize("size", [0, 5, 125, 126, 1000, 65535])
+def test_read_frame_unmasks(size):
+    payload = os.urandom(size)
+    assert read_frame(io.BytesIO(client_frame(payload, OP_BINARY))) == (True, OP_BINARY, payload)
+
+def test_read_frame_reports_fragments():
+    assert read_frame(io.BytesIO(client_frame(b"{}", fin=False))) == (False, OP_TEXT, b"{}")
+
+def test_read_frame_rejects_unmasked_frames():
+    with pytest.raises(ProtocolError):
+        read_frame(io.BytesIO(encode_frame(b"{}")))
+
+def test_read_frame_rejects_oversized_frames():
+    header = struct.pack("!BBQ", 0x80 | OP_TEXT, 0x80 | 127, MAX_MESSAGE_SIZE + 1)
+    with pytest.raises(ProtocolError) as excinfo:
+        read_frame(io.BytesIO(header + b"\x00" * 4))
+    assert excinfo.value.code == CLOSE_TOO_BIG
+
+@pytest.mark.parametrize("size", [5, 300, MAX_MESSAGE_SIZE])
+def test_read_frame_raises_eof_on_a_truncated_frame(size):
+    frame = client_frame(b"x" * size)
+    # Cut inside the header, the extended length, the mask and the payload
+    for cut in sorted({*range(1, min(15, len(frame))), len(frame) - 1}):
+        with pytest.raises(EOFError):
+            read_frame(io.BytesIO(frame[:cut]))
+
+def test_parse_commands_splits_back_to_back_and_newline_delimited():
+    message = b'{"type": "off"}{"type": "ping"}\n {"type": "stats"}\n'
+    assert [c["type"] for c in parse_commands(message)] == ["off", "ping", "stats"]
+
+def test_parse_commands_stops_at_bad_input():
+    assert list(parse_commands(b'{"type": "off"} {nope')) == [{"type": "off"}, INVALID_JSON]
+    assert list(parse_commands(b"\xff\xfe")) == [INVALID_JSON]
+    assert list(parse_commands(b"  \n")) == []
+
+class WebSocketClient:
+    def __init__(self, port: int):
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=TIMEOUT)
+        self.rfile = self.sock.makefile("rb")
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((f"GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                           f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                           f"Sec-WebSocket-Version: 13\r\n\r\n").encode())
+        assert self.rfile.readline().startswith(b"HTTP/1.1 101")
+        while self.rfile.readline() != b"\r\n":
+            pass
+
+    def send(self, command: dict) -> None:
+        self.sock.sendall(client_frame(json.dumps(command).encode()))
+
+    def receive(self) -> Tuple[int, bytes]:
+        return server_frame(self.rfile)
+
+    def close(self) -> None:
+        self.rfile.close()
+        self.sock.close()
+
+@pytest.fixture
+def ws():
+    server = start_server(ws_port=free_port())
+    client = WebSocketClient(server.ws_port)
+    yield client
+    client.close()
+    stop_server(server)
+
+def test_commands_are_answered_over_websocket(ws):
+    ws.send({"type": "set_all", "color": [0, 1, 0], "device": "strip"})
+    assert ws.receive() == (OP_TEXT, b"OK\n")
+    ws.send({"type": "get_state", "format": "binary", "device": "strip"})
+    assert ws.receive() == (OP_BINARY, b"\x00\xff\x00" * 10)
+
+def test_subscription_streams_changes(ws):
+    ws.send({"type": "subscribe", "device": "strip", "format": "binary"})
+    assert ws.receive() == (OP_TEXT, b"OK\n")
+    assert ws.receive() == (OP_BINARY, bytes(30))
+    ws.send({"type": "set_pixel", "pixel": 0, "color": [1, 1, 1], "device": "strip"})
+    assert ws.receive() == (OP_TEXT, b"OK\n")
+    assert ws.receive() == (OP_BINARY, b"\xff\xff\xff" + bytes(27))
+
+@pytest.mark.parametrize("command", [
+    {"type": "subscribe", "device": ["strip"]},
+    {"type": "subscribe", "device": "nope"},
+    {"type": "subscribe", "format": "xml"},
+])
+def test_bad_subscriptions_are_rejected_and_the_connection_stays_open(ws, command):
+    ws.send(command)
+    opcode, reply = ws.receive()
+    assert opcode == OP_TEXT and reply.startswith(b"ERROR:")
+    ws.send({"type": "ping", "t0": 0})
+    assert json.loads(ws.receive()[1])["t0"] == 0
+
+def test_close_is_echoed(ws):
+    ws.sock.sendall(client_frame(struct.pack("!H", 1000), OP_CLOSE))
+    assert ws.receive() == (OP_CLOSE, struct.pack("!H", 1000))
+
+def test_a_client_hanging_up_mid_frame_is_disconnected_cleanly(ws):
+    port = ws.sock.getpeername()[1]
+    broken = WebSocketClient(port)
+    # An extended length cut short
+    broken.sock.sendall(bytes([0x80 | OP_TEXT, 0x80 | 126, 0x01]))
+    broken.close()
+    ws.send({"type": "ping", "t0": 5})
+    assert json.loads(ws.receive()[1])["t0"] == 5
+    # The gateway still accepts new connections
+    WebSocketClient(port).close()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Show timelines played by the server.
+A timeline is a list of steps, each a group of device commands (effects,
+fades, frames, layers) applied together and held for a number of seconds.
+It is uploaded once and validated up front; the render thread then applies
+each step when the monotonic clock reaches it, so the show keeps running
+without any client connected.
+"""
+
+import itertools
+from typing import Any, Dict, List, Optional, Tuple
+from tracing import TRACE_FIELD
+
+MAX_TIMELINE_STEPS = 1024
+
+# Command fields that only make sense from a client, never inside a timeline
+TIMELINE_FORBIDDEN_FIELDS = ("at", "device", TRACE_FIELD)
+
+def parse_steps(steps: Any, max_hold: float) -> List[Tuple[float, List[Dict[str, Any]]]]:
+    """
+    Check the shape of uploaded steps and return them as (hold, commands).
+    Each step is {"hold": seconds, "commands": [command, ...]}, or
+    {"hold": seconds, "command": command} for a single command.
+    """
+    if type(steps) is not list or not steps:
+        raise ValueError("steps must be a non-empty list")
+    if len(steps) > MAX_TIMELINE_STEPS:
+        raise ValueError(f"Too many steps (maximum {MAX_TIMELINE_STEPS})")
+    parsed = []
+    for number, step in enumerate(steps):
+        if type(step) is not dict:
+            raise ValueError(f"Step {number} must be an object")
+        hold = step.get("hold", 0)
+        if type(hold) not in (int, float) or not 0 <= hold <= max_hold:
+            raise ValueError(f"Step {number}: hold must be a number of seconds up to {max_hold}: {hold!r}")
+        commands = step["commands"] if "commands" in step else [step.get("command")]
+        if type(commands) is not list or not all(type(c) is dict for c in commands):
+            raise ValueError(f"Step {number}: commands must be a list of objects")
+        for command in commands:
+            if type(command.get("type")) is not str:
+                raise ValueError(f"Step {number}: every command needs a string type")
+            for field in TIMELINE_FORBIDDEN_FIELDS:
+                if field in command:
+                    raise ValueError(f"Step {number}: commands in a timeline cannot have {field}")
+        parsed.append((float(hold), commands))
+    return parsed
+
+class Timeline:
+    """
+    Position and progress of a show. Position 0 is the start of the first
+    step; step i starts at the sum of the holds before it. Times are
+    monotonic clock readings supplied by the caller.
+    """
+
+    def __init__(self, steps: List[Tuple[float, List[Dict[str, Any]]]], loop: bool = False):
+        self.holds = [hold for hold, _ in steps]
+        self.commands = [commands for _, commands in steps]
+        self.starts = [0.0] + list(itertools.accumulate(self.holds))[:-1]
+        self.length = sum(self.holds)
+        if loop and not self.length > 0:
+            raise ValueError("A looping timeline needs a positive total hold")
+        self.loop = loop
+        self.begins = 0.0  # Monotonic time playback starts
+        self.origin = 0.0  # Monotonic time of position 0 in the current pass
+        self.paused_at: Optional[float] = None
+        self.index = 0  # Next step to apply
+        self.passes = 0
+
+    @property
+    def finished(self) -> bool:
+        return not self.loop and self.index >= len(self.holds)
+
+    def position(self, now: float) -> float:
+        """Seconds into the current pass."""
+        return (self.paused_at if self.paused_at is not None else now) - self.origin
+
+    def start(self, begins: float, position: float = 0.0) -> None:
+        """Start playing from position at monotonic time begins."""
+        self.begins = begins
+        self.paused_at = None
+        self.seek(begins, position)
+
+    def seek(self, now: float, position: float) -> None:
+        """
+        Continue from position; the step containing it, and any zero-hold
+        steps starting with it, are applied again on the next advance().
+        """
+        if not 0 <= position <= self.length:
+            raise ValueError(f"Position must be between 0 and {self.length}: {position}")
+        self.origin = (self.paused_at if self.paused_at is not None else now) - position
+        index = 0
+        while index + 1 < len(self.starts) and self.starts[index + 1] <= position:
+            index += 1
+        # Back up over zero-hold steps sharing the start, such as set_layer before a fade
+        while index > 0 and self.starts[index - 1] == self.starts[index]:
+            index -= 1
+        self.index = index
+
+    def pause(self, now: float) -> None:
+        if self.paused_at is None:
+            self.paused_at = now
+
+    def resume(self, now: float) -> float:
+        """Resume a paused timeline; return how long it was paused."""
+        if self.paused_at is None:
+            return 0.0
+        paused = now - self.paused_at
+        self.origin += paused
+        self.paused_at = None
+        return paused
+
+    def advance(self, now: float) -> List[Tuple[List[Dict[str, Any]], float]]:
+        """
+        The steps that became due since the last call, in order, each with
+        the seconds elapsed since it began.
+        """
+        due = []
+        if self.paused_at is not None:
+            return due
+        while True:
+            position = now - self.origin
+            if self.index >= len(self.holds):
+                if not self.loop or position < self.length:
+                    break
+                # After a long stall, skip whole passes rather than replaying them
+                passes = int(position // self.length)
+                self.origin += passes * self.length
+                self.passes += passes
+                self.index = 0
+                continue
+            if self.starts[self.index] > position:
+                break
+            due.append((self.commands[self.index], position - self.starts[self.index]))
+            self.index += 1
+        return due
+
+    def next_delay(self, now: float) -> Optional[float]:
+        """Seconds until the next step, or None if paused or finished."""
+        if self.paused_at is not None or self.finished:
+            return None
+        if self.index < len(self.holds):
+            return self.starts[self.index] - self.position(now)
+        return self.length - self.position(now)
+
+    def status(self, now: float) -> Dict[str, Any]:
+        """Position and progress for the timeline query."""
+        if self.paused_at is not None:
+            state = "paused"
+        elif now < self.begins:
+            state = "scheduled"
+        elif self.finished and self.position(now) >= self.length:
+            state = "finished"
+        else:
+            state = "playing"
+        # A scheduled timeline reports the position it will start from
+        position = self.position(max(now, self.begins))
+        position = min(max(position, 0.0), self.length)
+        step = max(self.index - 1, 0)
+        return {
+            "state": state,
+            "position": position,
+            "length": self.length,
+            "step": step,
+            "steps": len(self.holds),
+            "loop": self.loop,
+            "passes": self.passes,
+        }
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Record and break down end-to-end command latency.
+Clients tag commands with a "trace" ID and their send time on the server
+clock ("sent"; TreeClient.start_tracing() does both). The server timestamps
+each hop and keeps the completed traces; record drains them to a JSON lines
+file during a session, and report prints latency percentiles per hop:
+
+    python trace_report.py record --host simpledigitaltwin.local --out session.jsonl
+    python trace_report.py report session.jsonl --by-type
+"""
+
+import argparse
+import json
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 65436
+DRAIN_INTERVAL = 1.0
+PING_SAMPLES = 10
+TIMEOUT = 10.0
+
+# Hop name, start timestamp, end timestamp
+HOPS = (
+    ("network", "sent", "received"),
+    ("queue", "received", "dequeued"),
+    ("apply", "dequeued", "applied"),
+    ("render wait", "applied", "rendered"),
+    ("transfer", "rendered", "shown"),
+)
+
+class Connection:
+    """Newline-delimited JSON request/reply over one socket."""
+
+    def __init__(self, host: str, port: int):
+        self.sock = socket.create_connection((host, port), timeout=TIMEOUT)
+        self.reader = self.sock.makefile("rb")
+
+    def request(self, command: dict) -> dict:
+        self.sock.sendall(json.dumps(command).encode() + b"\n")
+        line = self.reader.readline()
+        if not line.startswith(b"{"):
+            raise RuntimeError(f"Unexpected reply: {line.decode().strip()}")
+        return json.loads(line)
+
+    def clock(self) -> Tuple[float, float]:
+        """Server clock offset and round trip of the fastest ping, in seconds."""
+        best = None
+        for _ in range(PING_SAMPLES):
+            t0 = time.time()
+            reply = self.request({"type": "ping", "t0": t0})
+            t3 = time.time()
+            delay = (t3 - t0) - (reply["t2"] - reply["t1"])
+            if best is None or delay < best[1]:
+                best = (((reply["t1"] - t0) + (reply["t2"] - t3)) / 2, delay)
+        return best
+
+    def close(self) -> None:
+        self.reader.close()
+        self.sock.close()
+
+def record(args: argparse.Namespace) -> None:
+    connection = Connection(args.host, args.port)
+    offset, rtt = connection.clock()
+    count = 0
+    started = time.monotonic()
+    print(f"Clock offset {offset * 1000:+.2f} ms, round trip {rtt * 1000:.2f} ms; recording to {args.out}")
+    with open(args.out, "w") as out:
+        out.write(json.dumps({"session": {"host": args.host, "offset": offset, "rtt": rtt,
+                                          "started": time.time()}}) + "\n")
+        try:
+            while not args.duration or time.monotonic() - started < args.duration:
+                reply = connection.request({"type": "traces"})
+                for trace in reply["traces"]:
+                    out.write(json.dumps(trace) + "\n")
+                count += len(reply["traces"])
+                out.flush()
+                if not reply["remaining"]:
+                    time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+    print(f"Recorded {count} traces")
+
+def load(path: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """The session header (if any) and the traces of a recording."""
+    session = None
+    traces = []
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if "session" in entry:
+                session = entry["session"]
+            else:
+                traces.append(entry)
+    return session, traces
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return f"{'-':>8} {'-':>8} {'-':>8} {'-':>8} {0:>7}"
+    values.sort()
+    p50, p95, p99 = (values[min(int(len(values) * f), len(values) - 1)] * 1000 for f in (0.5, 0.95, 0.99))
+    return f"{p50:8.2f} {p95:8.2f} {p99:8.2f} {values[-1] * 1000:8.2f} {len(values):7d}"
+
+def breakdown(traces: List[Dict[str, Any]]) -> None:
+    print(f"{'hop':<14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'count':>7}")
+    for name, start, end in HOPS:
+        # Commands held for a presentation time wait on purpose; they get their own row
+        values = [t[end] - t[start] for t in traces
+                  if t[start] is not None and t[end] is not None and not (name == "apply" and t["scheduled"])]
+        print(f"{name:<14} {percentiles(values)}")
+    held = [t["applied"] - t["dequeued"] for t in traces if t["scheduled"] and t["applied"] is not None]
+    if held:
+        print(f"{'held for at':<14} {percentiles(held)}")
+    total = [t["shown"] - (t["sent"] if t["sent"] is not None else t["received"])
+             for t in traces if t["shown"] is not None]
+    print(f"{'total':<14} {percentiles(total)}")
+
+def report(args: argparse.Namespace) -> None:
+    session, traces = load(args.path)
+    if not traces:
+        print("No traces recorded")
+        return
+    rejected = sum(1 for t in traces if t["applied"] is None)
+    shown = sum(1 for t in traces if t["shown"] is not None)
+    print(f"{len(traces)} traces: {shown} reached the device, {len(traces) - shown - rejected} "
+          f"changed no frame or are not frame writes, {rejected} rejected or not device commands")
+    if not any(t["sent"] is not None for t in traces):
+        print("No client send times; the network hop is missing and totals start at receive")
+    elif session:
+        # The send times rely on the client's ping estimate of the server clock
+        print(f"Network hop accurate to about +/-{session['rtt'] * 500:.2f} ms (half the recorder's round trip)")
+    print()
+    breakdown(traces)
+    if args.by_type:
+        for kind in sorted({t["type"] for t in traces if t["type"]}):
+            print(f"\n{kind}")
+            breakdown([t for t in traces if t["type"] == kind])
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and break down PiServer command latency")
+    commands = parser.add_subparsers(dest="command", required=True)
+    recorder = commands.add_parser("record", help="Drain traces from a server into a file")
+    recorder.add_argument("--host", default=DEFAULT_HOST)
+    recorder.add_argument("--port", type=int, default=DEFAULT_PORT)
+    recorder.add_argument("--out", required=True, help="JSON lines file to write")
+    recorder.add_argument("--duration", type=float, default=0.0, help="Seconds to record, 0 until interrupted")
+    recorder.add_argument("--interval", type=float, default=DRAIN_INTERVAL, help="Seconds between drains")
+    reporter = commands.add_parser("report", help="Latency per hop of a recorded session")
+    reporter.add_argument("path")
+    reporter.add_argument("--by-type", action="store_true", help="Also break down each command type")
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    else:
+        report(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency tracing.
+A command carrying a "trace" ID, and optionally the client's send time as
+"sent" on the server clock, is timestamped at every hop: received from the
+socket, dequeued by the scheduler, applied to the framebuffer, and the start
+and end of the transfer of the first frame that contains it. Completed
+traces wait in a ring until a client drains them with the traces command;
+trace_report.py records a session and breaks it down per hop.
+"""
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+TRACE_BUFFER = 10000  # Completed traces kept until drained
+TRACE_DRAIN = 1000  # Traces returned per traces command
+TRACE_TIMEOUT = 5.0  # Seconds a trace waits for a frame before it is completed without one
+TRACE_FIELD = "_trace"  # Where the server attaches the trace to a command
+
+# Timestamps in hop order, all time.time() seconds on the server clock
+HOPS = ("sent", "received", "dequeued", "applied", "rendered", "shown")
+
+class Trace:
+    """Timestamps of one traced command."""
+
+    __slots__ = ("id", "type", "device", "scheduled", "version") + HOPS
+
+    def __init__(self, command: Dict[str, Any], received: float):
+        self.id = command["trace"]
+        self.type = command.get("type")
+        self.device = command.get("device")
+        sent = command.get("sent")
+        self.sent = float(sent) if type(sent) in (int, float) else None
+        self.received = received
+        self.dequeued: Optional[float] = None
+        self.applied: Optional[float] = None
+        self.rendered: Optional[float] = None
+        self.shown: Optional[float] = None
+        self.scheduled = False  # Held in the jitter buffer for its presentation time
+        self.version = 0  # Framebuffer version that contains the command
+
+    def to_dict(self) -> Dict[str, Any]:
+        trace = {"id": self.id, "type": self.type, "device": self.device, "scheduled": self.scheduled}
+        for hop in HOPS:
+            trace[hop] = getattr(self, hop)
+        return trace
+
+def begin_trace(command: Any) -> None:
+    """
+    Attach a trace to a received command that asks for one. A client cannot
+    supply the trace object itself.
+    """
+    if type(command) is dict:
+        if "trace" in command:
+            command[TRACE_FIELD] = Trace(command, time.time())
+        elif TRACE_FIELD in command:
+            del command[TRACE_FIELD]
+
+class Tracer:
+    """Completed traces, oldest first, dropped beyond TRACE_BUFFER."""
+
+    def __init__(self, size: int = TRACE_BUFFER):
+        self.completed: Deque[Trace] = deque(maxlen=size)
+        self.total = 0
+
+    def finish(self, trace: Trace) -> None:
+        self.completed.append(trace)
+        self.total += 1
+
+    def drain(self, limit: int = TRACE_DRAIN) -> List[Dict[str, Any]]:
+        """Remove and return up to limit completed traces."""
+        traces = []
+        while self.completed and len(traces) < limit:
+            traces.append(self.completed.popleft().to_dict())
+        return traces
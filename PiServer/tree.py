@@ -1,7 +1,6 @@
 from gpiozero import SPIDevice, SourceMixin
-from colorzero import Color, Hue
-from statistics import mean
-from time import sleep
+from colorzero import Color
+from spi_transport import choose_transport, open_transport
 
 
 class Pixel:
@@ -15,9 +14,9 @@ class Pixel:
 
     @value.setter
     def value(self, value):
-        new_parent_value = list(self.parent.value)
-        new_parent_value[self.index] = value
-        self.parent.value = tuple(new_parent_value)
+        # Only this pixel's bytes change in the parent's transmit buffer
+        self.parent._pack_pixel(self.index, value)
+        self.parent._send()
 
     @property
     def color(self):
@@ -36,12 +35,28 @@ class Pixel:
 
 
 class RGBXmasTree(SourceMixin, SPIDevice):
-    def __init__(self, pixels=25, brightness=0.5, mosi_pin=12, clock_pin=25, *args, **kwargs):
+    def __init__(self, pixels=25, brightness=0.5, mosi_pin=12, clock_pin=25, value=None,
+                 transport="gpiozero", *args, **kwargs):
         super(RGBXmasTree, self).__init__(mosi_pin=mosi_pin, clock_pin=clock_pin, *args, **kwargs)
+        # A faster transport (see spi_transport.py) takes the pins over from
+        # gpiozero's software SPI, which sends one bit per Python-level pin call
+        self.transport = choose_transport(transport, mosi_pin, clock_pin)
+        if self.transport != "gpiozero":
+            self._spi.close()
+            self._spi = open_transport(self.transport, mosi_pin, clock_pin)
         self._all = [Pixel(parent=self, index=i) for i in range(pixels)]
-        self._value = [(0, 0, 0)] * pixels
+        # Transmit buffer reused by every update: start of frame, then
+        # brightness, blue, green, red per pixel, then end of frame
+        self._buf = bytearray(4 + 4 * pixels + 5)
+        self._end = 4 + 4 * pixels
+        # An initial value lets a restarting server show its last frame
+        # straight away instead of blanking the tree first
+        initial = value if value is not None else ((0, 0, 0),) * pixels
+        self._pack(initial)
+        self._value = initial
         self.brightness = brightness
-        self.off()
+        if value is None:
+            self.off()
 
     def __len__(self):
         return len(self._all)
@@ -54,6 +69,8 @@ class RGBXmasTree(SourceMixin, SPIDevice):
 
     @property
     def color(self):
+        # statistics is only needed here, so keep it out of the import path
+        from statistics import mean
         average_r = mean(pixel.color[0] for pixel in self)
         average_g = mean(pixel.color[1] for pixel in self)
         average_b = mean(pixel.color[2] for pixel in self)
@@ -73,25 +90,53 @@ class RGBXmasTree(SourceMixin, SPIDevice):
         max_brightness = 31
         self._brightness_bits = int(brightness * max_brightness)
         self._brightness = brightness
-        self.value = self.value
+        # SSSBBBBB (start, brightness)
+        self._buf[4:self._end:4] = bytes([0b11100000 | self._brightness_bits]) * len(self)
+        self._send()
 
     @property
     def value(self):
+        if self._value is None:
+            # Last set as raw bytes; read back from the transmit buffer
+            buf = self._buf
+            self._value = tuple((buf[i + 3] / 255, buf[i + 2] / 255, buf[i + 1] / 255)
+                                for i in range(4, self._end, 4))
         return self._value
 
     @value.setter
     def value(self, value):
-        start_of_frame = [0]*4
-        end_of_frame = [0]*5
-                     # SSSBBBBB (start, brightness)
-        brightness = 0b11100000 | self._brightness_bits
-        pixels = [[int(255*v) for v in p] for p in value]
-        pixels = [[brightness, b, g, r] for r, g, b in pixels]
-        pixels = [i for p in pixels for i in p]
-        data = start_of_frame + pixels + end_of_frame
-        self._spi.transfer(data)
+        self._pack(value)
+        self._send()
         self._value = value
 
+    def show_frame(self, frame):
+        """
+        Send a frame of 8-bit RGB, 3 bytes per pixel. The colors are copied
+        into the transmit buffer with three slice assignments, so a frame
+        creates no per-pixel objects.
+        """
+        buf = self._buf
+        buf[5:self._end:4] = frame[2::3]
+        buf[6:self._end:4] = frame[1::3]
+        buf[7:self._end:4] = frame[0::3]
+        self._send()
+        self._value = None
+
+    def _pack(self, value):
+        for index, color in enumerate(value):
+            self._pack_pixel(index, color)
+
+    def _pack_pixel(self, index, color):
+        r, g, b = color
+        i = 4 + 4 * index
+        self._buf[i + 1] = int(255 * b)
+        self._buf[i + 2] = int(255 * g)
+        self._buf[i + 3] = int(255 * r)
+        self._value = None
+
+    def _send(self):
+        self._spi.transfer(self._buf)
+
     def on(self):
         self.value = ((1, 1, 1),) * len(self)
 
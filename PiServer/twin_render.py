@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Headless digital twin.
+Renders frames as pictures of the tree from the LED layout, without the
+physical tree or the Unity project. The frames can come from a frame file,
+from a server's framebuffer, or from an effect evaluated offline. Each LED
+is drawn as a soft dot whose footprint is computed once, so a batch of
+frames is a single matrix product and a whole show renders in seconds.
+Frames and pictures are NumPy arrays for tests, or compact PNG strips:
+
+    python twin_render.py render shows/fireworks.frames --out fireworks.png
+    python twin_render.py effect spiral --params '{"turns": 2}' --seconds 10 --out spiral.frames
+    python twin_render.py diff expected.frames spiral.frames --out diff.png
+    python twin_render.py capture --host simpledigitaltwin.local --seconds 10 --out live.frames
+"""
+
+import argparse
+import json
+import socket
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+from typing import Any, Dict, Optional, Sequence, Tuple
+from geometry import DEFAULT_LAYOUT, Geometry, load_geometry
+from playback import FrameFile, FrameFileWriter
+
+# Constants for default configuration
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 65436
+DEFAULT_FPS = 50.0
+DEFAULT_SIZE = 48  # Height and width of each view, in image pixels
+DEFAULT_DOT = 0.03  # Dot radius (one standard deviation), as a fraction of the view size
+DEFAULT_STRIP_WIDTH = 4  # Image pixels per LED in a timeline strip
+BATCH_FRAMES = 1024  # Frames rendered per matrix product
+TIMEOUT = 10.0
+
+# Image axes of each view: (horizontal, vertical) layout axes, vertical drawn down
+VIEWS = {"front": (0, 1), "side": (2, 1), "top": (0, 2)}
+
+def view_coordinates(geometry: Geometry, view: str) -> np.ndarray:
+    """
+    Each LED's position in a view as (u, v), both 0-1 with v down. All views
+    share one scale, the layout's largest extent, so they keep proportions.
+    """
+    horizontal, vertical = VIEWS[view]
+    positions = geometry.positions
+    low = positions.min(axis=0)
+    span = float((positions.max(axis=0) - low).max()) or 1.0
+    u = (positions[:, horizontal] - low[horizontal]) / span
+    v = (positions[:, vertical] - low[vertical]) / span
+    # Center the narrower axis, and draw up as up
+    u += (1.0 - u.max()) / 2
+    v = 1.0 - v - (1.0 - v.max()) / 2 if vertical == 1 else v + (1.0 - v.max()) / 2
+    return np.column_stack((u, v))
+
+class TwinRenderer:
+    """
+    Draws frames of 8-bit RGB as images of the layout, one or more views
+    side by side. LEDs are Gaussian dots that add up where they overlap.
+    The dots are a fixed (pixels, image pixels) weight matrix, so rendering
+    a batch of frames is one matrix product.
+    """
+
+    def __init__(self, geometry: Geometry, views: Sequence[str] = ("front",),
+                 size: int = DEFAULT_SIZE, dot: float = DEFAULT_DOT):
+        unknown = [view for view in views if view not in VIEWS]
+        if unknown or not views:
+            raise ValueError(f"Views must be some of {', '.join(VIEWS)}: {', '.join(views)}")
+        if size < 4:
+            raise ValueError(f"Size must be at least 4 pixels: {size}")
+        self.pixels = geometry.pixels
+        self.height = size
+        self.width = size * len(views)
+        # Keep every dot inside its view
+        margin = 3 * dot
+        rows = (np.arange(size) + 0.5) / size
+        cols = (np.arange(self.width) + 0.5) / size
+        weights = np.zeros((self.pixels, size, self.width), dtype=np.float32)
+        for number, view in enumerate(views):
+            u, v = view_coordinates(geometry, view).T * (1 - 2 * margin) + margin
+            dy = rows[None, :] - v[:, None]
+            dx = cols[None, :] - (u[:, None] + number)
+            weights += (np.exp(-dy ** 2 / (2 * dot ** 2))[:, :, None]
+                        * np.exp(-dx ** 2 / (2 * dot ** 2))[:, None, :])
+        # Drop the tails that cannot change a pixel; they also slow the product down as denormals
+        weights[weights < 1 / 512] = 0.0
+        self.weights = weights.reshape(self.pixels, -1)
+
+    def frames(self, frames: Any) -> np.ndarray:
+        """Frames as a (frames, pixels, 3) uint8 array, from bytes or an array."""
+        if isinstance(frames, (bytes, bytearray, memoryview)):
+            frames = np.frombuffer(frames, dtype=np.uint8)
+        frames = np.asarray(frames, dtype=np.uint8)
+        if frames.size % (self.pixels * 3):
+            raise ValueError(f"Frames must be whole frames of {self.pixels} pixels")
+        return frames.reshape(-1, self.pixels, 3)
+
+    def render(self, frames: Any) -> np.ndarray:
+        """Images of frames as a (frames, height, width, 3) uint8 array."""
+        frames = self.frames(frames)
+        images = np.empty((len(frames), self.height, self.width, 3), dtype=np.uint8)
+        for start in range(0, len(frames), BATCH_FRAMES):
+            batch = frames[start:start + BATCH_FRAMES]
+            # (frames, 3, pixels) x (pixels, image pixels): every channel of every frame at once
+            light = np.matmul(batch.transpose(0, 2, 1).astype(np.float32), self.weights)
+            np.clip(light, 0.0, 255.0, out=light)
+            images[start:start + len(batch)] = (light + 0.5).astype(np.uint8).reshape(
+                len(batch), 3, self.height, self.width).transpose(0, 2, 3, 1)
+        return images
+
+def timeline_strip(frames: np.ndarray, width: int = DEFAULT_STRIP_WIDTH) -> np.ndarray:
+    """
+    The most compact picture of a show: one row per frame, one column of
+    width image pixels per LED, time running down.
+    """
+    return np.repeat(np.asarray(frames, dtype=np.uint8), width, axis=1)
+
+def contact_sheet(images: np.ndarray, columns: int = 10) -> np.ndarray:
+    """Images tiled left to right, top to bottom, into one image."""
+    count, height, width = images.shape[:3]
+    rows = -(-count // columns)
+    columns = min(columns, count)
+    sheet = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+    for index, image in enumerate(images):
+        row, column = divmod(index, columns)
+        sheet[row * height:(row + 1) * height, column * width:(column + 1) * width] = image
+    return sheet
+
+def write_png(path: str, image: np.ndarray) -> None:
+    """Write an (height, width, 3) uint8 image as a PNG, with the standard library only."""
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width = image.shape[:2]
+    # Each row starts with filter type 0 (none)
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), image.reshape(height, -1)), axis=1)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+def load_frames(path: str) -> Tuple[np.ndarray, float]:
+    """Every frame of a frame file as a (frames, pixels, 3) array, and its frame rate."""
+    show = FrameFile(path)
+    try:
+        frames = np.frombuffer(show.read_all(), dtype=np.uint8).reshape(show.frames, show.pixels, 3)
+        return frames, show.fps
+    finally:
+        show.close()
+
+def save_frames(path: str, frames: np.ndarray, fps: float) -> None:
+    """Write a (frames, pixels, 3) array as a frame file."""
+    frames = np.asarray(frames, dtype=np.uint8)
+    with FrameFileWriter(path, frames.shape[1], fps) as writer:
+        for frame in frames:
+            writer.write(frame.tobytes())
+
+def effect_frames(name: str, geometry: Geometry, params: Dict[str, Any], seconds: float,
+                  fps: float = DEFAULT_FPS, start: float = 0.0, seed: Optional[int] = 0) -> np.ndarray:
+    """
+    An effect evaluated offline at start, start + 1/fps, ... for seconds, as
+    a (frames, pixels, 3) array. Inline effects are exact; hosted generators
+    run in this process with a seeded random generator so runs repeat.
+    """
+    from effects import EFFECTS, HOSTED_EFFECTS
+    count = max(int(round(seconds * fps)), 1)
+    frames = np.empty((count, geometry.pixels, 3), dtype=np.uint8)
+    if name in HOSTED_EFFECTS:
+        from effect_host import GENERATORS
+        generator = GENERATORS[name](geometry, params)
+        generator.rng = np.random.default_rng(seed)
+        for index in range(count):
+            rgb = generator.frame(start + index / fps, 1.0 / fps)
+            frames[index] = (np.clip(rgb, 0.0, 1.0) * 255 + 0.5).astype(np.uint8)
+        return frames
+    if name not in EFFECTS:
+        raise ValueError(f"Effect cannot be rendered offline: {name}")
+    effect = EFFECTS[name](name, geometry, params)
+    for index in range(count):
+        frames[index] = np.frombuffer(effect.render(start + index / fps), dtype=np.uint8).reshape(-1, 3)
+    return frames
+
+def capture(host: str, port: int, seconds: float, fps: float = DEFAULT_FPS,
+            device: Optional[str] = None) -> np.ndarray:
+    """Poll a server's framebuffer fps times a second for seconds; return the frames."""
+    request = {"type": "get_state"}
+    if device:
+        request["device"] = device
+    with socket.create_connection((host, port), timeout=TIMEOUT) as sock:
+        reader = sock.makefile("rb")
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        line = reader.readline()
+        if not line.startswith(b"{"):
+            raise RuntimeError(f"Unexpected reply: {line.decode().strip()}")
+        size = len(json.loads(line)["pixels"]) * 3
+        binary = json.dumps(dict(request, format="binary")).encode() + b"\n"
+        frames = []
+        started = time.monotonic()
+        while len(frames) < seconds * fps:
+            sock.sendall(binary)
+            frame = reader.read(size)
+            if len(frame) < size:
+                raise RuntimeError("Connection closed during capture")
+            frames.append(frame)
+            delay = started + len(frames) / fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        reader.close()
+    return np.frombuffer(b"".join(frames), dtype=np.uint8).reshape(len(frames), -1, 3)
+
+def compare(expected: np.ndarray, actual: np.ndarray, tolerance: int = 0) -> Dict[str, Any]:
+    """
+    Differences between two runs of frames. A frame differs if any channel is
+    off by more than tolerance; frames missing from either run differ.
+    """
+    expected = np.asarray(expected, dtype=np.uint8)
+    actual = np.asarray(actual, dtype=np.uint8)
+    if expected.shape[1:] != actual.shape[1:]:
+        raise ValueError(f"Frames differ in shape: {expected.shape[1:]} and {actual.shape[1:]}")
+    common = min(len(expected), len(actual))
+    error = np.abs(expected[:common].astype(np.int16) - actual[:common].astype(np.int16))
+    worst = error.reshape(common, -1).max(axis=1) if common else np.zeros(0, dtype=np.int16)
+    differing = np.flatnonzero(worst > tolerance)
+    extra = max(len(expected), len(actual)) - common
+    first = int(differing[0]) if len(differing) else (common if extra else None)
+    return {
+        "frames": max(len(expected), len(actual)),
+        "differing": int(len(differing)) + extra,
+        "first": first,
+        "max_error": int(worst.max()) if common else 0,
+        "mean_error": float(error.mean()) if common else 0.0,
+    }
+
+def diff_strip(expected: np.ndarray, actual: np.ndarray, width: int = DEFAULT_STRIP_WIDTH) -> np.ndarray:
+    """Expected, actual and their absolute difference as timeline strips side by side."""
+    common = min(len(expected), len(actual))
+    expected, actual = expected[:common], actual[:common]
+    difference = np.abs(expected.astype(np.int16) - actual.astype(np.int16)).astype(np.uint8)
+    gap = np.full((common, width, 3), 128, dtype=np.uint8)
+    return np.concatenate([timeline_strip(expected, width), gap, timeline_strip(actual, width), gap,
+                           timeline_strip(difference, width)], axis=1)
+
+def _save(path: str, image: np.ndarray) -> None:
+    if path.endswith(".npy"):
+        np.save(path, image)
+    else:
+        write_png(path, image)
+
+def render_command(args: argparse.Namespace) -> None:
+    frames, fps = load_frames(args.source)
+    geometry = load_geometry(frames.shape[1], args.layout)
+    if args.mode == "strip":
+        image = timeline_strip(frames, args.strip_width)
+    else:
+        renderer = TwinRenderer(geometry, args.views.split(","), args.size, args.dot)
+        started = time.perf_counter()
+        images = renderer.render(frames[::max(args.every, 1)])
+        elapsed = time.perf_counter() - started
+        print(f"Rendered {len(images)} frames in {elapsed:.3f} s "
+              f"({len(images) / max(elapsed, 1e-9):.0f} frames/s)", file=sys.stderr)
+        image = images if args.out.endswith(".npy") else contact_sheet(images, args.columns)
+    _save(args.out, image)
+    print(f"Wrote {args.out} from {len(frames)} frames ({len(frames) / fps:.1f} s at {fps:g} fps)",
+          file=sys.stderr)
+
+def effect_command(args: argparse.Namespace) -> None:
+    geometry = Geometry.load(args.layout)
+    frames = effect_frames(args.effect, geometry, json.loads(args.params), args.seconds, args.fps,
+                           args.start, args.seed)
+    if args.out.endswith(".frames"):
+        save_frames(args.out, frames, args.fps)
+    else:
+        _save(args.out, timeline_strip(frames, args.strip_width))
+    print(f"Wrote {len(frames)} frames of {args.effect} to {args.out}", file=sys.stderr)
+
+def diff_command(args: argparse.Namespace) -> None:
+    expected, _ = load_frames(args.expected)
+    actual, _ = load_frames(args.actual)
+    result = compare(expected, actual, args.tolerance)
+    if args.out:
+        _save(args.out, diff_strip(expected, actual, args.strip_width))
+    print(json.dumps(result))
+    if result["differing"]:
+        sys.exit(1)
+
+def capture_command(args: argparse.Namespace) -> None:
+    frames = capture(args.host, args.port, args.seconds, args.fps, args.device)
+    save_frames(args.out, frames, args.fps)
+    print(f"Captured {len(frames)} frames to {args.out}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render PiServer frames without the tree")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT, help="LED layout file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="Draw a frame file as a contact sheet or strip")
+    render.add_argument("source", help="Frame file")
+    render.add_argument("--out", required=True, help="PNG to write, or .npy for the array")
+    render.add_argument("--mode", choices=("sheet", "strip"), default="sheet",
+                        help="sheet: twin images tiled; strip: one row of LEDs per frame")
+    render.add_argument("--views", default="front", help=f"Comma-separated views: {', '.join(VIEWS)}")
+    render.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Pixels per view side")
+    render.add_argument("--dot", type=float, default=DEFAULT_DOT, help="LED dot radius, fraction of a view")
+    render.add_argument("--every", type=int, default=1, help="Draw every Nth frame in a sheet")
+    render.add_argument("--columns", type=int, default=10, help="Images per row of a sheet")
+
+    effect = commands.add_parser("effect", help="Evaluate an effect offline")
+    effect.add_argument("effect")
+    effect.add_argument("--params", default="{}", help="Effect parameters as JSON")
+    effect.add_argument("--seconds", type=float, default=10.0)
+    effect.add_argument("--fps", type=float, default=DEFAULT_FPS)
+    effect.add_argument("--start", type=float, default=0.0, help="Effect time of the first frame")
+    effect.add_argument("--seed", type=int, default=0, help="Random seed for generative effects")
+    effect.add_argument("--out", required=True, help="Frame file, or a PNG/.npy strip")
+
+    diff = commands.add_parser("diff", help="Compare two frame files; exit status 1 if they differ")
+    diff.add_argument("expected")
+    diff.add_argument("actual")
+    diff.add_argument("--tolerance", type=int, default=0, help="Allowed error per channel")
+    diff.add_argument("--out", help="PNG of expected, actual and difference strips")
+
+    grab = commands.add_parser("capture", help="Record a server's framebuffer into a frame file")
+    grab.add_argument("--host", default=DEFAULT_HOST)
+    grab.add_argument("--port", type=int, default=DEFAULT_PORT)
+    grab.add_argument("--device", help="Device to capture (default: the server's default)")
+    grab.add_argument("--seconds", type=float, default=10.0)
+    grab.add_argument("--fps", type=float, default=DEFAULT_FPS)
+    grab.add_argument("--out", required=True, help="Frame file to write")
+
+    for command in (render, effect, diff):
+        command.add_argument("--strip-width", type=int, default=DEFAULT_STRIP_WIDTH,
+                             help="Image pixels per LED in strips")
+    args = parser.parse_args()
+
+    if args.command == "render":
+        render_command(args)
+    elif args.command == "effect":
+        effect_command(args)
+    elif args.command == "diff":
+        diff_command(args)
+    else:
+        capture_command(args)
+
+if __name__ == "__main__":
+    main()
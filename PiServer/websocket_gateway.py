@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+WebSocket gateway for browser-based digital twins.
+Browsers connect straight to the server instead of through a TCP proxy.
+Commands go through the same fair scheduler as TCP clients, and subscribed
+connections receive state broadcasts. Each broadcast is encoded and framed
+once per change however many tabs are watching, and each tab only keeps the
+latest frame queued.
+Implements the RFC 6455 server side with the standard library only.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from scheduler import INVALID_JSON, ClientSession, CommandScheduler, tune_keepalive
+from tracing import TRACE_FIELD
+
+# Constants for default configuration
+MAX_MESSAGE_SIZE = 65536  # Largest client message accepted
+MAX_HEADER_SIZE = 8192
+BROADCAST_POLL_INTERVAL = 0.5  # Seconds between broadcaster stop checks
+SUBSCRIPTION_COMMANDS = ("subscribe", "unsubscribe")  # Answered by the gateway rather than the server
+STATE_FORMATS = ("json", "binary")
+TWIN_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "twin.html")
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+logger = logging.getLogger(__name__)
+
+class ProtocolError(Exception):
+    """A client broke the WebSocket protocol; carries the close code."""
+
+    def __init__(self, message: str, code: int = CLOSE_PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+def encode_frame(payload: bytes, opcode: int = OP_TEXT) -> bytes:
+    """Frame a complete, unmasked server-to-client message."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+def _unmask(payload: bytes, mask: bytes) -> bytes:
+    # One big-integer XOR is far faster than a per-byte loop
+    key = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    value = int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")
+    return value.to_bytes(len(payload), "big")
+
+def _read_exact(rfile, size: int) -> bytes:
+    """Read exactly size bytes; EOFError if the connection ends first."""
+    data = rfile.read(size)
+    if len(data) < size:
+        raise EOFError
+    return data
+
+def read_frame(rfile) -> Tuple[bool, int, bytes]:
+    """Read one client frame; returns (fin, opcode, payload)."""
+    header = _read_exact(rfile, 2)
+    fin = bool(header[0] & 0x80)
+    opcode = header[0] & 0x0F
+    if not header[1] & 0x80:
+        raise ProtocolError("Client frames must be masked")
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", _read_exact(rfile, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", _read_exact(rfile, 8))[0]
+    if length > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Frame too large: {length} bytes", CLOSE_TOO_BIG)
+    mask = _read_exact(rfile, 4)
+    return fin, opcode, _unmask(_read_exact(rfile, length), mask)
+
+def parse_commands(message: bytes) -> Iterator[Any]:
+    """
+    Yield the JSON commands in one message; a message may hold several,
+    newline-delimited or back to back. Yields INVALID_JSON for bad input.
+    """
+    decoder = json.JSONDecoder()
+    try:
+        text = message.decode()
+    except UnicodeDecodeError:
+        yield INVALID_JSON
+        return
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos == len(text):
+            return
+        try:
+            command, pos = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            yield INVALID_JSON
+            return
+        yield command
+
+class WebSocketSession(ClientSession):
+    """Scheduler session whose replies are sent as WebSocket messages."""
+
+    def __init__(self, conn: socket.socket, addr: tuple, rate: float, burst: float):
+        super().__init__(conn, addr, rate, burst)
+        self.subscription: Optional[Tuple[str, str]] = None  # (device ID, format)
+        self.gateway: Optional["WebSocketGateway"] = None  # Set by the gateway that accepted the connection
+
+    def send(self, data: bytes, opcode: int = OP_TEXT) -> None:
+        super().send(encode_frame(data, opcode))
+
+    def heartbeat(self) -> None:
+        # Browsers answer pings with a pong, which counts as activity
+        self.send(b"", OP_PING)
+
+    def execute(self, command: Any, handler: Callable[[Any], bytes]) -> None:
+        # Subscriptions are queued, rate-limited and traced like any other
+        # command, then answered by the gateway on the scheduler thread
+        if type(command) is dict and command.get("type") in SUBSCRIPTION_COMMANDS:
+            self.gateway.handle_subscription(self, command)
+        else:
+            super().execute(command, handler)
+
+    def reply(self, command: Any, data: bytes) -> None:
+        binary = command.get("type") == "get_state" and command.get("format") == "binary"
+        self.send(data, OP_BINARY if binary else OP_TEXT)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["transport"] = "websocket"
+        stats["subscription"] = self.subscription[0] if self.subscription else None
+        return stats
+
+class WebSocketGateway(threading.Thread):
+    """
+    Accepts WebSocket connections on their own port and feeds their commands
+    to the server's scheduler. A plain GET serves the browser twin page.
+    """
+
+    def __init__(self, host: str, port: int, scheduler: CommandScheduler, devices):
+        super().__init__(name="websocket-gateway", daemon=True)
+        self.host = host
+        self.port = port
+        self.scheduler = scheduler
+        self.devices = devices
+        self.running = False
+        self.subscribers: Dict[str, List[WebSocketSession]] = {}
+        self._lock = threading.Lock()
+        self._socket: Optional[socket.socket] = None
+        self._broadcasters: List[threading.Thread] = []
+
+    def _framebuffers(self):
+        return [(device_id, controller.framebuffer) for device_id, controller in self.devices
+                if hasattr(controller, "framebuffer")]
+
+    def start(self) -> None:
+        """Bind the port and start accepting connections and broadcasting."""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen()
+        self.running = True
+        for device_id, framebuffer in self._framebuffers():
+            broadcaster = threading.Thread(target=self._broadcast_loop, args=(device_id, framebuffer),
+                                           name=f"broadcast-{device_id}", daemon=True)
+            broadcaster.start()
+            self._broadcasters.append(broadcaster)
+        super().start()
+        logger.info(f"WebSocket gateway started on {self.host}:{self.port}")
+
+    def run(self) -> None:
+        while self.running:
+            try:
+                conn, addr = self._socket.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            tune_keepalive(conn, self.scheduler.keepalive_idle)
+            threading.Thread(target=self.handle_client, args=(conn, addr),
+                             name=f"ws-client-{addr}", daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop accepting connections and broadcasting."""
+        self.running = False
+        if self._socket:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+        for broadcaster in self._broadcasters:
+            broadcaster.join()
+        if self.is_alive():
+            self.join()
+
+    def handle_client(self, conn: socket.socket, addr: tuple) -> None:
+        """Upgrade the connection, then read messages into its scheduler inbox."""
+        with conn:
+            rfile = conn.makefile("rb")
+            try:
+                if not self._handshake(conn, rfile):
+                    return
+            except (OSError, ValueError) as e:
+                logger.error(f"WebSocket handshake with {addr} failed: {e}")
+                return
+            logger.info(f"WebSocket connected by {addr}")
+            session = self.scheduler.open_session(conn, addr, WebSocketSession)
+            session.gateway = self
+            try:
+                self._read_messages(session, rfile)
+            except ProtocolError as e:
+                logger.error(f"WebSocket protocol error from {addr}: {e}")
+                session.send(struct.pack("!H", e.code), OP_CLOSE)
+            except (OSError, EOFError) as e:
+                if not isinstance(e, EOFError):
+                    logger.error(f"Error reading from WebSocket client {addr}: {e}")
+                    session.abort("dead")
+            finally:
+                # Queued commands, subscriptions included, finish before the subscription is dropped
+                self.scheduler.close_session(session)
+                self._unsubscribe(session)
+                rfile.close()
+                logger.info(f"WebSocket disconnected {addr}")
+
+    def _handshake(self, conn: socket.socket, rfile) -> bool:
+        """Answer the HTTP upgrade request; returns False if there was none."""
+        request_line = rfile.readline(MAX_HEADER_SIZE).decode("latin-1")
+        headers = {}
+        size = len(request_line)
+        while True:
+            line = rfile.readline(MAX_HEADER_SIZE).decode("latin-1")
+            size += len(line)
+            if size > MAX_HEADER_SIZE:
+                raise ValueError("Request headers too large")
+            if not line.strip():
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        method, _, path = request_line.partition(" ")
+        path = path.split(" ")[0]
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or not key:
+            if method == "GET" and path in ("/", "/twin.html"):
+                self._serve_page(conn)
+            else:
+                conn.sendall(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        conn.sendall(("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\n"
+                      "Connection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        return True
+
+    def _serve_page(self, conn: socket.socket) -> None:
+        try:
+            with open(TWIN_PAGE, "rb") as f:
+                body = f.read()
+        except OSError:
+            conn.sendall(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return
+        conn.sendall(("HTTP/1.1 200 OK\r\n"
+                      "Content-Type: text/html; charset=utf-8\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      "Connection: close\r\n\r\n").encode() + body)
+
+    def _read_messages(self, session: WebSocketSession, rfile) -> None:
+        message = b""
+        message_opcode = None
+        while self.running and not session.closed:
+            fin, opcode, payload = read_frame(rfile)
+            # Control frames may arrive between the fragments of a message
+            session.touch(partial=message_opcode is not None if opcode >= OP_CLOSE else not fin)
+            if opcode == OP_PING:
+                session.send(payload, OP_PONG)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                session.send(payload[:2], OP_CLOSE)
+                return
+            if opcode == OP_CONTINUATION:
+                if message_opcode is None:
+                    raise ProtocolError("Unexpected continuation frame")
+            elif opcode in (OP_TEXT, OP_BINARY):
+                if message_opcode is not None:
+                    raise ProtocolError("Expected continuation frame")
+                message_opcode = opcode
+            else:
+                raise ProtocolError(f"Unknown opcode: {opcode}")
+            message += payload
+            if len(message) > MAX_MESSAGE_SIZE:
+                raise ProtocolError(f"Message too large: {len(message)} bytes", CLOSE_TOO_BIG)
+            if not fin:
+                continue
+            for command in parse_commands(message):
+                self.scheduler.submit(session, command)
+            message = b""
+            message_opcode = None
+
+    def handle_subscription(self, session: WebSocketSession, command: Dict[str, Any]) -> None:
+        """
+        {"type": "subscribe", "device": "tree", "format": "binary"} streams the
+        device's state on every change; "unsubscribe" stops it. A connection
+        has one subscription at a time. Called by the scheduler; bad input
+        raises ValueError, which is answered with an error.
+        """
+        trace = command.get(TRACE_FIELD)
+        if trace is not None:
+            trace.dequeued = time.time()
+        try:
+            self._subscribe(session, command)
+        finally:
+            tracer = getattr(self.devices, "tracer", None)
+            if trace is not None and tracer is not None:
+                tracer.finish(trace)
+
+    def _subscribe(self, session: WebSocketSession, command: Dict[str, Any]) -> None:
+        self._unsubscribe(session)
+        if command["type"] == "unsubscribe":
+            session.send(b"OK\n")
+            return
+        device_id = command.get("device")
+        if device_id is not None and type(device_id) is not str:
+            raise ValueError(f"device must be a string: {device_id!r}")
+        device_id = device_id or self.devices.default_id
+        framebuffer = getattr(self.devices.get(device_id), "framebuffer", None)
+        if framebuffer is None:
+            raise ValueError(f"Device has no framebuffer: {device_id}")
+        fmt = command.get("format", "json")
+        if fmt not in STATE_FORMATS:
+            raise ValueError(f"Unknown state format: {fmt!r}")
+        state = framebuffer.encode_state(fmt)
+        with self._lock:
+            # The connection may have closed while the command was queued
+            if session.closed:
+                return
+            session.subscription = (device_id, fmt)
+            self.subscribers.setdefault(device_id, []).append(session)
+        session.send(b"OK\n")
+        # Start the twin from the current frame rather than the next change
+        session.publish(encode_frame(state, OP_BINARY if fmt == "binary" else OP_TEXT))
+
+    def _unsubscribe(self, session: WebSocketSession) -> None:
+        with self._lock:
+            if session.subscription:
+                self.subscribers[session.subscription[0]].remove(session)
+                session.subscription = None
+
+    def _broadcast_loop(self, device_id: str, framebuffer) -> None:
+        """Publish every new version of a device's frame to its subscribers."""
+        version = framebuffer.version
+        while self.running:
+            frame, version = framebuffer.wait_for_change(version, BROADCAST_POLL_INTERVAL)
+            if frame is None:
+                continue
+            with self._lock:
+                sessions = list(self.subscribers.get(device_id, ()))
+            # Encode and frame once per format, then hand the same bytes to every tab
+            framed: Dict[str, bytes] = {}
+            for session in sessions:
+                fmt = session.subscription[1] if session.subscription else None
+                if fmt is None:
+                    continue
+                if fmt not in framed:
+                    opcode = OP_BINARY if fmt == "binary" else OP_TEXT
+                    framed[fmt] = encode_frame(framebuffer.encode_state(fmt), opcode)
+                session.publish(framed[fmt])
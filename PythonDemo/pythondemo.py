@@ -4,73 +4,24 @@ Demo client for the RGB Christmas Tree server.
 Shows various patterns and animations that can be sent to the tree.
 """
 
-import socket
-import json
 import time
 import random
 import math
 from typing import List, Tuple
+from tree_client import TreeClient as BaseClient
 
-class TreeClient:
-    def __init__(self, host: str = "simpledigitaltwin.local", port: int = 65436):
-        self.host = host
-        self.port = port
-        self.socket = None
-
-    def connect(self) -> None:
-        """Connect to the tree server."""
-        try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            print(f"Connected to server at {self.host}:{self.port}")
-        except socket.gaierror as e:
-            raise ConnectionError(f"Could not resolve hostname {self.host}. Make sure the Raspberry Pi is running and the hostname is correct.") from e
-        except ConnectionRefusedError as e:
-            raise ConnectionError(f"Connection refused to {self.host}:{self.port}. Make sure the server is running.") from e
-
-    def disconnect(self) -> None:
-        """Disconnect from the tree server."""
-        if self.socket:
-            self.socket.close()
-            self.socket = None
-            print("Disconnected from server")
-
-    def send_command(self, command: dict) -> None:
-        """Send a command to the tree server."""
-        if not self.socket:
-            raise ConnectionError("Not connected to server")
-        
-        self.socket.sendall(json.dumps(command).encode())
-        response = self.socket.recv(1024).decode()
-        print(f"Response: {response.strip()}")
-
-    def set_pixel(self, pixel: int, color: List[float]) -> None:
-        """Set a single pixel to a specific color."""
-        self.send_command({
-            "type": "set_pixel",
-            "pixel": pixel,
-            "color": color
-        })
-
-    def set_all(self, color: List[float]) -> None:
-        """Set all pixels to a specific color."""
-        self.send_command({
-            "type": "set_all",
-            "color": color
-        })
-
-    def off(self) -> None:
-        """Turn all pixels off."""
-        self.send_command({"type": "off"})
+class TreeClient(BaseClient):
+    """The tree client with the demo animations."""
 
     def rainbow_wave(self, duration: float = 10.0) -> None:
         """Create a rainbow wave effect."""
         start_time = time.time()
         while time.time() - start_time < duration:
-            for i in range(25):  # 25 pixels in the tree
-                hue = (i / 25.0 + (time.time() - start_time) / 5.0) % 1.0
-                r, g, b = self.hsv_to_rgb(hue, 1.0, 1.0)
-                self.set_pixel(i, [r, g, b])
+            with self.frame():  # One message per step instead of one per pixel
+                for i in range(25):  # 25 pixels in the tree
+                    hue = (i / 25.0 + (time.time() - start_time) / 5.0) % 1.0
+                    r, g, b = self.hsv_to_rgb(hue, 1.0, 1.0)
+                    self.set_pixel(i, [r, g, b])
             time.sleep(0.05)
 
     def sparkle(self, duration: float = 10.0) -> None:
@@ -78,10 +29,11 @@ class TreeClient:
         start_time = time.time()
         while time.time() - start_time < duration:
             # Randomly select pixels to light up
-            for _ in range(5):  # Light up 5 pixels at a time
-                pixel = random.randint(0, 24)
-                color = [random.random(), random.random(), random.random()]
-                self.set_pixel(pixel, color)
+            with self.frame():
+                for _ in range(5):  # Light up 5 pixels at a time
+                    pixel = random.randint(0, 24)
+                    color = [random.random(), random.random(), random.random()]
+                    self.set_pixel(pixel, color)
             time.sleep(0.1)
             self.off()
             time.sleep(0.1)
@@ -95,13 +47,14 @@ class TreeClient:
 
     def breathing(self, color: List[float], duration: float = 5.0) -> None:
         """Create a breathing effect with a specific color."""
-        start_time = time.time()
-        while time.time() - start_time < duration:
-            # Calculate brightness using a sine wave
-            brightness = (math.sin((time.time() - start_time) * 2) + 1) / 2
-            dimmed_color = [c * brightness for c in color]
-            self.set_all(dimmed_color)
-            time.sleep(0.05)
+        # One looping keyframes command; the server interpolates every frame
+        half_period = math.pi / 2  # Matches the former sin(2t) cycle
+        self.keyframes([
+            {"color": color, "duration": half_period, "easing": "sine"},
+            {"color": [0.0, 0.0, 0.0], "duration": half_period, "easing": "sine"}
+        ], loop=True)
+        time.sleep(duration)
+        self.set_all([0.0, 0.0, 0.0])
 
     @staticmethod
     def hsv_to_rgb(h: float, s: float, v: float) -> Tuple[float, float, float]:
@@ -129,6 +82,41 @@ class TreeClient:
         if i == 5:
             return v, p, q
 
+def demo_show() -> List[dict]:
+    """The demo as a timeline of steps, played by the server on its own clock."""
+    steps = []
+    # Color wipes: one pixel every 80 ms, then a one second pause
+    for color in ([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]):
+        for i in range(25):
+            steps.append({"hold": 0.08, "command": {"type": "set_pixel", "pixel": i, "color": color}})
+        steps[-1]["hold"] += 1.0
+    # Breathing: red fading in and out
+    half_period = math.pi / 2
+    steps.append({"hold": 5.0, "command": {"type": "keyframes", "loop": True, "keyframes": [
+        {"color": [1.0, 0.0, 0.0], "duration": half_period, "easing": "sine"},
+        {"color": [0.0, 0.0, 0.0], "duration": half_period, "easing": "sine"}
+    ]}})
+    steps.append({"hold": 1.0, "command": {"type": "off"}})
+    # Rainbow wave: the hue pattern rotating once every 5 seconds, twice.
+    # Frames go as hex 8-bit RGB to keep the upload small
+    frames = [bytes(int(c * 255) for i in range(25)
+                    for c in TreeClient.hsv_to_rgb((i + k) / 25.0 % 1.0, 1.0, 1.0)).hex()
+              for k in range(1, 26)]
+    steps.append({"hold": 0.0, "command": {"type": "set_frame", "data": frames[-1]}})
+    steps.append({"hold": 10.0, "command": {"type": "keyframes", "loop": True, "keyframes": [
+        {"data": frame, "duration": 0.2} for frame in frames
+    ]}})
+    # Sparkle: 5 random pixels for 100 ms, then dark for 100 ms
+    for _ in range(50):
+        steps.append({"hold": 0.1, "commands": [
+            {"type": "set_pixel", "pixel": random.randint(0, 24),
+             "color": [round(random.random(), 3) for _ in range(3)]}
+            for _ in range(5)
+        ]})
+        steps.append({"hold": 0.1, "command": {"type": "off"}})
+    steps.append({"hold": 0.0, "command": {"type": "off"}})
+    return steps
+
 def main():
     """Run the demo."""
     # Create client with DNS name
@@ -137,31 +125,22 @@ def main():
     try:
         client.connect()
         
-        print("\nDemo 1: Color Wipe")
-        client.color_wipe([1.0, 0.0, 0.0])  # Red
-        time.sleep(1)
-        client.color_wipe([0.0, 1.0, 0.0])  # Green
-        time.sleep(1)
-        client.color_wipe([0.0, 0.0, 1.0])  # Blue
-        time.sleep(1)
-        
-        print("\nDemo 2: Breathing Effect")
-        client.breathing([1.0, 0.0, 0.0])  # Red breathing
-        time.sleep(1)
-        
-        print("\nDemo 3: Rainbow Wave")
-        client.rainbow_wave()
-        time.sleep(1)
-        
-        print("\nDemo 4: Sparkle Effect")
-        client.sparkle()
-        time.sleep(1)
+        # The whole show is uploaded once; it keeps playing if this laptop
+        # sleeps or the network drops
+        print("\nUploading demo show")
+        status = client.play_timeline(demo_show())
+        print(f"Playing {status['length']:.0f} s show")
+        while status["state"] != "finished":
+            time.sleep(5)
+            status = client.timeline()
+            print(f"Show at {status['position']:.0f} s of {status['length']:.0f} s")
         
         print("\nDemo Complete!")
-        client.off()
         
     except KeyboardInterrupt:
         print("\nDemo interrupted by user")
+        client.timeline("stop")
+        client.off()
     except Exception as e:
         print(f"\nError: {e}")
     finally:
@@ -6,16 +6,17 @@ Provides a graphical interface to control individual pixels.
 
 import sys
 import json
-import time
 import random
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QLabel, QSlider, QPushButton, 
                             QComboBox, QGridLayout, QSpacerItem, QSizePolicy,
                             QFrame)
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QColor, QPalette, QFont
 from tree_client import TreeClient
 
+DEMO_POLL_INTERVAL_MS = 250  # How often the buttons follow the tree during the demo
+
 class ColorPicker(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -151,7 +152,6 @@ class ColorPicker(QWidget):
             if pixel is not None:
                 try:
                     self.parent.tree_client.set_pixel(pixel, color)
-                    self.parent.pixel_colors[pixel] = color
                     self.parent.update_button_color(pixel, color)
                 except Exception as e:
                     self.parent.statusBar().showMessage(f'Error: {str(e)}')
@@ -170,9 +170,15 @@ class TreeControlWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.tree_client = TreeClient()
-        self.pixel_colors = [[0, 0, 0] for _ in range(25)]
         self.demo_running = False  # Add flag to control demo
+        self.demo_timer = QTimer(self)
+        self.demo_timer.timeout.connect(self.poll_demo)
         self.init_ui()
+    
+    @property
+    def pixel_colors(self) -> list:
+        """Pixel colors from the client's mirror of the tree, so the two never disagree."""
+        return self.tree_client.colors()
         
     def init_ui(self):
         self.setWindowTitle('RGB Tree Controller')
@@ -415,6 +421,10 @@ class TreeControlWindow(QMainWindow):
         # Connect to the tree
         try:
             self.tree_client.connect()
+            # Start from the tree's actual colors rather than assuming black
+            self.tree_client.get_state()
+            for i, color in enumerate(self.pixel_colors):
+                self.update_button_color(i, color)
             self.statusBar().showMessage('Connected to tree')
         except Exception as e:
             self.statusBar().showMessage(f'Connection error: {str(e)}')
@@ -481,7 +491,6 @@ class TreeControlWindow(QMainWindow):
         if pixel is not None:
             try:
                 self.tree_client.set_pixel(pixel, [0, 0, 0])
-                self.pixel_colors[pixel] = [0, 0, 0]
                 self.update_button_color(pixel, [0, 0, 0])
                 self.statusBar().showMessage(f'Turned off pixel {pixel}')
             except Exception as e:
@@ -491,7 +500,6 @@ class TreeControlWindow(QMainWindow):
         try:
             self.tree_client.off()
             for i in range(25):
-                self.pixel_colors[i] = [0, 0, 0]
                 self.update_button_color(i, [0, 0, 0])
             self.statusBar().showMessage('Turned off all pixels')
         except Exception as e:
@@ -499,6 +507,11 @@ class TreeControlWindow(QMainWindow):
     
     def stop_demo(self):
         """Stop the running demo sequence."""
+        self.demo_timer.stop()
+        try:
+            self.tree_client.timeline("stop")
+        except Exception as e:
+            self.statusBar().showMessage(f'Error: {str(e)}')
         self.demo_running = False
         self.demo_button.setEnabled(True)
         self.stop_demo_button.setEnabled(False)
@@ -522,100 +535,96 @@ class TreeControlWindow(QMainWindow):
         self.statusBar().showMessage('Demo stopped')
         self.turn_off_all()  # Turn off all lights when stopping
     
+    def demo_timeline(self) -> list:
+        """The demo sequence as timeline steps for the server to play."""
+        steps = []
+        # Color wipes
+        for color in ([1, 0, 0], [0, 1, 0], [0, 0, 1]):
+            for i in range(25):
+                steps.append({"hold": 0.1, "command": {"type": "set_pixel", "pixel": i, "color": color}})
+            steps[-1]["hold"] += 0.5
+        # Static rainbow pattern, shown for 2 seconds
+        rainbow = [list(self.hsv_to_rgb(i / 25.0, 1.0, 1.0)) for i in range(25)]
+        steps.append({"hold": 2, "command": {"type": "set_frame", "pixels": rainbow}})
+        # Sparkle effect: 50 sparkles
+        for _ in range(50):
+            color = [round(random.random(), 3) for _ in range(3)]
+            steps.append({"hold": 0.1, "command": {"type": "set_pixel", "pixel": random.randint(0, 24),
+                                                   "color": color}})
+        # Turn off all lights at the end
+        steps.append({"hold": 0, "command": {"type": "off"}})
+        return steps
+    
     def run_demo_sequence(self):
-        """Run the demo sequence of animations."""
+        """Upload the demo sequence; the server plays it, and the buttons follow the tree."""
         try:
-            self.demo_running = True
-            self.demo_button.setEnabled(False)
-            self.stop_demo_button.setEnabled(True)
-            self.stop_demo_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #FF3B30;
-                    color: white;
-                    border: none;
-                    padding: 10px 20px;
-                    border-radius: 6px;
-                    font-size: 14px;
-                    min-width: 150px;
-                }
-                QPushButton:hover {
-                    background-color: #FF453A;
-                }
-                QPushButton:pressed {
-                    background-color: #FF2D55;
-                }
-            """)
-            self.statusBar().showMessage('Running demo sequence...')
-            
-            # Color wipes
-            for color, name in [([1, 0, 0], 'red'), ([0, 1, 0], 'green'), ([0, 0, 1], 'blue')]:
-                if not self.demo_running:
-                    return
-                self.statusBar().showMessage(f'Running {name} color wipe...')
-                for i in range(25):
-                    if not self.demo_running:
-                        return
-                    self.tree_client.set_pixel(i, color)
-                    self.pixel_colors[i] = color
-                    self.update_button_color(i, color)
-                    QApplication.processEvents()
-                    time.sleep(0.1)
-                time.sleep(0.5)
-            
-            # Static rainbow pattern
-            if self.demo_running:
-                self.statusBar().showMessage('Setting rainbow pattern...')
-                for i in range(25):
-                    if not self.demo_running:
-                        return
-                    hue = i / 25.0  # Evenly distribute colors
-                    r, g, b = self.hsv_to_rgb(hue, 1.0, 1.0)
-                    self.tree_client.set_pixel(i, [r, g, b])
-                    self.pixel_colors[i] = [r, g, b]
-                    self.update_button_color(i, self.pixel_colors[i])
-                    QApplication.processEvents()
-                time.sleep(2)  # Show the pattern for 2 seconds
-            
-            # Sparkle effect
-            if self.demo_running:
-                self.statusBar().showMessage('Running sparkle effect...')
-                for _ in range(50):  # 50 sparkles
-                    if not self.demo_running:
-                        return
-                    pixel = random.randint(0, 24)
-                    color = [random.random(), random.random(), random.random()]
-                    self.tree_client.set_pixel(pixel, color)
-                    self.pixel_colors[pixel] = color
-                    self.update_button_color(pixel, color)
-                    QApplication.processEvents()
-                    time.sleep(0.1)
-            
-            if self.demo_running:
-                self.statusBar().showMessage('Demo sequence completed')
-                self.turn_off_all()  # Turn off all lights at the end
+            self.tree_client.play_timeline(self.demo_timeline())
         except Exception as e:
             self.statusBar().showMessage(f'Error during demo: {str(e)}')
-        finally:
-            self.demo_running = False
-            self.demo_button.setEnabled(True)
-            self.stop_demo_button.setEnabled(False)
-            self.stop_demo_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #999999;
-                    color: white;
-                    border: none;
-                    padding: 10px 20px;
-                    border-radius: 6px;
-                    font-size: 14px;
-                    min-width: 150px;
-                }
-                QPushButton:hover {
-                    background-color: #FF453A;
-                }
-                QPushButton:pressed {
-                    background-color: #FF2D55;
-                }
-            """)
+            return
+        self.demo_running = True
+        self.demo_button.setEnabled(False)
+        self.stop_demo_button.setEnabled(True)
+        self.stop_demo_button.setStyleSheet("""
+            QPushButton {
+                background-color: #FF3B30;
+                color: white;
+                border: none;
+                padding: 10px 20px;
+                border-radius: 6px;
+                font-size: 14px;
+                min-width: 150px;
+            }
+            QPushButton:hover {
+                background-color: #FF453A;
+            }
+            QPushButton:pressed {
+                background-color: #FF2D55;
+            }
+        """)
+        self.statusBar().showMessage('Running demo sequence...')
+        self.demo_timer.start(DEMO_POLL_INTERVAL_MS)
+    
+    def poll_demo(self):
+        """Mirror the tree's colors while the server plays the demo."""
+        try:
+            status = self.tree_client.timeline()
+            self.tree_client.get_state()
+            for i, color in enumerate(self.pixel_colors):
+                self.update_button_color(i, color)
+            if status["state"] == "finished":
+                self.end_demo('Demo sequence completed')
+            else:
+                self.statusBar().showMessage(
+                    f'Running demo sequence... {status["position"]:.0f}/{status["length"]:.0f} s')
+        except Exception as e:
+            # Polling again would repeat the same error every interval
+            self.end_demo(f'Error during demo: {str(e)}')
+    
+    def end_demo(self, message):
+        """Stop polling and reset the demo buttons once the demo ends or fails."""
+        self.demo_timer.stop()
+        self.demo_running = False
+        self.demo_button.setEnabled(True)
+        self.stop_demo_button.setEnabled(False)
+        self.stop_demo_button.setStyleSheet("""
+            QPushButton {
+                background-color: #999999;
+                color: white;
+                border: none;
+                padding: 10px 20px;
+                border-radius: 6px;
+                font-size: 14px;
+                min-width: 150px;
+            }
+            QPushButton:hover {
+                background-color: #FF453A;
+            }
+            QPushButton:pressed {
+                background-color: #FF2D55;
+            }
+        """)
+        self.statusBar().showMessage(message)
     
     def hsv_to_rgb(self, h, s, v):
         """Convert HSV to RGB color."""
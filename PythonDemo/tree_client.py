@@ -1,23 +1,46 @@
 #!/usr/bin/env python3
 """
 TreeClient class for communicating with the RGB Christmas Tree server.
+The client keeps a mirror of the colors it has set, so writes that would not
+change a pixel are never sent, and frame() batches pixel writes into one
+command. A connection the server closed, because it sat idle past the
+server's IDLE_TIMEOUT or the server restarted, is reopened on the next call.
 """
 
+import itertools
 import socket
 import json
-from typing import List
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class CommandError(ValueError):
+    """The server rejected a command; the message is the server's."""
 
 class TreeClient:
-    def __init__(self, host: str = "simpledigitaltwin.local", port: int = 65436):
+    def __init__(self, host: str = "simpledigitaltwin.local", port: int = 65436, pixels: int = 25):
         self.host = host
         self.port = port
         self.socket = None
+        self._reader = None  # Buffered reader over the socket, for whole replies
+        self.clock_offset = 0.0  # Server clock minus local clock, in seconds
+        self.pixels = pixels
+        # Intended 8-bit color of every pixel, None where unknown (such as while
+        # the server animates); assumes this client is the only writer
+        self.mirror: List[Optional[Tuple[int, int, int]]] = [None] * pixels
+        self.suppressed = 0  # Writes not sent because the pixel already had the color
+        self._batch: Optional[Dict[int, Sequence[float]]] = None
+        self.tracing = False  # Tag every command with a trace ID and send time, see start_tracing()
+        self._trace_ids = itertools.count(1)
 
     def connect(self) -> None:
         """Connect to the tree server."""
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.host, self.port))
+            self._reader = self.socket.makefile("rb")
             print(f"Connected to server at {self.host}:{self.port}")
         except socket.gaierror as e:
             raise ConnectionError(f"Could not resolve hostname {self.host}. Make sure the Raspberry Pi is running and the hostname is correct.") from e
@@ -27,34 +50,243 @@ class TreeClient:
     def disconnect(self) -> None:
         """Disconnect from the tree server."""
         if self.socket:
-            self.socket.close()
-            self.socket = None
+            self._close()
             print("Disconnected from server")
 
-    def send_command(self, command: dict) -> None:
-        """Send a command to the tree server."""
+    def _close(self) -> None:
+        self._reader.close()
+        self.socket.close()
+        self._reader = None
+        self.socket = None
+
+    def _request(self, payload: bytes, read: Callable[[], T]) -> T:
+        """
+        Send a request and read its reply with read(). If the connection was
+        closed by the server, reconnect once and send the request again.
+        """
         if not self.socket:
             raise ConnectionError("Not connected to server")
-        
-        self.socket.sendall(json.dumps(command).encode())
-        response = self.socket.recv(1024).decode()
+        try:
+            self.socket.sendall(payload)
+            return read()
+        except ConnectionError:
+            # Also covers a reset or broken pipe from a socket the server dropped
+            self._close()
+            print("Connection closed by server, reconnecting")
+            self.connect()
+            self._forget()
+            self.socket.sendall(payload)
+            return read()
+
+    def _read_line(self) -> str:
+        """Read one newline-terminated reply, however TCP splits it."""
+        line = self._reader.readline()
+        if not line.endswith(b"\n"):
+            raise ConnectionError("Connection closed by server")
+        return line.decode()
+
+    def _read_exact(self, size: int) -> bytes:
+        data = self._reader.read(size)
+        if len(data) < size:
+            raise ConnectionError("Connection closed by server")
+        return data
+
+    def send_command(self, command: dict) -> str:
+        """Send a command to the tree server and return its response."""
+        if self.tracing:
+            command = dict(command, trace=next(self._trace_ids), sent=time.time() + self.clock_offset)
+        response = self._request(json.dumps(command).encode(), self._read_line)
         print(f"Response: {response.strip()}")
+        return response
+
+    def _json_reply(self, command: dict) -> dict:
+        """Send a command that answers with JSON and decode the reply."""
+        response = self.send_command(command)
+        if response.startswith("ERROR:"):
+            raise CommandError(response[len("ERROR:"):].strip())
+        return json.loads(response)
+
+    def get_state(self, pixels: Optional[int] = None) -> List[List[float]]:
+        """Read the current color of every pixel from the server, and resync the mirror."""
+        pixels = pixels or self.pixels
+
+        # Binary snapshot: 3 bytes (8-bit R, G, B) per pixel
+        data = self._request(json.dumps({"type": "get_state", "format": "binary"}).encode(),
+                             lambda: self._read_exact(pixels * 3))
+        self.mirror = [(data[i], data[i + 1], data[i + 2]) for i in range(0, len(data), 3)]
+        return [[data[i] / 255, data[i + 1] / 255, data[i + 2] / 255]
+                for i in range(0, len(data), 3)]
+
+    def colors(self) -> List[List[float]]:
+        """The mirrored color of every pixel, black where unknown."""
+        return [[v / 255 for v in rgb] if rgb else [0.0, 0.0, 0.0] for rgb in self.mirror]
+
+    @staticmethod
+    def _rgb8(color: Sequence[float]) -> Optional[Tuple[int, int, int]]:
+        """The 8-bit color the server will store, or None for a color it will reject."""
+        try:
+            r, g, b = color
+            return int(255 * r), int(255 * g), int(255 * b)
+        except (TypeError, ValueError):
+            return None
 
-    def set_pixel(self, pixel: int, color: List[float]) -> None:
-        """Set a single pixel to a specific color."""
-        self.send_command({
+    def _unchanged(self, pixel: int, rgb: Optional[Tuple[int, int, int]]) -> bool:
+        return (rgb is not None and type(pixel) is int and 0 <= pixel < self.pixels
+                and self.mirror[pixel] == rgb)
+
+    def _forget(self) -> None:
+        """Mark every pixel unknown, after a command that lets the server change them."""
+        self.mirror = [None] * self.pixels
+
+    @contextmanager
+    def frame(self, at: Optional[float] = None) -> Iterator[None]:
+        """
+        Collect set_pixel, set_all and off calls and send the pixels that
+        changed as one set_pixels command on exit, optionally at a local
+        time.time(). A nested frame joins the outer one; an exception
+        discards the batch.
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = {}
+        try:
+            yield
+            batch = self._batch
+        finally:
+            self._batch = None
+        changed = {pixel: color for pixel, color in batch.items()
+                   if at is not None or not self._unchanged(pixel, self._rgb8(color))}
+        self.suppressed += len(batch) - len(changed)
+        if not changed:
+            return
+        indices = sorted(changed)
+        response = self.send_command(self._scheduled({
+            "type": "set_pixels",
+            "indices": indices,
+            "colors": [changed[pixel] for pixel in indices]
+        }, at))
+        if response.startswith("OK"):
+            for pixel in indices:
+                self.mirror[pixel] = self._rgb8(changed[pixel])
+
+    def sync_clock(self, samples: int = 5) -> float:
+        """
+        Estimate the server clock offset with the ping handshake, keeping the
+        sample with the smallest round trip. Returns the offset in seconds.
+        """
+        best = None
+        for _ in range(samples):
+            t0 = time.time()
+            reply = self._json_reply({"type": "ping", "t0": t0})
+            t3 = time.time()
+            delay = (t3 - t0) - (reply["t2"] - reply["t1"])
+            if best is None or delay < best[0]:
+                best = (delay, ((reply["t1"] - t0) + (reply["t2"] - t3)) / 2)
+        self.clock_offset = best[1]
+        return self.clock_offset
+
+    def start_tracing(self) -> None:
+        """
+        Trace every following command through the server, for trace_report.py.
+        Syncs the clock first so send times are on the server clock.
+        """
+        self.sync_clock()
+        self.tracing = True
+
+    def _scheduled(self, command: dict, at: Optional[float]) -> dict:
+        """Add a presentation time, given on the local clock, to a command."""
+        if at is not None:
+            command["at"] = at + self.clock_offset
+        return command
+
+    def set_pixel(self, pixel: int, color: List[float], at: Optional[float] = None) -> None:
+        """
+        Set a single pixel to a specific color, optionally at a local time.time().
+        Not sent if the pixel already has the color; batched inside frame().
+        """
+        rgb = self._rgb8(color)
+        if self._batch is not None and at is None:
+            self._batch[pixel] = color
+            return
+        if at is None and self._unchanged(pixel, rgb):
+            self.suppressed += 1
+            return
+        response = self.send_command(self._scheduled({
             "type": "set_pixel",
             "pixel": pixel,
             "color": color
-        })
+        }, at))
+        if response.startswith("OK"):
+            self.mirror[pixel] = rgb
 
-    def set_all(self, color: List[float]) -> None:
-        """Set all pixels to a specific color."""
-        self.send_command({
-            "type": "set_all",
-            "color": color
-        })
+    def _fill(self, command: dict, color: Sequence[float], at: Optional[float]) -> None:
+        """Send a command that sets every pixel to color, unless they all have it already."""
+        rgb = self._rgb8(color)
+        if self._batch is not None and at is None:
+            self._batch.update(dict.fromkeys(range(self.pixels), color))
+            return
+        if at is None and all(self._unchanged(pixel, rgb) for pixel in range(self.pixels)):
+            self.suppressed += 1
+            return
+        if self.send_command(self._scheduled(command, at)).startswith("OK"):
+            self.mirror = [rgb] * self.pixels
+
+    def set_all(self, color: List[float], at: Optional[float] = None) -> None:
+        """Set all pixels to a specific color, optionally at a local time.time()."""
+        self._fill({"type": "set_all", "color": color}, color, at)
+
+    def off(self, at: Optional[float] = None) -> None:
+        """Turn all pixels off, optionally at a local time.time()."""
+        self._fill({"type": "off"}, [0.0, 0.0, 0.0], at)
+
+    def fade_to(self, color: List[float], duration: float = 1.0, easing: str = "linear",
+                at: Optional[float] = None) -> None:
+        """Fade every pixel from its current color to color; the server interpolates each tick."""
+        self._forget()
+        self.send_command(self._scheduled({
+            "type": "fade_to",
+            "color": color,
+            "duration": duration,
+            "easing": easing
+        }, at))
+
+    def keyframes(self, keyframes: List[dict], loop: bool = False, at: Optional[float] = None) -> None:
+        """
+        Animate through keyframes such as {"color": [1, 0, 0], "duration": 0.5,
+        "easing": "sine"}, optionally looping until the next write.
+        """
+        self._forget()
+        self.send_command(self._scheduled({
+            "type": "keyframes",
+            "keyframes": keyframes,
+            "loop": loop
+        }, at))
+
+    def play_timeline(self, steps: List[dict], loop: bool = False, position: float = 0.0,
+                      at: Optional[float] = None) -> dict:
+        """
+        Upload a show and start it, optionally at a local time.time(). Each step
+        is {"hold": seconds, "commands": [...]}; the server plays it on its own
+        clock, so the show continues if this client disconnects. Raises
+        CommandError with the server's message if it rejects the show.
+        """
+        self._forget()
+        return self._json_reply(self._scheduled({
+            "type": "timeline",
+            "steps": steps,
+            "loop": loop,
+            "position": position
+        }, at))
 
-    def off(self) -> None:
-        """Turn all pixels off."""
-        self.send_command({"type": "off"}) 
\ No newline at end of file
+    def timeline(self, action: str = "status", position: Optional[float] = None) -> dict:
+        """
+        Pause, resume, seek (to position), stop or query the show; returns its
+        status. Raises CommandError with the server's message on an error reply.
+        """
+        if action != "status":
+            self._forget()
+        command = {"type": "timeline", "action": action}
+        if position is not None:
+            command["position"] = position
+        return self._json_reply(command)
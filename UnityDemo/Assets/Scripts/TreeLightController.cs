@@ -1,3 +1,5 @@
+using System.Globalization;
+using System.Text.RegularExpressions;
 using UnityEngine;
 
 public class TreeLightController : MonoBehaviour
@@ -9,6 +11,8 @@ public class TreeLightController : MonoBehaviour
     public int rows = 3;
     public float spacing = 1.2f;
     public float starYOffset = 1.5f;
+    public TextAsset layoutFile;   // Optional: PiServer/tree_layout.json for the physical 3D layout
+    public float layoutScale = 5f; // Layout units (tree height) to scene units
 
     private GameObject[] pixels = new GameObject[25];
     private int selectedPixel = -1;
@@ -37,6 +41,12 @@ public class TreeLightController : MonoBehaviour
 
     void GenerateTree()
     {
+        if (layoutFile != null)
+        {
+            GenerateFromLayout(LoadLayout(layoutFile.text));
+            return;
+        }
+
         // Place the star (pixel 3) at the top center
         Vector3 starPos = new Vector3((columns - 1) * spacing / 2, rows * spacing + starYOffset, 0);
         GameObject star = Instantiate(starPrefab != null ? starPrefab : pixelPrefab, starPos, Quaternion.identity, transform);
@@ -66,6 +76,36 @@ public class TreeLightController : MonoBehaviour
         }
     }
 
+    // Place every pixel at its position from the shared layout file
+    void GenerateFromLayout(Vector3[] positions)
+    {
+        for (int idx = 0; idx < positions.Length && idx < pixels.Length; idx++)
+        {
+            GameObject prefab = idx == 3 && starPrefab != null ? starPrefab : pixelPrefab;
+            GameObject pixel = Instantiate(prefab, positions[idx] * layoutScale, Quaternion.identity, transform);
+            pixel.name = idx == 3 ? "Star (Pixel 3)" : $"Pixel {idx}";
+            pixels[idx] = pixel;
+            SetPixelColor(idx, idx == 3 ? Color.white : Color.black);
+            AddPixelClickHandler(pixel, idx);
+        }
+    }
+
+    // Read the "leds" list of [x, y, z] positions, in pixel order
+    static Vector3[] LoadLayout(string json)
+    {
+        string leds = json.Substring(json.IndexOf("\"leds\""));
+        var matches = Regex.Matches(leds, @"\[\s*([-+.\deE]+)\s*,\s*([-+.\deE]+)\s*,\s*([-+.\deE]+)\s*\]");
+        var positions = new Vector3[matches.Count];
+        for (int i = 0; i < matches.Count; i++)
+        {
+            positions[i] = new Vector3(
+                float.Parse(matches[i].Groups[1].Value, CultureInfo.InvariantCulture),
+                float.Parse(matches[i].Groups[2].Value, CultureInfo.InvariantCulture),
+                float.Parse(matches[i].Groups[3].Value, CultureInfo.InvariantCulture));
+        }
+        return positions;
+    }
+
     void AddPixelClickHandler(GameObject pixel, int idx)
     {
         var collider = pixel.GetComponent<Collider>();